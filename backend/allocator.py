@@ -0,0 +1,137 @@
+from extensions import db, redis_client
+from models import ParkingLot, ParkingSpot
+from sqlalchemy import func, select, update
+import spot_map
+
+# This file hands out parking spots to new bookings.
+#
+# Each lot keeps a pool of its free spot IDs in a Redis set. Taking a spot is an
+# atomic SPOP, so two bookers can never be handed the same ID, and the claim is
+# then confirmed in the database with a conditional
+# `UPDATE ... WHERE status = 'available' RETURNING ...`. If the pool was stale
+# (e.g. after a crash) the UPDATE matches no row and the next ID is tried, so the
+# database stays the source of truth and a spot is never double booked.
+#
+# The same transactions also move `ParkingLot.occupied_spots` up or down by one,
+# so lot availability can be read without counting spot rows. Held spots (see
+# holds.py) are not available either, so they count as occupied there.
+
+UNAVAILABLE = ('occupied', 'held')
+
+
+def _pool_key(lot_id):
+    return f"lot:{lot_id}:free_spots"
+
+
+# -----------------
+# Allocation
+# -----------------
+def claim_spot(lot_id, status='occupied'):
+    """Marks one free spot of a lot as occupied (or held) in the current transaction.
+
+    Returns a row with `id`, `lot_id` and `spot_number`, or None if the lot is full.
+    The caller commits; if that commit fails, give the spot back with `return_spot`.
+    """
+    rebuilt = False
+    while True:
+        spot_id = redis_client.spop(_pool_key(lot_id))
+
+        if spot_id is None:
+            # An empty pool either means the lot is full or the pool was lost.
+            # Rebuild it once from the database before giving up.
+            if rebuilt or not reconcile_lot(lot_id):
+                return None
+            rebuilt = True
+            continue
+
+        claimed = db.session.execute(
+            update(ParkingSpot)
+            .where(ParkingSpot.id == int(spot_id), ParkingSpot.status == 'available')
+            .values(status=status)
+            .returning(ParkingSpot.id, ParkingSpot.lot_id, ParkingSpot.spot_number)
+            .execution_options(synchronize_session=False)
+        ).first()
+
+        if claimed:
+            adjust_occupied(lot_id, 1)
+            return claimed
+        # Stale entry: the spot was taken or deleted behind the pool's back.
+
+
+def vacate_spot(spot):
+    """Marks an occupied or held spot as available again in the current transaction."""
+    spot.status = 'available'
+    adjust_occupied(spot.lot_id, -1)
+
+
+def return_spot(lot_id, spot_id):
+    """Puts a spot back into its lot's free pool. Call after the release is committed."""
+    redis_client.sadd(_pool_key(lot_id), spot_id)
+
+
+def forget_lot(lot_id):
+    """Drops the free pool of a lot, e.g. when the lot is deleted."""
+    redis_client.delete(_pool_key(lot_id))
+
+
+def adjust_occupied(lot_id, delta):
+    # A relative UPDATE, so concurrent bookings in one lot never lose an increment.
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id)
+        .values(occupied_spots=ParkingLot.occupied_spots + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# -----------------
+# Availability
+# -----------------
+def lot_availability():
+    """Returns the occupied/available counters of every lot, without reading any spot rows."""
+    rows = db.session.query(ParkingLot.id, ParkingLot.number_of_spots, ParkingLot.occupied_spots)
+    return [
+        {
+            'lot_id': lot_id,
+            'occupied_spots': occupied,
+            'available_spots': number_of_spots - occupied
+        }
+        for lot_id, number_of_spots, occupied in rows
+    ]
+
+
+# -----------------
+# Reconciliation
+# -----------------
+def reconcile_lot(lot_id):
+    """Rebuilds a lot's free pool and spot map from ParkingSpot. Returns the number of free spots."""
+    spots = db.session.query(ParkingSpot.id, ParkingSpot.spot_number, ParkingSpot.status)\
+                      .filter_by(lot_id=lot_id).all()
+    free_ids = [spot_id for spot_id, _, status in spots if status == 'available']
+    spot_map.rebuild(lot_id, [(number, status) for _, number, status in spots])
+
+    # Replace the pool in one MULTI/EXEC so claimers never see it half built.
+    pipe = redis_client.pipeline()
+    pipe.delete(_pool_key(lot_id))
+    if free_ids:
+        pipe.sadd(_pool_key(lot_id), *free_ids)
+    pipe.execute()
+    return len(free_ids)
+
+
+def recount_occupied(lot_id=None):
+    """Recomputes `occupied_spots` from ParkingSpot for one lot, or for every lot."""
+    occupied = select(func.count(ParkingSpot.id))\
+        .where(ParkingSpot.lot_id == ParkingLot.id, ParkingSpot.status.in_(UNAVAILABLE))\
+        .scalar_subquery()
+    statement = update(ParkingLot).values(occupied_spots=occupied)
+    if lot_id is not None:
+        statement = statement.where(ParkingLot.id == lot_id)
+    db.session.execute(statement.execution_options(synchronize_session=False))
+
+
+def reconcile_all():
+    """Rebuilds the free pool and the occupied counter of every lot. Returns {lot_id: free_spots}."""
+    recount_occupied()
+    db.session.commit()
+    return {lot_id: reconcile_lot(lot_id) for (lot_id,) in db.session.query(ParkingLot.id)}
@@ -0,0 +1,233 @@
+from extensions import db
+from models import ParkingRecord, ParkingSpot, LotOccupancyHour, AnalyticsWatermark, RevenueRollup
+from queries import dialect_insert
+from sqlalchemy import and_, func, or_
+import datetime
+
+try:
+    import numpy as np
+except ImportError:  # The pure-Python sweep below is used instead.
+    np = None
+
+# This file turns parking sessions into hour-by-hour occupancy for each lot.
+#
+# Closed sessions are read in the order they ended, starting after a stored
+# high-water mark, and swept into per-hour totals that are ADDED to the
+# `lot_occupancy_hour` table. Every figure stored is additive (occupied
+# spot-seconds, arrivals, departures), so each run only touches new sessions
+# and the admin endpoints read a table of lots x hours, never ParkingRecord.
+# Sessions still in progress are counted once they end.
+#
+# Update by hand (from the backend folder):  python3 analytics.py
+
+WATERMARK = 'occupancy'
+CHUNK_SIZE = 100000
+STORE_BATCH = 1000
+# Sessions that ended very recently are left for the next run, so a release
+# committed slightly out of order is not skipped by the high-water mark.
+SETTLE_DELAY = datetime.timedelta(minutes=5)
+
+HOUR = 3600
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+# -----------------
+# Sweep-Line
+# -----------------
+def _sweep_numpy(starts, ends):
+    """Vectorized sweep over one lot's sessions. Returns {hour_index: [seconds, arrivals, departures]}."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    first_hour = starts.min() // HOUR
+    boundaries = np.arange(first_hour, ends.max() // HOUR + 2, dtype=np.int64) * HOUR
+
+    # Events: +1 when a session starts, -1 when it ends, and a 0 at every hour
+    # boundary so the running total can be read off there.
+    times = np.concatenate([starts, ends, boundaries])
+    deltas = np.concatenate([
+        np.ones(len(starts), dtype=np.int64),
+        -np.ones(len(ends), dtype=np.int64),
+        np.zeros(len(boundaries), dtype=np.int64)
+    ])
+    order = np.lexsort((deltas, times))
+    times, deltas = times[order], deltas[order]
+
+    # Spots in use after each event, and the spot-seconds accumulated up to it.
+    occupied = np.cumsum(deltas)
+    area = np.concatenate([[0], np.cumsum(occupied[:-1] * np.diff(times))])
+    seconds = np.diff(area[deltas == 0])
+
+    hours = np.arange(first_hour, first_hour + len(seconds))
+    arrivals = np.bincount(starts // HOUR - first_hour, minlength=len(seconds))
+    departures = np.bincount(ends // HOUR - first_hour, minlength=len(seconds))
+
+    return {
+        int(hour): [float(s), int(a), int(d)]
+        for hour, s, a, d in zip(hours, seconds, arrivals, departures)
+        if s or a or d
+    }
+
+
+def _sweep_python(starts, ends):
+    """The same result as `_sweep_numpy`, one session at a time."""
+    totals = {}
+    for start, end in zip(starts, ends):
+        totals.setdefault(start // HOUR, [0.0, 0, 0])[1] += 1
+        totals.setdefault(end // HOUR, [0.0, 0, 0])[2] += 1
+        hour = start // HOUR
+        while hour * HOUR < end:
+            overlap = min(end, (hour + 1) * HOUR) - max(start, hour * HOUR)
+            totals.setdefault(hour, [0.0, 0, 0])[0] += overlap
+            hour += 1
+    return totals
+
+
+def occupancy_histogram(starts, ends):
+    """Per-hour occupied seconds, arrivals and departures for sessions given as epoch seconds."""
+    if not starts:
+        return {}
+    if np is not None:
+        return _sweep_numpy(starts, ends)
+    return _sweep_python(starts, ends)
+
+
+# -----------------
+# Incremental Update
+# -----------------
+def _epoch_seconds(timestamp):
+    return int((timestamp - EPOCH).total_seconds())
+
+
+def _store(lot_id, histogram):
+    rows = [
+        {
+            'lot_id': lot_id,
+            'hour': EPOCH + datetime.timedelta(seconds=hour * HOUR),
+            'occupied_seconds': seconds,
+            'arrivals': arrivals,
+            'departures': departures
+        }
+        for hour, (seconds, arrivals, departures) in sorted(histogram.items())
+    ]
+    # Batched to stay under SQLite's limit on bound parameters per statement.
+    for i in range(0, len(rows), STORE_BATCH):
+        statement = dialect_insert()(LotOccupancyHour).values(rows[i:i + STORE_BATCH])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[LotOccupancyHour.lot_id, LotOccupancyHour.hour],
+            set_={
+                'occupied_seconds': LotOccupancyHour.occupied_seconds + statement.excluded.occupied_seconds,
+                'arrivals': LotOccupancyHour.arrivals + statement.excluded.arrivals,
+                'departures': LotOccupancyHour.departures + statement.excluded.departures
+            }
+        ))
+
+
+def update_occupancy(now=None):
+    """Adds every session closed since the high-water mark. Returns the number of sessions."""
+    cutoff = (now or datetime.datetime.utcnow()) - SETTLE_DELAY
+    processed = 0
+
+    while True:
+        watermark = db.session.get(AnalyticsWatermark, WATERMARK)
+        query = db.session.query(
+            ParkingSpot.lot_id,
+            ParkingRecord.parking_timestamp,
+            ParkingRecord.leaving_timestamp,
+            ParkingRecord.id
+        ).join(ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id)\
+         .filter(ParkingRecord.leaving_timestamp.isnot(None), ParkingRecord.leaving_timestamp <= cutoff)
+        if watermark:
+            query = query.filter(or_(
+                ParkingRecord.leaving_timestamp > watermark.leaving_timestamp,
+                and_(ParkingRecord.leaving_timestamp == watermark.leaving_timestamp,
+                     ParkingRecord.id > watermark.record_id)
+            ))
+        rows = query.order_by(ParkingRecord.leaving_timestamp, ParkingRecord.id).limit(CHUNK_SIZE).all()
+        if not rows:
+            return processed
+
+        sessions_by_lot = {}
+        for lot_id, parked_at, left_at, _ in rows:
+            starts, ends = sessions_by_lot.setdefault(lot_id, ([], []))
+            starts.append(_epoch_seconds(parked_at))
+            ends.append(_epoch_seconds(left_at))
+        for lot_id, (starts, ends) in sessions_by_lot.items():
+            _store(lot_id, occupancy_histogram(starts, ends))
+
+        # The totals and the new high-water mark are committed together, so a
+        # crashed run never counts a session twice.
+        last = rows[-1]
+        if watermark:
+            watermark.leaving_timestamp, watermark.record_id = last.leaving_timestamp, last.id
+        else:
+            db.session.add(AnalyticsWatermark(name=WATERMARK, leaving_timestamp=last.leaving_timestamp, record_id=last.id))
+        db.session.commit()
+        processed += len(rows)
+
+
+# -----------------
+# Queries
+# -----------------
+def occupancy_curve(lot, start, end):
+    """Hour-by-hour occupancy of a lot over [start, end)."""
+    rows = LotOccupancyHour.query.filter(
+        LotOccupancyHour.lot_id == lot.id,
+        LotOccupancyHour.hour >= start,
+        LotOccupancyHour.hour < end
+    ).order_by(LotOccupancyHour.hour)
+
+    return [
+        {
+            'hour': row.hour.isoformat(),
+            'average_occupied': round(row.occupied_seconds / HOUR, 2),
+            'occupancy_rate': round(row.occupied_seconds / HOUR / lot.number_of_spots, 4) if lot.number_of_spots else None,
+            'arrivals': row.arrivals,
+            'departures': row.departures
+        }
+        for row in rows
+    ]
+
+
+def usage_summary(lot, start, end, top=3):
+    """Peak hours of the day, average dwell time and turnover of a lot over [start, end)."""
+    rows = db.session.query(LotOccupancyHour.hour, LotOccupancyHour.occupied_seconds).filter(
+        LotOccupancyHour.lot_id == lot.id,
+        LotOccupancyHour.hour >= start,
+        LotOccupancyHour.hour < end
+    )
+
+    # Average spots in use for each hour of the day (0-23), over every day in range.
+    days = max((end - start).total_seconds() / 86400, 1)
+    by_hour_of_day = [0.0] * 24
+    for hour, seconds in rows:
+        by_hour_of_day[hour.hour] += seconds / HOUR
+    profile = [round(total / days, 2) for total in by_hour_of_day]
+    peaks = sorted(range(24), key=lambda h: profile[h], reverse=True)[:top]
+
+    # Dwell time and turnover come from the daily revenue rollup.
+    sessions, minutes = db.session.query(
+        func.coalesce(func.sum(RevenueRollup.sessions), 0),
+        func.coalesce(func.sum(RevenueRollup.total_minutes), 0)
+    ).filter(
+        RevenueRollup.lot_id == lot.id,
+        RevenueRollup.day >= start.date(),
+        RevenueRollup.day < end.date()
+    ).one()
+
+    return {
+        'lot_id': lot.id,
+        'hourly_profile': profile,
+        'peak_hours': [{'hour_of_day': h, 'average_occupied': profile[h]} for h in peaks],
+        'sessions': sessions,
+        'average_dwell_minutes': round(minutes / sessions, 1) if sessions else None,
+        'turnover_per_spot_per_day': round(sessions / lot.number_of_spots / days, 3) if lot.number_of_spots else None
+    }
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"Added {update_occupancy()} closed sessions to the occupancy tables.")
@@ -1,20 +1,21 @@
 from flask import Flask
 from flask_cors import CORS
 from extensions import db, jwt, mail, celery
+from database import database_settings, engine_options, replica_binds, tune_sqlite
+import instrumentation
 
 # -----------------
 # Application Factory
 # -----------------
 # This function creates and configures the main Flask application.
 # Using a factory helps avoid circular import errors and keeps the setup organized.
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     CORS(app) # Enables Cross-Origin Resource Sharing for the frontend
 
     # --- CONFIGURATIONS ---
     # Loads all application settings from a single mapping.
     app.config.from_mapping(
-        SQLALCHEMY_DATABASE_URI='sqlite:///database.db',
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         JWT_SECRET_KEY='super-secret',
         
@@ -29,13 +30,32 @@ def create_app():
         result_backend='redis://localhost:6379/0'
     )
 
+    # Database backend, pool sizes and timeouts (see database.py).
+    app.config.from_mapping(database_settings())
+
+    # Settings passed in (e.g. by benchmarks) override the defaults above.
+    if test_config:
+        app.config.update(test_config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    app.config.setdefault('SQLALCHEMY_BINDS', replica_binds(app.config))
+
     # --- INITIALIZE EXTENSIONS ---
     # Connects the extension objects (like db, jwt) to the Flask app.
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            tune_sqlite(engine, app.config)
     jwt.init_app(app)
+    # Every token is checked against the revocation list in Redis.
+    from user_cache import is_token_revoked
+    jwt.token_in_blocklist_loader(is_token_revoked)
     mail.init_app(app)
     celery.conf.update(app.config)
 
+    # --- INSTRUMENTATION ---
+    # Request, SQL, Redis and Celery task metrics, served at /metrics (see instrumentation.py).
+    instrumentation.init_app(app, celery)
+
     # --- CELERY CONTEXT ---
     # This ensures that Celery tasks run with access to the Flask app's
     # context, allowing them to use the database and other extensions.
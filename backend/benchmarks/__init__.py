@@ -0,0 +1,7 @@
+# Benchmarks for the backend. Run them from the backend folder, e.g.:
+#   python3 -m benchmarks.admin_auth
+#
+# `python3 -m benchmarks` runs the main suite (handlers, booking_load,
+# tariff_reprice) and emits one JSON document to compare across commits; see
+# __main__.py. `benchmarks.generator` fills a database with synthetic data.
+# Install fakeredis and lupa to run everything without a Redis server.
@@ -0,0 +1,126 @@
+from benchmarks import handlers, booking_load
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+# Runs the benchmark suite and writes one JSON document, so results can be
+# kept per commit and compared:
+#
+#   python3 -m benchmarks                              # print the results
+#   python3 -m benchmarks --output results/HEAD.json   # save them
+#   python3 -m benchmarks --compare results/base.json  # run, then compare with a saved run
+#   python3 -m benchmarks --diff old.json new.json     # compare two saved runs
+#   python3 -m benchmarks --quick                      # a smaller dataset and fewer requests
+#
+# A comparison lists every p50/p95 latency that grew, and every throughput that
+# fell, by more than THRESHOLD (p99 and max are too noisy over a few hundred
+# requests). The exit status is 1 if there is any, so the suite can gate a CI
+# job. Use the same machine for both runs.
+
+THRESHOLD = 0.20
+COMPARED_LATENCIES = ('p50_ms', 'p95_ms')
+SIZES = {
+    'full': {'handlers': (200, 100000), 'booking_load': (8, 50, 50000), 'tariff_reprice': (1000000, 100000)},
+    'quick': {'handlers': (30, 10000), 'booking_load': (4, 10, 5000), 'tariff_reprice': (100000, 10000)},
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(size='full'):
+    sizes = SIZES[size]
+    results = {
+        'handlers': handlers.run(*sizes['handlers']),
+        'booking_load': booking_load.run(*sizes['booking_load']),
+    }
+    try:
+        from benchmarks import tariff_reprice
+    except ImportError:  # Needs NumPy.
+        results['tariff_reprice'] = None
+    else:
+        results['tariff_reprice'] = tariff_reprice.run(*sizes['tariff_reprice'])
+
+    return {
+        'commit': _commit(),
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'size': size,
+        'results': results
+    }
+
+
+# -----------------
+# Comparison
+# -----------------
+def _metrics(node, path=''):
+    """Flattens a result into {path: value} for the numbers that can regress."""
+    if isinstance(node, list):
+        # Lists hold one entry per backend; key them by name rather than position.
+        node = {item.get('backend', str(i)): item for i, item in enumerate(node)}
+    if isinstance(node, dict):
+        metrics = {}
+        for key, value in node.items():
+            metrics.update(_metrics(value, f'{path}.{key}' if path else key))
+        return metrics
+    name = path.rsplit('.', 1)[-1]
+    if isinstance(node, (int, float)) and (name in COMPARED_LATENCIES or 'per_second' in name):
+        return {path: node}
+    return {}
+
+
+def compare(old, new, threshold=THRESHOLD):
+    """Returns the metrics that got worse by more than `threshold`, as readable lines."""
+    old_metrics, new_metrics = _metrics(old['results']), _metrics(new['results'])
+    regressions = []
+    for path, before in sorted(old_metrics.items()):
+        after = new_metrics.get(path)
+        if after is None or not before:
+            continue
+        change = (after - before) / before
+        # Latencies should not grow; throughputs should not fall.
+        worse = change > threshold if path.endswith('_ms') else change < -threshold
+        if worse:
+            regressions.append(f"{path}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def _report(old, new):
+    regressions = compare(old, new)
+    print(f"Compared {old.get('commit')} with {new.get('commit')}: {len(regressions)} regression(s) over {THRESHOLD:.0%}.", file=sys.stderr)
+    for line in regressions:
+        print(f"  {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main(args):
+    if args[:1] == ['--diff']:
+        with open(args[1]) as old_file, open(args[2]) as new_file:
+            return _report(json.load(old_file), json.load(new_file))
+
+    output = args[args.index('--output') + 1] if '--output' in args else None
+    baseline = args[args.index('--compare') + 1] if '--compare' in args else None
+    result = run('quick' if '--quick' in args else 'full')
+
+    text = json.dumps(result, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if baseline:
+        with open(baseline) as f:
+            return _report(json.load(f), result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,89 @@
+from functools import wraps
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.security import generate_password_hash
+from app import create_app
+from extensions import db
+from decorators import admin_required
+from models import User
+from benchmarks.common import use_fake_redis
+import json
+import time
+
+# Compares admin-endpoint throughput with the old authorization check
+# (one User lookup per request) against the role claim in the token.
+#
+# Usage (from the backend folder):  python3 -m benchmarks.admin_auth [requests]
+# Uses an in-memory SQLite database, and fakeredis when it is installed.
+
+
+def legacy_admin_required():
+    """The original decorator: loads the user from the database on every request."""
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            user = db.session.get(User, get_jwt_identity())
+            if user and user.role == 'admin':
+                return fn(*args, **kwargs)
+            return jsonify(message="Admins only! Access forbidden."), 403
+        return decorator
+    return wrapper
+
+
+bench_bp = Blueprint('bench_bp', __name__)
+
+@bench_bp.route('/legacy', methods=['GET'])
+@jwt_required()
+@legacy_admin_required()
+def legacy_endpoint():
+    return jsonify(ok=True)
+
+@bench_bp.route('/claims', methods=['GET'])
+@jwt_required()
+@admin_required()
+def claims_endpoint():
+    return jsonify(ok=True)
+
+
+def _throughput(client, url, headers, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_json()
+    elapsed = time.perf_counter() - start
+    return {'requests': requests, 'seconds': round(elapsed, 4), 'requests_per_second': round(requests / elapsed, 1)}
+
+
+def run(requests=2000):
+    fake_redis = use_fake_redis()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    app.register_blueprint(bench_bp, url_prefix='/bench')
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='admin', password=generate_password_hash('admin-password123'), role='admin'))
+        db.session.commit()
+
+        client = app.test_client()
+        token = client.post('/auth/login', json={'username': 'admin', 'password': 'admin-password123'}).get_json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        # Warm up both paths before timing.
+        _throughput(client, '/bench/legacy', headers, 50)
+        _throughput(client, '/bench/claims', headers, 50)
+
+        before = _throughput(client, '/bench/legacy', headers, requests)
+        after = _throughput(client, '/bench/claims', headers, requests)
+
+    return {
+        'benchmark': 'admin_auth',
+        'fake_redis': fake_redis,
+        'before_db_lookup': before,
+        'after_role_claim': after,
+        'speedup': round(after['requests_per_second'] / before['requests_per_second'], 2)
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000), indent=2))
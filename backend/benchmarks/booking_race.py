@@ -0,0 +1,97 @@
+from werkzeug.security import generate_password_hash
+from app import create_app
+from extensions import db
+from models import User, ParkingRecord
+from provisioning import create_lot
+from benchmarks.common import use_fake_redis
+from collections import Counter
+import json
+import os
+import sys
+import tempfile
+import threading
+import uuid
+
+# Fires N identical bookings for one user at the same time and checks that
+# exactly one reservation is created:
+#   1. all requests carry the same Idempotency-Key (a client retrying), and
+#   2. no key at all, so only the unique index on active sessions stops them.
+#
+# Usage (from the backend folder):  python3 -m benchmarks.booking_race [requests]
+# Uses a temporary SQLite file, and fakeredis when it is installed. Exits
+# non-zero if either round creates more or fewer than one reservation.
+# The same check runs under pytest in tests/test_booking_race.py.
+
+
+def _fire(app, headers, lot_id, requests):
+    """Sends `requests` bookings at once. Returns the responses' (status, replayed) pairs."""
+    barrier = threading.Barrier(requests)
+    results = []
+
+    def book():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=headers)
+        results.append((response.status_code, response.headers.get('Idempotent-Replayed') == 'true'))
+
+    threads = [threading.Thread(target=book) for _ in range(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _round(app, name, headers, lot_id, requests):
+    results = _fire(app, headers, lot_id, requests)
+    with app.app_context():
+        active = ParkingRecord.query.filter_by(leaving_timestamp=None).count()
+    created = sum(1 for status, replayed in results if status == 201 and not replayed)
+
+    # Release the reservation so the next round starts clean.
+    app.test_client().put('/api/user/reservations/active', headers=headers)
+    return {
+        'round': name,
+        'requests': requests,
+        'statuses': {f"{status}{' (replayed)' if replayed else ''}": count for (status, replayed), count in Counter(results).items()},
+        'reservations_created': created,
+        'active_reservations': active,
+        'ok': created == 1 and active == 1
+    }
+
+
+def run(requests=100):
+    fake_redis = use_fake_redis()
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'race.db')}"})
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(username='racer', password=generate_password_hash('racer-password', method='pbkdf2:sha256:1000'), role='user'))
+            lot = create_lot({
+                'prime_location_name': 'Race Lot',
+                'price': 50.0,
+                'address': 'Benchmark Road',
+                'pin_code': '000000',
+                'number_of_spots': requests
+            })
+            db.session.commit()
+            lot_id = lot.id
+
+        client = app.test_client()
+        token = client.post('/auth/login', json={'username': 'racer', 'password': 'racer-password'}).get_json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        rounds = [
+            _round(app, 'same_idempotency_key', {**headers, 'Idempotency-Key': uuid.uuid4().hex}, lot_id, requests),
+            _round(app, 'no_idempotency_key', headers, lot_id, requests),
+        ]
+        with app.app_context():
+            db.engine.dispose()
+
+    return {'benchmark': 'booking_race', 'fake_redis': fake_redis, 'rounds': rounds, 'ok': all(r['ok'] for r in rounds)}
+
+
+if __name__ == '__main__':
+    result = run(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result['ok'] else 1)
@@ -0,0 +1,32 @@
+from extensions import redis_client
+import statistics
+
+# Helpers shared by the benchmarks.
+
+
+def use_fake_redis():
+    """Points the shared redis_client at an in-memory fakeredis server, if available."""
+    try:
+        import fakeredis
+    except ImportError:
+        return False
+    redis_client.connection_pool = fakeredis.FakeRedis(decode_responses=True).connection_pool
+    return True
+
+
+def latency_summary(latencies):
+    """p50/p95/p99/max of a list of latencies in seconds, reported in milliseconds."""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 2)
+
+    return {
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': round(ordered[-1] * 1000, 2),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2)
+    }
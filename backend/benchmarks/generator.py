@@ -0,0 +1,142 @@
+from werkzeug.security import generate_password_hash
+from sqlalchemy import insert, select
+from extensions import db
+from models import ParkingLot, ParkingRecord, ParkingSpot, User
+from passwords import HASH_METHOD
+import datetime
+import random
+import time
+
+# Fills a database with synthetic, reproducible data for the benchmarks:
+# N lots holding M spots in total, U users and R closed parking sessions.
+#
+# Everything is written with bulk (executemany) INSERTs in chunks, so a million
+# sessions take seconds, not the hours ORM objects would. The same seed always
+# produces the same rows. Afterwards the derived data is rebuilt as the app
+# would: the revenue rollup, the user search n-grams, the occupancy analytics
+# and (in Redis) the free-spot pools, spot maps and lot search indexes.
+#
+# Usage (from the backend folder, against DATABASE_URL):
+#   python3 -m benchmarks.generator [lots] [spots] [users] [records] [seed]
+# The tables must be empty; create them with `python3 create_db.py` first.
+
+PASSWORD = 'bench-password'     # Every generated user's password.
+CHUNK = 10000                   # Rows per INSERT round trip.
+HISTORY_DAYS = 90               # Sessions end within this many days before now.
+
+# Lots are spread within roughly 20 km of this point.
+CENTER = (12.9716, 77.5946)
+AREAS = ['Koramangala', 'Indiranagar', 'Jayanagar', 'Whitefield', 'Malleshwaram', 'Hebbal', 'Marathahalli', 'Banashankari']
+STREETS = ['MG Road', 'Church Street', 'Residency Road', 'Outer Ring Road', 'Old Airport Road', 'Bannerghatta Road']
+
+
+def _insert(model, rows):
+    rows = list(rows)
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model), rows[i:i + CHUNK])
+    return len(rows)
+
+
+def _lots(rng, lots, spots):
+    per_lot, extra = divmod(spots, lots)
+    for i in range(lots):
+        area = rng.choice(AREAS)
+        yield {
+            'prime_location_name': f"{area} {rng.choice(['Plaza', 'Square', 'Mall', 'Tower', 'Market'])} {i + 1}",
+            'price': float(rng.randrange(20, 121, 5)),
+            'address': f"{rng.randint(1, 300)} {rng.choice(STREETS)}, {area}",
+            'pin_code': str(560001 + rng.randrange(100)),
+            'latitude': round(CENTER[0] + rng.uniform(-0.18, 0.18), 6),
+            'longitude': round(CENTER[1] + rng.uniform(-0.18, 0.18), 6),
+            'number_of_spots': per_lot + (1 if i < extra else 0)
+        }
+
+
+def _records(rng, records, users, spots, prices):
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    for _ in range(records):
+        left = now - datetime.timedelta(seconds=rng.randrange(600, HISTORY_DAYS * 86400))
+        # Mostly an hour or two, now and then the whole day.
+        minutes = rng.expovariate(1 / 90) if rng.random() < 0.95 else rng.uniform(480, 1440)
+        parked = left - datetime.timedelta(seconds=int(minutes * 60) + 60)
+        spot_id, lot_id = rng.choice(spots)
+        yield {
+            'spot_id': spot_id,
+            'user_id': rng.choice(users),
+            'parking_timestamp': parked,
+            'leaving_timestamp': left,
+            'parking_cost': round((left - parked).total_seconds() / 3600 * prices[lot_id], 2)
+        }
+
+
+def populate(lots=50, spots=5000, users=1000, records=100000, seed=42, admin=True):
+    """Fills the (empty) database. Needs an app context. Returns row counts and timings."""
+    rng = random.Random(seed)
+    timings = {}
+
+    start = time.perf_counter()
+    _insert(ParkingLot, _lots(rng, lots, spots))
+    lot_rows = db.session.execute(select(ParkingLot.id, ParkingLot.number_of_spots, ParkingLot.price).order_by(ParkingLot.id)).all()
+    _insert(ParkingSpot, (
+        {'lot_id': lot_id, 'spot_number': n}
+        for lot_id, number_of_spots, _ in lot_rows
+        for n in range(1, number_of_spots + 1)
+    ))
+    timings['lots_and_spots'] = time.perf_counter() - start
+
+    # One real hash, shared by every user: logins cost what they cost in production.
+    start = time.perf_counter()
+    password = generate_password_hash(PASSWORD, HASH_METHOD)
+    user_rows = [{'username': f'user{i:07d}', 'password': password, 'role': 'user'} for i in range(users)]
+    if admin:
+        user_rows.append({'username': 'benchadmin', 'password': password, 'role': 'admin'})
+    _insert(User, user_rows)
+    timings['users'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    user_ids = db.session.scalars(select(User.id).where(User.role == 'user')).all()
+    spot_ids = db.session.execute(select(ParkingSpot.id, ParkingSpot.lot_id)).all()
+    prices = {lot_id: price for lot_id, _, price in lot_rows}
+    if records and user_ids and spot_ids:
+        _insert(ParkingRecord, _records(rng, records, user_ids, spot_ids, prices))
+    db.session.commit()
+    timings['records'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rebuild_derived()
+    timings['derived'] = time.perf_counter() - start
+
+    return {
+        'seed': seed,
+        'lots': lots,
+        'spots': spots,
+        'users': users,
+        'records': records,
+        'seconds': {name: round(seconds, 3) for name, seconds in timings.items()}
+    }
+
+
+def rebuild_derived():
+    """Rebuilds everything derived from the base tables, in the database and in Redis."""
+    from rollups import rebuild
+    from user_search import backfill
+    from analytics import update_occupancy
+    from allocator import reconcile_all
+    from lot_search import rebuild_index
+
+    with db.engine.begin() as conn:
+        rebuild(conn)
+        backfill(conn)
+    update_occupancy()
+    reconcile_all()
+    rebuild_index()
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+    from app import create_app
+    counts = [int(arg) for arg in sys.argv[1:6]]
+    app = create_app()
+    with app.app_context():
+        print(json.dumps(populate(*counts), indent=2))
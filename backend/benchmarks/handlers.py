@@ -0,0 +1,142 @@
+from flask_jwt_extended import create_access_token
+from app import create_app
+from extensions import db
+from models import ParkingLot, User
+from benchmarks.common import use_fake_redis, latency_summary
+from benchmarks.generator import PASSWORD, populate
+import json
+import os
+import tempfile
+import time
+
+# Times the handlers of every blueprint (auth, lot_routes, user_routes,
+# admin_routes) one request at a time, against a generated dataset.
+#
+# Each case is repeated and reported as latency percentiles and requests per
+# second. Cases that hash a password (login, register) run fewer times, and
+# each request comes from its own address so the login throttle stays out of
+# the way. Booking and holding are measured as full cycles (book + release,
+# hold + cancel) so every iteration starts from the same state.
+#
+# Usage (from the backend folder):  python3 -m benchmarks.handlers [iterations] [records]
+# Uses a temporary SQLite file, and fakeredis when it is installed (with lupa
+# for the Lua scripts: pip install fakeredis lupa).
+
+HASHING_ITERATIONS = 30     # Upper bound for cases that hash a password.
+DATASET = {'lots': 50, 'spots': 5000, 'users': 2000, 'seed': 42}
+
+
+def _address(i):
+    return {'REMOTE_ADDR': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'}
+
+
+def _cases(ctx):
+    """{blueprint: {case: (function(client, i) -> list of responses, hashes_password)}}."""
+    admin, user, lot_id = ctx['admin'], ctx['user'], ctx['lot_id']
+    stamp = int(time.time())
+
+    def get(url, headers, **params):
+        return lambda client, i: [client.get(url, headers=headers, query_string=params)]
+
+    return {
+        'auth': {
+            'login': (lambda client, i: [client.post(
+                '/auth/login', json={'username': ctx['username'], 'password': PASSWORD}, environ_base=_address(i)
+            )], True),
+            'register': (lambda client, i: [client.post(
+                '/auth/register', json={'username': f'bench{stamp}_{i}', 'password': PASSWORD}, environ_base=_address(i)
+            )], True),
+            'profile': (get('/auth/profile', user), False),
+        },
+        'lot_routes': {
+            'list_lots': (get('/api/lots', admin), False),
+            'lot_details': (get(f'/api/lots/{lot_id}', admin), False),
+            'lot_details_compact': (get(f'/api/lots/{lot_id}', admin, format='compact'), False),
+            'update_lot': (lambda client, i: [client.put(
+                f'/api/lots/{lot_id}', json={'prime_location_name': f'Bench Lot {i}'}, headers=admin
+            )], False),
+            'get_tariff': (get(f'/api/lots/{lot_id}/tariff', admin), False),
+        },
+        'user_routes': {
+            'list_lots': (get('/api/user/lots', user), False),
+            'availability': (get('/api/user/lots/availability', user), False),
+            'search_nearby': (get('/api/user/lots/search', user, lat=12.9716, lng=77.5946, radius_km=10), False),
+            'search_text': (get('/api/user/lots/search', user, q='koram'), False),
+            'history': (get('/api/user/reservations', user), False),
+            'book_and_release': (lambda client, i: [
+                client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user),
+                client.put('/api/user/reservations/active', headers=user)
+            ], False),
+            'hold_and_cancel': (lambda client, i: [
+                client.post('/api/user/holds', json={'lot_id': lot_id}, headers=user),
+                client.delete('/api/user/holds/active', headers=user)
+            ], False),
+        },
+        'admin_routes': {
+            'users_page': (get('/api/admin/users', admin), False),
+            'users_search': (get('/api/admin/users', admin, username='user00012'), False),
+            'reservations': (get('/api/admin/reservations', admin), False),
+            'reservations_by_lot': (get('/api/admin/reservations', admin, lot_id=lot_id), False),
+            'revenue': (get('/api/admin/revenue', admin), False),
+            'occupancy': (get(f'/api/admin/analytics/lots/{lot_id}/occupancy', admin), False),
+            'usage': (get(f'/api/admin/analytics/lots/{lot_id}/usage', admin), False),
+            'reprice': (lambda client, i: [client.post(f'/api/admin/lots/{lot_id}/reprice', json={}, headers=admin)], False),
+        },
+    }
+
+
+def _measure(client, request, iterations):
+    latencies, errors = [], 0
+    for i in range(1, iterations + 1):
+        start = time.perf_counter()
+        responses = request(client, i)
+        elapsed = time.perf_counter() - start
+        if all(response.status_code < 400 for response in responses):
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    total = sum(latencies)
+    return {
+        'requests': iterations,
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / total, 1) if total else None,
+        **latency_summary(latencies)
+    }
+
+
+def run(iterations=200, records=100000):
+    fake_redis = use_fake_redis()
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        with app.app_context():
+            db.create_all()
+            dataset = populate(records=records, **DATASET)
+            admin = User.query.filter_by(role='admin').first()
+            user = User.query.filter_by(role='user').order_by(User.id).first()
+            ctx = {
+                'admin': {'Authorization': f"Bearer {create_access_token(identity=str(admin.id), additional_claims={'role': 'admin'})}"},
+                'user': {'Authorization': f"Bearer {create_access_token(identity=str(user.id), additional_claims={'role': 'user'})}"},
+                'username': user.username,
+                'lot_id': db.session.query(ParkingLot.id).order_by(ParkingLot.id).first()[0]
+            }
+
+        client = app.test_client()
+        results = {}
+        for blueprint, cases in _cases(ctx).items():
+            results[blueprint] = {}
+            for name, (request, hashes_password) in cases.items():
+                request(client, 0)  # Warm-up: fills caches, compiles queries.
+                count = min(iterations, HASHING_ITERATIONS) if hashes_password else iterations
+                results[blueprint][name] = _measure(client, request, count)
+
+        with app.app_context():
+            db.engine.dispose()
+
+    return {'benchmark': 'handlers', 'fake_redis': fake_redis, 'dataset': dataset, 'results': results}
+
+
+if __name__ == '__main__':
+    import sys
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    records = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    print(json.dumps(run(iterations, records), indent=2))
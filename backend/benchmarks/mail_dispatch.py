@@ -0,0 +1,85 @@
+from flask_mail import Message
+from app import create_app
+from extensions import mail
+from mailer import deliver, run_metrics, start_run
+from benchmarks.common import use_fake_redis
+import json
+import socket
+import time
+
+# Compares sending N emails one connection per message (the old `mail.send`
+# loop) against `mailer.deliver`, which reuses one SMTP connection per batch.
+#
+# Usage (from the backend folder):  python3 -m benchmarks.mail_dispatch [messages]
+# Needs aiosmtpd (pip install aiosmtpd), which runs a local SMTP sink in place
+# of Mailhog. Uses fakeredis when it is installed.
+
+
+class _CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _messages(count):
+    return [
+        {
+            'key': i,
+            'recipients': [f'bench{i}@example.com'],
+            'subject': 'Parking App Daily Reminder',
+            'body': f"Hi bench{i}, don't forget to book a parking spot today!"
+        }
+        for i in range(count)
+    ]
+
+
+def run(messages=500):
+    from aiosmtpd.controller import Controller
+
+    fake_redis = use_fake_redis()
+    handler = _CountingHandler()
+    port = _free_port()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        app = create_app({'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': port, 'MAIL_RATE_LIMIT': 0})
+        with app.app_context():
+            batch = _messages(messages)
+
+            start = time.perf_counter()
+            for message in batch:
+                mail.send(Message(subject=message['subject'], recipients=message['recipients'], body=message['body']))
+            per_message = time.perf_counter() - start
+
+            run_id = start_run('benchmark', len(batch), 1)
+            start = time.perf_counter()
+            failed = deliver(run_id, batch)
+            pooled = time.perf_counter() - start
+            metrics = run_metrics(run_id)
+    finally:
+        controller.stop()
+
+    return {
+        'benchmark': 'mail_dispatch',
+        'fake_redis': fake_redis,
+        'messages': messages,
+        'received_by_sink': handler.received,
+        'connection_per_message': {'seconds': round(per_message, 3), 'messages_per_second': round(messages / per_message, 1)},
+        'pooled_connection': {'seconds': round(pooled, 3), 'messages_per_second': round(messages / pooled, 1), 'failed': len(failed)},
+        'speedup': round(per_message / pooled, 2),
+        'run_metrics': metrics
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 500), indent=2))
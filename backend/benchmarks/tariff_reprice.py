@@ -0,0 +1,121 @@
+from sqlalchemy import insert
+from app import create_app
+from extensions import db
+from models import ParkingLot, ParkingRecord, ParkingSpot, User
+from tariffs import Tariff, parse_schedule, reprice, to_seconds
+from benchmarks.common import use_fake_redis
+import datetime
+import json
+import numpy as np
+import time
+
+# Reprices a million synthetic sessions under a tariff with peak rates, a grace
+# period, a minimum charge and a daily cap:
+#   * `price_many` over the whole batch (the vectorized path),
+#   * `price` one session at a time over a sample (the release path), checked
+#     against the batch results,
+#   * `tariffs.reprice` end to end, reading closed sessions from SQLite.
+#
+# Usage (from the backend folder):  python3 -m benchmarks.tariff_reprice [sessions] [db_sessions]
+# Needs NumPy. Uses an in-memory SQLite database, and fakeredis when it is installed.
+
+SCHEDULE = {
+    'rates': [
+        {'from': '07:00', 'to': '10:00', 'price': 60, 'days': [0, 1, 2, 3, 4]},
+        {'from': '16:30', 'to': '19:30', 'price': 55, 'days': [0, 1, 2, 3, 4]},
+        {'from': '22:00', 'to': '06:00', 'price': 10}
+    ],
+    'grace_minutes': 10,
+    'minimum_charge': 20,
+    'daily_cap': 300
+}
+SAMPLE = 100000     # Sessions priced one at a time.
+
+
+def _sessions(count, seed=7):
+    """Start/end seconds (see tariffs.to_seconds) of `count` sessions over one year."""
+    rng = np.random.default_rng(seed)
+    first = to_seconds([datetime.datetime(2025, 1, 1)])[0]
+    parked = first + rng.uniform(0, 365 * 86400, count)
+    # Mostly a few hours; one in twenty runs for days.
+    minutes = np.where(rng.random(count) < 0.95, rng.exponential(150, count), rng.uniform(1440, 10 * 1440, count))
+    return parked, parked + np.round(minutes * 60)
+
+
+def _datetime(seconds):
+    return datetime.datetime(1970, 1, 5) + datetime.timedelta(seconds=float(seconds))
+
+
+def _engine(tariff, sessions):
+    parked, left = _sessions(sessions)
+    start = time.perf_counter()
+    batch = tariff.price_many(parked, left)
+    batch_seconds = time.perf_counter() - start
+
+    sample = min(SAMPLE, sessions)
+    starts = [_datetime(s) for s in parked[:sample]]
+    ends = [_datetime(s) for s in left[:sample]]
+    start = time.perf_counter()
+    single = [tariff.price(a, b) for a, b in zip(starts, ends)]
+    single_seconds = time.perf_counter() - start
+
+    mismatches = int(np.count_nonzero(np.abs(np.array(single) - batch[:sample]) > 0.011))
+    return {
+        'sessions': sessions,
+        'segments_per_week': len(tariff.starts),
+        'batch_seconds': round(batch_seconds, 3),
+        'batch_sessions_per_second': round(sessions / batch_seconds),
+        'single_sample': sample,
+        'single_seconds': round(single_seconds, 3),
+        'single_sessions_per_second': round(sample / single_seconds),
+        'mismatches': mismatches,
+        'total_revenue': round(float(batch.sum()), 2)
+    }
+
+
+def _database(schedule, sessions):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    with app.app_context():
+        db.create_all()
+        lot = ParkingLot(prime_location_name='Bench', price=40, address='1 Bench Road', pin_code='000000', number_of_spots=1)
+        db.session.add(lot)
+        db.session.add(User(username='bench', password='-', role='user'))
+        db.session.flush()
+        spot = ParkingSpot(lot_id=lot.id, spot_number=1)
+        db.session.add(spot)
+        db.session.flush()
+
+        parked, left = _sessions(sessions, seed=11)
+        rows = [
+            {'spot_id': spot.id, 'user_id': 1, 'parking_timestamp': _datetime(a), 'leaving_timestamp': _datetime(b), 'parking_cost': 0.0}
+            for a, b in zip(parked, left)
+        ]
+        db.session.execute(insert(ParkingRecord), rows)
+        db.session.commit()
+
+        start = time.perf_counter()
+        summary = reprice(lot, schedule=schedule)
+        elapsed = time.perf_counter() - start
+        return {
+            'sessions': summary['sessions'],
+            'seconds': round(elapsed, 3),
+            'sessions_per_second': round(summary['sessions'] / elapsed),
+            'repriced_revenue': summary['repriced_revenue']
+        }
+
+
+def run(sessions=1000000, db_sessions=100000):
+    fake_redis = use_fake_redis()
+    schedule = parse_schedule(SCHEDULE)
+    return {
+        'fake_redis': fake_redis,
+        'engine': _engine(Tariff(40, schedule), sessions),
+        'database': _database(schedule, db_sessions) if db_sessions else None
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    db_sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    print(json.dumps(run(sessions, db_sessions), indent=2))
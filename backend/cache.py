@@ -0,0 +1,234 @@
+from extensions import db, redis_client
+from models import ParkingLot
+from collections import Counter, OrderedDict
+import json
+import threading
+import time
+
+# This file caches the lot listing served by /api/user/lots.
+#
+# The listing is split into two parts that change at very different rates:
+#   * Static metadata (name, price, address...) changes only when an admin edits
+#     lots. Each lot has its own Redis key, and the list of lot IDs is stored
+#     under a generation number that is bumped when lots are created or deleted.
+#   * Availability (occupied spots) changes on every booking and release. It is
+#     kept in one Redis hash, and only the affected lot's field is dropped.
+#
+# A small in-process LRU sits in front of Redis for the metadata, so hot reads
+# skip the network round trip. Its entries live only a few seconds, which bounds
+# how long another worker can serve metadata from before an admin edit.
+
+METADATA_TTL = 3600         # Seconds a lot's metadata stays in Redis.
+AVAILABILITY_TTL = 60       # Seconds before the availability hash is rebuilt.
+LOCAL_TTL = 5               # Seconds an entry stays in the in-process tier.
+
+GENERATION_KEY = "lots:generation"
+AVAILABILITY_KEY = "lots:availability"
+
+
+def _ids_key(generation):
+    return f"lots:v{generation}:ids"
+
+
+def _metadata_key(lot_id):
+    return f"lots:meta:{lot_id}"
+
+
+# -----------------
+# In-Process Tier
+# -----------------
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=LOCAL_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = TTLCache(maxsize=256)
+
+# Per-process hit/miss counters, by tier.
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event, n=1):
+    with _stats_lock:
+        _stats[event] += n
+
+
+def cache_stats():
+    """Returns this process's cache hit/miss counters and hit ratios."""
+    with _stats_lock:
+        stats = dict(_stats)
+
+    def ratio(hits, misses):
+        total = stats.get(hits, 0) + stats.get(misses, 0)
+        return round(stats.get(hits, 0) / total, 4) if total else None
+
+    stats['local_hit_ratio'] = ratio('local_hit', 'local_miss')
+    stats['metadata_hit_ratio'] = ratio('metadata_hit', 'metadata_miss')
+    stats['availability_hit_ratio'] = ratio('availability_hit', 'availability_miss')
+    return stats
+
+
+# -----------------
+# Static Lot Metadata
+# -----------------
+def lot_metadata(lot):
+    """The cacheable, rarely changing fields of a lot."""
+    return {
+        'id': lot.id,
+        'prime_location_name': lot.prime_location_name,
+        'price': lot.price,
+        'address': lot.address,
+        'pin_code': lot.pin_code,
+        'latitude': lot.latitude,
+        'longitude': lot.longitude,
+        'number_of_spots': lot.number_of_spots
+    }
+
+
+def _lot_ids():
+    generation = int(redis_client.get(GENERATION_KEY) or 0)
+    cached_ids = redis_client.get(_ids_key(generation))
+    if cached_ids is not None:
+        return json.loads(cached_ids)
+
+    ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+    redis_client.setex(_ids_key(generation), METADATA_TTL, json.dumps(ids))
+    return ids
+
+
+def _metadata(ids):
+    """Metadata of the given lots from Redis, reading only the missing ones from the database."""
+    values = redis_client.mget([_metadata_key(lot_id) for lot_id in ids]) if ids else []
+    metadata = {lot_id: json.loads(value) for lot_id, value in zip(ids, values) if value is not None}
+
+    missing = [lot_id for lot_id in ids if lot_id not in metadata]
+    _count('metadata_hit', len(metadata))
+    _count('metadata_miss', len(missing))
+    if missing:
+        pipe = redis_client.pipeline(transaction=False)
+        for lot in ParkingLot.query.filter(ParkingLot.id.in_(missing)):
+            metadata[lot.id] = lot_metadata(lot)
+            pipe.setex(_metadata_key(lot.id), METADATA_TTL, json.dumps(metadata[lot.id]))
+        pipe.execute()
+    return metadata
+
+
+def _all_lot_metadata():
+    cached = _local.get('lot_metadata')
+    if cached is not None:
+        _count('local_hit')
+        return cached
+    _count('local_miss')
+
+    ids = _lot_ids()
+    metadata = _metadata(ids)
+
+    # A lot deleted since the ID list was cached simply drops out.
+    result = [metadata[lot_id] for lot_id in ids if lot_id in metadata]
+    _local.set('lot_metadata', result)
+    return result
+
+
+# -----------------
+# Volatile Availability
+# -----------------
+def _occupied_counts(ids):
+    cached = redis_client.hmget(AVAILABILITY_KEY, ids) if ids else []
+    occupied = {lot_id: int(value) for lot_id, value in zip(ids, cached) if value is not None}
+
+    missing = [lot_id for lot_id in ids if lot_id not in occupied]
+    _count('availability_hit', len(ids) - len(missing))
+    _count('availability_miss', len(missing))
+    if missing:
+        fresh = dict(
+            db.session.query(ParkingLot.id, ParkingLot.occupied_spots)
+                      .filter(ParkingLot.id.in_(missing))
+        )
+        if fresh:
+            pipe = redis_client.pipeline()
+            pipe.hset(AVAILABILITY_KEY, mapping=fresh)
+            pipe.expire(AVAILABILITY_KEY, AVAILABILITY_TTL, nx=True)
+            pipe.execute()
+        occupied.update(fresh)
+    return occupied
+
+
+def _with_availability(lots):
+    occupied = _occupied_counts([lot['id'] for lot in lots])
+
+    output = []
+    for lot in lots:
+        lot_occupied = occupied.get(lot['id'], 0)
+        output.append(dict(
+            lot,
+            occupied_spots=lot_occupied,
+            available_spots=lot['number_of_spots'] - lot_occupied
+        ))
+    return output
+
+
+def get_lots():
+    """Returns every lot's metadata merged with its live occupied/available counters."""
+    return _with_availability(_all_lot_metadata())
+
+
+def get_lots_by_id(ids):
+    """Like `get_lots`, for only the given lots (in that order). Unknown IDs are skipped."""
+    metadata = _metadata(ids)
+    return _with_availability([metadata[lot_id] for lot_id in ids if lot_id in metadata])
+
+
+# -----------------
+# Invalidation
+# -----------------
+def invalidate_availability(lot_id):
+    """Call after a booking or release in a lot is committed."""
+    redis_client.hdel(AVAILABILITY_KEY, lot_id)
+
+
+def invalidate_lot(lot_id):
+    """Call after one lot's metadata (name, price, size...) is changed."""
+    pipe = redis_client.pipeline()
+    pipe.delete(_metadata_key(lot_id))
+    pipe.hdel(AVAILABILITY_KEY, lot_id)
+    pipe.execute()
+    _local.clear()
+
+
+def invalidate_lot_list():
+    """Call after lots are created or deleted, so the list of lot IDs is rebuilt."""
+    redis_client.incr(GENERATION_KEY)
+    _local.clear()
@@ -2,6 +2,7 @@
 
 from app import create_app, db
 from models import User
+from migrations import upgrade
 from werkzeug.security import generate_password_hash
 
 # Create an app instance using the factory
@@ -12,6 +13,9 @@ with app.app_context():
     # Create the database tables
     db.create_all()
 
+    # Bring an existing database up to date (new indexes, columns).
+    upgrade()
+
     # The rest of the script is the same...
     if not User.query.filter_by(role='admin').first():
         print("Admin user not found, creating one...")
@@ -1,18 +1,21 @@
 from functools import wraps
 from flask import jsonify
-from flask_jwt_extended import get_jwt_identity
-from models import User
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from user_cache import get_user
 
 def admin_required():
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            # Get the user's ID from the access token
-            user_id = get_jwt_identity()
-            user = User.query.get(user_id)
+            # The role is a claim of the access token, so no database lookup is needed.
+            # Tokens issued before the claim existed fall back to the cached user record.
+            role = get_jwt().get('role')
+            if role is None:
+                user = get_user(get_jwt_identity())
+                role = user['role'] if user else None
 
-            # Check if the user exists and their role is 'admin'
-            if user and user.role == 'admin':
+            # Check that the user's role is 'admin'
+            if role == 'admin':
                 return fn(*args, **kwargs)
             else:
                 return jsonify(message="Admins only! Access forbidden."), 403
@@ -0,0 +1,53 @@
+from extensions import redis_client
+import json
+import spot_map
+
+# This file publishes live availability changes for the SSE stream (sse_server.py).
+#
+# Every change gets the next number of a Redis counter as its event ID, is
+# appended to a capped replay log (a sorted set scored by ID) and is published
+# on a pub/sub channel. A Lua script does all three in one step, so IDs reach
+# subscribers in order. A client that reconnects with `Last-Event-ID` is sent
+# whatever it missed from the log.
+#
+# Events:
+#   spot - {lot_id, spot_number, status}: a spot was booked, held or freed.
+#   lot  - {lot_id, change}: a lot was created, updated or deleted; re-fetch it.
+
+CHANNEL = 'events:availability'
+SEQUENCE_KEY = 'events:availability:seq'
+LOG_KEY = 'events:availability:log'
+REPLAY_SIZE = 10000     # Events kept for clients catching up after a reconnect.
+
+# KEYS: sequence, log, channel. ARGV: event name, JSON data, replay size.
+# The message is "<id>\n<event>\n<data>".
+_PUBLISH = """
+local id = redis.call('INCR', KEYS[1])
+local message = id .. '\\n' .. ARGV[1] .. '\\n' .. ARGV[2]
+redis.call('ZADD', KEYS[2], id, message)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[3]) - 1)
+redis.call('PUBLISH', KEYS[3], message)
+return id
+"""
+_publish_script = redis_client.register_script(_PUBLISH)
+
+
+def parse_message(message):
+    """Splits a published message into (id, event, data)."""
+    event_id, event, data = message.split('\n', 2)
+    return int(event_id), event, data
+
+
+def _publish(event, data):
+    return _publish_script(keys=[SEQUENCE_KEY, LOG_KEY, CHANNEL], args=[event, json.dumps(data), REPLAY_SIZE])
+
+
+def spot_changed(lot_id, spot_number, status):
+    """Records a spot's new status in the lot's spot map and announces it. Call after the commit."""
+    spot_map.set_status(lot_id, spot_number, status)
+    return _publish('spot', {'lot_id': lot_id, 'spot_number': spot_number, 'status': status})
+
+
+def lot_changed(lot_id, change):
+    """Announces that a lot was 'created', 'updated' or 'deleted'. Call after the commit."""
+    return _publish('lot', {'lot_id': lot_id, 'change': change})
@@ -0,0 +1,96 @@
+from extensions import redis_client
+from models import ParkingRecord
+from queries import history_query
+import csv
+import gzip
+import os
+import time
+
+# This file streams parking history into gzip-compressed CSV files.
+#
+# Rows are pulled from the database in chunks (`yield_per`, a server-side cursor
+# where the driver supports it) and compressed as they are written, so memory
+# stays flat whether the export has ten rows or the whole ParkingRecord table.
+# Each export gets its own file, named after the Celery task that produced it.
+
+EXPORT_DIR = os.path.abspath('exports')
+CHUNK_SIZE = 1000
+EXPORT_TTL = 24 * 3600      # Seconds an export stays downloadable.
+
+FIELDNAMES = ['Reservation ID', 'Username', 'Lot Name', 'Spot Number', 'Parking Time', 'Leaving Time', 'Cost (INR)']
+USER_FIELDNAMES = [name for name in FIELDNAMES if name != 'Username']
+
+
+def _owner_key(task_id):
+    return f"export:{task_id}:owner"
+
+
+# -----------------
+# Writing
+# -----------------
+def export_path(task_id):
+    return os.path.join(EXPORT_DIR, f'history_{task_id}.csv.gz')
+
+
+def write_history(task_id, user_id=None):
+    """Streams one user's history (or everyone's, if user_id is None) to a gzip CSV.
+
+    Returns (path, row_count). The file appears under its final name only once
+    it is complete, so a half-written export is never served.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_path(task_id)
+    partial_path = path + '.part'
+
+    query = history_query(user_id=user_id)\
+        .order_by(ParkingRecord.parking_timestamp.desc(), ParkingRecord.id.desc())\
+        .yield_per(CHUNK_SIZE)
+    fieldnames = USER_FIELDNAMES if user_id is not None else FIELDNAMES
+
+    rows = 0
+    with gzip.open(partial_path, 'wt', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        for row in query:
+            values = [
+                row.reservation_id,
+                row.username,
+                row.lot_name,
+                row.spot_number,
+                row.parking_timestamp.isoformat() if row.parking_timestamp else '',
+                row.leaving_timestamp.isoformat() if row.leaving_timestamp else '',
+                row.parking_cost if row.parking_cost is not None else ''
+            ]
+            if user_id is not None:
+                del values[1]
+            writer.writerow(values)
+            rows += 1
+
+    os.replace(partial_path, path)
+    return path, rows
+
+
+def remove_expired_exports():
+    """Deletes export files older than EXPORT_TTL. Returns how many were removed."""
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    cutoff = time.time() - EXPORT_TTL
+    removed = 0
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+# -----------------
+# Ownership
+# -----------------
+def register_export(task_id, user_id):
+    """Remembers who started an export, so only they can check or download it."""
+    redis_client.setex(_owner_key(task_id), EXPORT_TTL, str(user_id))
+
+
+def export_owner(task_id):
+    return redis_client.get(_owner_key(task_id))
@@ -1,11 +1,40 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager
+from flask_sqlalchemy.session import Session
+from flask_jwt_extended import JWTManager, get_jwt_identity
 from celery import Celery
 from celery.schedules import crontab
 import redis
 from flask_mail import Mail
+from contextlib import contextmanager
+from functools import wraps
+import contextvars
 
-db = SQLAlchemy()
+# -----------------
+# Read-Replica Routing
+# -----------------
+# When a 'replica' bind is configured (DATABASE_REPLICA_URL, see database.py),
+# SELECTs issued inside `replica_reads()` or a `@read_only` view go to the
+# replica. Everything else, including any flush or write made in the same
+# session, stays on the primary.
+#
+# A replica lags slightly behind the primary, so after a user's own booking or
+# release `stick_to_primary` keeps that user's reads on the primary for a few
+# seconds (DB_REPLICA_STICKY_SECONDS) and they always see their own writes.
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and not self._flushing and getattr(clause, 'is_select', False):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 jwt = JWTManager()
 
@@ -14,6 +43,50 @@ mail = Mail()
 # Redis client for caching API responses
 redis_client = redis.Redis(decode_responses=True)
 
+
+def _sticky_key(user_id):
+    return f"db:primary:user:{user_id}"
+
+
+def stick_to_primary(user_id):
+    """Keeps a user's reads on the primary for a short while after they wrote something."""
+    if 'replica' in db.engines:
+        redis_client.setex(_sticky_key(user_id), current_app.config['DB_REPLICA_STICKY_SECONDS'], 1)
+
+
+def _must_read_primary(user_id):
+    if 'replica' not in db.engines:
+        return True
+    if user_id is None:
+        return False
+    try:
+        return redis_client.exists(_sticky_key(user_id)) > 0
+    except redis.RedisError:
+        # Without the marker we cannot tell, so read from the primary to be safe.
+        return True
+
+
+@contextmanager
+def replica_reads(user_id=None):
+    """Sends the SELECTs inside the block to the replica, unless `user_id` wrote recently."""
+    if _must_read_primary(user_id):
+        yield
+        return
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_only(view):
+    """Runs a read-only view against the replica. Goes below @jwt_required()."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads(get_jwt_identity()):
+            return view(*args, **kwargs)
+    return wrapper
+
 # Celery object for handling background tasks
 celery = Celery(
     __name__,
@@ -35,4 +108,24 @@ celery.conf.beat_schedule = {
         
         # 'schedule': crontab(day_of_month=1, hour=5, minute=0)
     },
+    # Rebuilds the Redis free-spot pools and lot counters, in case they drifted after a crash.
+    'reconcile-spot-pools': {
+        'task': 'tasks.reconcile_spot_pools_task',
+        'schedule': 600.0,
+    },
+    # Frees the spots of reservation holds that ran out.
+    'expire-holds': {
+        'task': 'tasks.expire_holds_task',
+        'schedule': 30.0,
+    },
+    # Folds newly closed sessions into the hourly occupancy analytics.
+    'update-occupancy': {
+        'task': 'tasks.update_occupancy_task',
+        'schedule': 300.0,
+    },
+    # Deletes CSV exports older than a day.
+    'cleanup-exports': {
+        'task': 'tasks.cleanup_exports_task',
+        'schedule': 3600.0,
+    },
 }
\ No newline at end of file
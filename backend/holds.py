@@ -0,0 +1,189 @@
+from extensions import db, redis_client
+from models import ParkingRecord, ParkingSpot, SpotHold
+from allocator import claim_spot, return_spot, adjust_occupied
+from cache import invalidate_availability
+from events import spot_changed
+from collections import Counter
+from sqlalchemy import delete, update
+import datetime
+
+# This file lets a user hold a spot for a few minutes before they arrive.
+#
+# A hold takes a spot out of its lot's free pool just like a booking does, but
+# the spot is marked 'held' and a SpotHold row records when the hold runs out.
+# Booking while holding turns the hold into a parking session in one
+# transaction, on the same spot.
+#
+# Expiry is driven by a Redis sorted set of hold IDs scored by their expiry
+# time. A Celery beat job pops the due IDs in batches and frees their spots, so
+# no per-hold timers are needed and ParkingSpot is never scanned. The database
+# decides the outcome: a hold is only expired if its row is still there and past
+# its expiry, so a hold converted at the last moment is never freed by mistake.
+
+EXPIRY_KEY = 'holds:expiry'
+DEFAULT_MINUTES = 15
+MAX_MINUTES = 60
+SWEEP_BATCH = 500
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _score(expires_at):
+    return (expires_at - EPOCH).total_seconds()
+
+
+def parse_minutes(value):
+    """Validates the requested hold length in minutes."""
+    if value is None:
+        return DEFAULT_MINUTES
+    try:
+        minutes = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("'minutes' must be a whole number.")
+    if not 1 <= minutes <= MAX_MINUTES:
+        raise ValueError(f"'minutes' must be between 1 and {MAX_MINUTES}.")
+    return minutes
+
+
+# -----------------
+# Placing / Converting / Cancelling
+# -----------------
+def place_hold(user_id, lot_id, minutes, now=None):
+    """Holds one free spot of a lot in the current transaction.
+
+    Returns (hold, spot) or None if the lot is full. The caller commits, then
+    calls `schedule_expiry(hold)`; if the commit fails, give the spot back
+    with `return_spot`.
+    """
+    now = now or datetime.datetime.utcnow()
+    spot = claim_spot(lot_id, status='held')
+    if not spot:
+        return None
+
+    hold = SpotHold(
+        user_id=user_id,
+        spot_id=spot.id,
+        lot_id=spot.lot_id,
+        created_at=now,
+        expires_at=now + datetime.timedelta(minutes=minutes)
+    )
+    db.session.add(hold)
+    db.session.flush()
+    return hold, spot
+
+
+def schedule_expiry(hold):
+    """Adds a committed hold to the expiry timer."""
+    redis_client.zadd(EXPIRY_KEY, {hold.id: _score(hold.expires_at)})
+
+
+def convert_hold(hold_id, user_id, now=None):
+    """Turns an unexpired hold into a parking session in the current transaction.
+
+    Returns the spot (`id`, `lot_id`, `spot_number`), or None if the hold has
+    already expired. The caller commits, then calls `forget_hold(hold_id)`.
+    """
+    now = now or datetime.datetime.utcnow()
+    # Deleting the row is what claims the hold; the sweeper deletes it too, so
+    # only one of them can win.
+    taken = db.session.execute(
+        delete(SpotHold)
+        .where(SpotHold.id == hold_id, SpotHold.expires_at > now)
+        .returning(SpotHold.spot_id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if not taken:
+        return None
+
+    # Held and occupied spots both count as occupied, so the lot counter stays put.
+    spot = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == taken.spot_id, ParkingSpot.status == 'held')
+        .values(status='occupied')
+        .returning(ParkingSpot.id, ParkingSpot.lot_id, ParkingSpot.spot_number)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if spot:
+        db.session.add(ParkingRecord(user_id=user_id, spot_id=spot.id, parking_timestamp=now))
+    return spot
+
+
+def cancel_hold(hold_id):
+    """Ends a hold early in the current transaction. Returns the freed (spot_id, lot_id, spot_number), or None.
+
+    The caller commits, then calls `finish_expiry`.
+    """
+    # As if it expired right now, whatever its expiry time.
+    freed = expire_holds([hold_id], now=datetime.datetime.max)
+    return freed[0] if freed else None
+
+
+def forget_hold(hold_id):
+    redis_client.zrem(EXPIRY_KEY, hold_id)
+
+
+# -----------------
+# Expiry
+# -----------------
+def expire_holds(hold_ids, now=None):
+    """Deletes the given holds that are past their expiry and frees their spots.
+
+    Runs in the current transaction. Returns the freed (spot_id, lot_id, spot_number) rows.
+    """
+    now = now or datetime.datetime.utcnow()
+    if not hold_ids:
+        return []
+
+    expired = db.session.execute(
+        delete(SpotHold)
+        .where(SpotHold.id.in_(hold_ids), SpotHold.expires_at <= now)
+        .returning(SpotHold.spot_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    if not expired:
+        return []
+
+    freed = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id.in_(expired), ParkingSpot.status == 'held')
+        .values(status='available')
+        .returning(ParkingSpot.id, ParkingSpot.lot_id, ParkingSpot.spot_number)
+        .execution_options(synchronize_session=False)
+    ).all()
+    for lot_id, count in Counter(lot_id for _, lot_id, _ in freed).items():
+        adjust_occupied(lot_id, -count)
+    return [tuple(row) for row in freed]
+
+
+def finish_expiry(hold_ids, freed):
+    """After the expiry is committed: returns the spots to their pools and stops the timers."""
+    for spot_id, lot_id, spot_number in freed:
+        return_spot(lot_id, spot_id)
+        spot_changed(lot_id, spot_number, 'available')
+    for lot_id in {lot_id for _, lot_id, _ in freed}:
+        invalidate_availability(lot_id)
+    if hold_ids:
+        redis_client.zrem(EXPIRY_KEY, *hold_ids)
+
+
+def sweep_expired_holds(now=None):
+    """Expires every hold that is due, in batches. Returns the number of spots freed."""
+    now = now or datetime.datetime.utcnow()
+    total = 0
+    while True:
+        due = redis_client.zrangebyscore(EXPIRY_KEY, '-inf', _score(now), start=0, num=SWEEP_BATCH)
+        if not due:
+            return total
+        # Holds converted or cancelled in the meantime simply match no row.
+        freed = expire_holds([int(hold_id) for hold_id in due], now)
+        db.session.commit()
+        finish_expiry(due, freed)
+        total += len(freed)
+
+
+def requeue_holds():
+    """Re-adds every hold to the expiry timer, in case Redis lost it. Returns the number of holds."""
+    holds = db.session.query(SpotHold.id, SpotHold.expires_at).all()
+    if holds:
+        redis_client.zadd(EXPIRY_KEY, {hold_id: _score(expires_at) for hold_id, expires_at in holds})
+    return len(holds)
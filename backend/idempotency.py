@@ -0,0 +1,99 @@
+from extensions import redis_client
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from functools import wraps
+import hashlib
+import json
+import redis
+
+# This file makes POST endpoints safe to retry with an `Idempotency-Key` header.
+#
+# The first request with a given key (per user) runs normally and its response
+# is stored in Redis. Retries with the same key get that stored response back,
+# marked with `Idempotent-Replayed: true`, instead of running the action again.
+# While the first request is still running, a retry gets 409 and should try
+# again shortly. A key reused with a different request body is rejected (422).
+#
+# Server errors (5xx) are not stored, so a retry after one runs the action again.
+
+HEADER = 'Idempotency-Key'
+RESPONSE_TTL = 24 * 3600    # Seconds a stored response is replayed.
+LOCK_TTL = 60               # Seconds a key stays locked if its first request dies.
+MAX_KEY_LENGTH = 255
+
+PENDING = 'pending'
+
+
+def _key(user_id, idempotency_key):
+    return f"idempotency:{user_id}:{idempotency_key}"
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(stored):
+    response = Response(stored['body'], status=stored['status'], mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _release(key):
+    """Unlocks a key whose request failed, so a retry runs the action again."""
+    try:
+        redis_client.delete(key)
+    except redis.RedisError:
+        pass
+
+
+def idempotent(view):
+    """Replays the stored response for retried POSTs that carry an Idempotency-Key. Goes below @jwt_required()."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get(HEADER)
+        if request.method != 'POST' or not idempotency_key:
+            return view(*args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({"message": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."}), 400
+
+        key = _key(get_jwt_identity(), idempotency_key)
+        fingerprint = _fingerprint()
+        try:
+            # Only the first request takes the key; the others see what it holds.
+            if not redis_client.set(key, PENDING, nx=True, ex=LOCK_TTL):
+                stored = redis_client.get(key)
+                if stored == PENDING:
+                    return jsonify({"message": "A request with this Idempotency-Key is still in progress."}), 409
+                if stored is not None:
+                    stored = json.loads(stored)
+                    if stored['fingerprint'] != fingerprint:
+                        return jsonify({"message": f"This {HEADER} was already used for a different request."}), 422
+                    return _replay(stored)
+                # The stored response expired in between; take the key now.
+                if not redis_client.set(key, PENDING, nx=True, ex=LOCK_TTL):
+                    return jsonify({"message": "A request with this Idempotency-Key is still in progress."}), 409
+        except redis.RedisError:
+            # Without Redis there is no deduplication; the endpoint's own
+            # database constraints still apply.
+            return view(*args, **kwargs)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _release(key)
+            raise
+
+        if response.status_code >= 500:
+            _release(key)
+        else:
+            try:
+                redis_client.set(key, json.dumps({
+                    'status': response.status_code,
+                    'body': response.get_data(as_text=True),
+                    'fingerprint': fingerprint
+                }), ex=RESPONSE_TTL)
+            except redis.RedisError:
+                # The action is done; a retry then falls back on the database constraints.
+                pass
+        return response
+    return wrapper
@@ -0,0 +1,363 @@
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+import bisect
+import os
+import threading
+import time
+
+# This file measures the app and serves the figures at /metrics, in the
+# Prometheus text format:
+#
+#   * every request: latency by blueprint/route/method, count by status, and
+#     how many SQL statements it ran (a route whose count grows with the data
+#     has an N+1 query);
+#   * every SQL statement, through SQLAlchemy engine events: count and time by
+#     operation (SELECT/INSERT/UPDATE/DELETE);
+#   * every Redis command and pipeline sent through `redis_client`;
+#   * the lot cache hit/miss counters (see cache.py);
+#   * Celery task durations by task and final state.
+#
+# Request, SQL and Redis figures are kept in memory per process. Celery tasks
+# run in the worker processes, so their durations are added up in Redis and
+# read back by whichever web process is scraped.
+#
+# A request slower than SLOW_REQUEST_MS is logged as a warning with its SQL
+# statement count and time, its slowest statements and its most repeated one.
+#
+# Settings (app.config, or the environment): METRICS_TOKEN (if set, /metrics
+# needs `Authorization: Bearer <token>`) and SLOW_REQUEST_MS (0 turns the log off).
+
+PREFIX = 'parking'
+SLOW_REQUEST_MS = 500
+SLOW_LOG_STATEMENTS = 5     # Slowest statements included in a slow-request log entry.
+CAPTURE_LIMIT = 500         # Statements remembered per request for that log.
+STATEMENT_CHARS = 300       # Statements are shortened to this in the log.
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+TASKS_KEY = 'metrics:celery:tasks'
+
+
+# -----------------
+# Metric Types
+# -----------------
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class MetricCounter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+            for labels, value in sorted(values.items())
+        ]
+
+
+class MetricHistogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum.
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def lines(self):
+        with self._lock:
+            values = {labels: list(counts) for labels, counts in self._values.items()}
+        return self._header() + histogram_lines(self.name, self.label_names, self.buckets, values)
+
+
+def histogram_lines(name, label_names, buckets, values):
+    """Exposition lines for {labels: [count per bucket..., +Inf count, sum]}."""
+    lines = []
+    for labels, counts in sorted(values.items()):
+        total = 0
+        for bound, count in zip((*buckets, '+Inf'), counts):
+            total += count
+            lines.append(f'{name}_bucket{_labels(label_names, labels, [("le", bound)])} {total}')
+        lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(counts[-1])}')
+        lines.append(f'{name}_count{_labels(label_names, labels)} {total}')
+    return lines
+
+
+_registry = []
+
+requests_total = MetricCounter('http_requests_total', 'HTTP requests handled.', ('blueprint', 'route', 'method', 'status'))
+request_duration = MetricHistogram('http_request_duration_seconds', 'HTTP request latency.', ('blueprint', 'route', 'method'))
+request_statements = MetricHistogram('http_request_sql_statements', 'SQL statements run per HTTP request.', ('blueprint', 'route', 'method'), COUNT_BUCKETS)
+slow_requests_total = MetricCounter('http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.', ('blueprint', 'route', 'method'))
+sql_duration = MetricHistogram('sql_statement_duration_seconds', 'SQL statement execution time.', ('operation',))
+redis_commands_total = MetricCounter('redis_commands_total', 'Redis commands sent, pipelined ones included.', ('command',))
+redis_round_trips_total = MetricCounter('redis_round_trips_total', 'Redis round trips (single commands and pipelines).', ('kind',))
+redis_seconds_total = MetricCounter('redis_seconds_total', 'Time spent waiting on Redis.')
+
+
+# -----------------
+# SQL
+# -----------------
+def _operation(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+# The start time is kept on the statement's execution context, which is thrown
+# away with the statement, so one that fails (and never reaches
+# _after_cursor_execute) leaves nothing behind on the pooled connection.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instrument_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_instrument_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    sql_duration.observe((_operation(statement),), elapsed)
+
+    if has_request_context():
+        trace = g.get('_sql_trace')
+        if trace is not None:
+            trace['count'] += 1
+            trace['seconds'] += elapsed
+            if len(trace['statements']) < CAPTURE_LIMIT:
+                trace['statements'].append((elapsed, statement))
+
+
+# -----------------
+# Redis
+# -----------------
+def instrument_redis(client):
+    """Counts and times the commands and pipelines sent through a redis-py client."""
+    if getattr(client, '_instrumented', False):
+        return
+    execute_command, pipeline = client.execute_command, client.pipeline
+
+    def counted_execute_command(*args, **options):
+        start = time.perf_counter()
+        try:
+            return execute_command(*args, **options)
+        finally:
+            redis_seconds_total.inc(amount=time.perf_counter() - start)
+            redis_round_trips_total.inc(('command',))
+            redis_commands_total.inc((str(args[0]).upper(),))
+
+    def counted_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def counted_execute(*execute_args, **execute_kwargs):
+            commands = [str(command[0][0]).upper() for command in pipe.command_stack]
+            start = time.perf_counter()
+            try:
+                return execute(*execute_args, **execute_kwargs)
+            finally:
+                redis_seconds_total.inc(amount=time.perf_counter() - start)
+                redis_round_trips_total.inc(('pipeline',))
+                for command, count in Counter(commands).items():
+                    redis_commands_total.inc((command,), count)
+
+        pipe.execute = counted_execute
+        return pipe
+
+    client.execute_command = counted_execute_command
+    client.pipeline = counted_pipeline
+    client._instrumented = True
+
+
+# -----------------
+# Celery
+# -----------------
+_task_started = {}
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    from extensions import redis_client
+    started = _task_started.pop(task_id, None)
+    if started is None or task is None:
+        return
+    elapsed = time.perf_counter() - started
+    field = f'{task.name}|{state or "UNKNOWN"}'
+    pipe = redis_client.pipeline()
+    pipe.hincrby(TASKS_KEY, f'{field}|{bisect.bisect_left(TASK_BUCKETS, elapsed)}', 1)
+    pipe.hincrbyfloat(TASKS_KEY, f'{field}|sum', elapsed)
+    pipe.execute()
+
+
+def _task_lines():
+    from extensions import redis_client
+    values = {}
+    for key, value in redis_client.hgetall(TASKS_KEY).items():
+        task, state, slot = key.rsplit('|', 2)
+        counts = values.setdefault((task, state), [0] * (len(TASK_BUCKETS) + 1) + [0.0])
+        if slot == 'sum':
+            counts[-1] = float(value)
+        else:
+            counts[int(slot)] = int(value)
+    name = f'{PREFIX}_celery_task_duration_seconds'
+    return [
+        f'# HELP {name} Celery task run time, by final state (all workers).',
+        f'# TYPE {name} histogram',
+        *histogram_lines(name, ('task', 'state'), TASK_BUCKETS, values)
+    ]
+
+
+# -----------------
+# Requests
+# -----------------
+def _route_labels():
+    rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+    return request.blueprint or '', rule, request.method
+
+
+def _start_request():
+    g._request_started = time.perf_counter()
+    g._sql_trace = {'count': 0, 'seconds': 0.0, 'statements': []}
+
+
+def _remember_status(response):
+    g._response_status = response.status_code
+    return response
+
+
+def _log_slow_request(app, labels, elapsed, trace):
+    slowest = sorted(trace['statements'], key=lambda item: item[0], reverse=True)[:SLOW_LOG_STATEMENTS]
+    repeated, times = Counter(statement for _, statement in trace['statements']).most_common(1)[0] if trace['statements'] else ('', 0)
+    lines = [
+        f"Slow request: {labels[2]} {request.path} ({labels[1]}) took {elapsed * 1000:.0f} ms; "
+        f"{trace['count']} SQL statements took {trace['seconds'] * 1000:.0f} ms."
+    ]
+    lines += [f"  {seconds * 1000:.1f} ms: {statement[:STATEMENT_CHARS]}" for seconds, statement in slowest]
+    if times > 1:
+        lines.append(f"  Run {times} times: {repeated[:STATEMENT_CHARS]}")
+    app.logger.warning('\n'.join(lines))
+
+
+def _finish_request(app):
+    def finish(exception=None):
+        started = g.pop('_request_started', None)
+        trace = g.pop('_sql_trace', None)
+        if started is None or request.endpoint == 'metrics':
+            return
+        elapsed = time.perf_counter() - started
+        labels = _route_labels()
+        status = g.pop('_response_status', 500)
+
+        requests_total.inc((*labels, str(status)))
+        request_duration.observe(labels, elapsed)
+        request_statements.observe(labels, trace['count'])
+
+        threshold = app.config.get('SLOW_REQUEST_MS', SLOW_REQUEST_MS)
+        if threshold and elapsed * 1000 >= threshold:
+            slow_requests_total.inc(labels)
+            _log_slow_request(app, labels, elapsed, trace)
+    return finish
+
+
+# -----------------
+# Exposition
+# -----------------
+def _cache_lines():
+    from cache import cache_stats
+    stats = cache_stats()
+    events, ratios = f'{PREFIX}_cache_events_total', f'{PREFIX}_cache_hit_ratio'
+    lines = [f'# HELP {events} Lot cache hits and misses (see cache.py).', f'# TYPE {events} counter']
+    lines += [f'{events}{{event="{_escape(name)}"}} {value}' for name, value in sorted(stats.items()) if not name.endswith('_ratio')]
+    lines += [f'# HELP {ratios} Lot cache hit ratio since the process started.', f'# TYPE {ratios} gauge']
+    lines += [
+        f'{ratios}{{cache="{name[:-len("_hit_ratio")]}"}} {value}'
+        for name, value in sorted(stats.items()) if name.endswith('_hit_ratio') and value is not None
+    ]
+    return lines
+
+
+def render_metrics():
+    """Every metric in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.lines()
+    lines += _cache_lines()
+    try:
+        lines += _task_lines()
+    except Exception:  # Redis is down: serve the in-process figures anyway.
+        pass
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app, celery=None):
+    """Wires the request hooks, SQL and Redis counters, Celery signals and /metrics into the app."""
+    from extensions import redis_client
+
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.config.setdefault('SLOW_REQUEST_MS', int(os.environ.get('SLOW_REQUEST_MS', SLOW_REQUEST_MS)))
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    instrument_redis(redis_client)
+
+    if celery is not None:
+        from celery.signals import task_prerun, task_postrun
+        task_prerun.connect(_task_prerun, weak=False, dispatch_uid='parking-metrics-prerun')
+        task_postrun.connect(_task_postrun, weak=False, dispatch_uid='parking-metrics-postrun')
+
+    app.before_request(_start_request)
+    app.after_request(_remember_status)
+    app.teardown_request(_finish_request(app))
+
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,59 @@
+from extensions import redis_client
+
+# This file limits password attempts, so guessing cannot fill the hashing pool
+# (see passwords.py) or brute-force one account.
+#
+#   * Per username: after USER_MAX_FAILURES failed logins the name is locked
+#     for the rest of a USER_WINDOW that starts at the first failure. A
+#     successful login clears the count.
+#   * Per client IP: at most IP_MAX_ATTEMPTS logins/registrations per
+#     IP_WINDOW, successful or not, which also covers trying many usernames.
+#
+# Both are checked BEFORE any hashing is done. Each check returns 0 when the
+# attempt may go ahead, or the number of seconds to wait (for Retry-After).
+
+USER_MAX_FAILURES = 5
+USER_WINDOW = 15 * 60       # Seconds.
+IP_MAX_ATTEMPTS = 30
+IP_WINDOW = 60              # Seconds.
+
+
+def _user_key(username):
+    return f"login:failures:{username.strip().lower()}"
+
+
+def _ip_key(ip):
+    return f"login:attempts:{ip}"
+
+
+def _retry_after(key):
+    return max(redis_client.ttl(key), 1)
+
+
+def check_ip(ip):
+    """Counts one attempt from `ip`. Returns seconds to wait if it is over the limit, else 0."""
+    key = _ip_key(ip)
+    pipe = redis_client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, IP_WINDOW, nx=True)
+    attempts, _ = pipe.execute()
+    return _retry_after(key) if attempts > IP_MAX_ATTEMPTS else 0
+
+
+def check_user(username):
+    """Returns seconds to wait if `username` is locked after failed logins, else 0."""
+    key = _user_key(username)
+    failures = redis_client.get(key)
+    return _retry_after(key) if failures and int(failures) >= USER_MAX_FAILURES else 0
+
+
+def record_failure(username):
+    key = _user_key(username)
+    pipe = redis_client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, USER_WINDOW, nx=True)
+    pipe.execute()
+
+
+def record_success(username):
+    redis_client.delete(_user_key(username))
@@ -0,0 +1,191 @@
+from extensions import redis_client
+from models import ParkingLot
+from cache import get_lots_by_id
+import math
+import re
+
+# This file indexes parking lots for /api/user/lots/search.
+#
+# Two Redis indexes are kept in step with the lots (see lot_routes.py):
+#   * A geo set of every lot with coordinates. Redis stores these as geohashes,
+#     so a radius query only visits the grid cells around the point and returns
+#     the nearest lots first.
+#   * A sorted set of search terms ("pin|560001|12", "addr|koramangala|12"...)
+#     with equal scores, so ZRANGEBYLEX finds every lot whose pin code or one of
+#     whose address/name words starts with a prefix without scanning the lots.
+#     A query of several words is looked up word by word and the matches
+#     intersected.
+#
+# Only a bounded number of candidates is taken from either index. They are then
+# joined with the cached lot details and live availability, filtered and ranked,
+# and the top results returned.
+#
+# The indexes are rebuilt from ParkingLot when missing and by the periodic pool
+# reconciliation.
+
+GEO_KEY = 'lots:geo'
+TERMS_KEY = 'lots:terms'
+BUILT_KEY = 'lots:search:built'
+
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 100
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+CANDIDATES = 500            # Most lots taken from an index before ranking.
+
+SORTS = ('best', 'distance', 'price', 'availability')
+
+
+def _lot_terms_key(lot_id):
+    return f"lots:terms:{lot_id}"
+
+
+def _words(text):
+    return set(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def _terms(lot):
+    terms = {f"pin|{lot.pin_code.strip().lower()}|{lot.id}"}
+    terms.update(f"addr|{word}|{lot.id}" for word in _words(f"{lot.address} {lot.prime_location_name}"))
+    return terms
+
+
+# -----------------
+# Indexing
+# -----------------
+def index_lot(lot, pipe=None):
+    """Adds or refreshes one lot in the search indexes. Call after the change is committed."""
+    own_pipe = pipe is None
+    if own_pipe:
+        # Drop the terms indexed last time (the address may have changed). A
+        # full rebuild passes its own pipeline and starts from empty indexes.
+        pipe = redis_client.pipeline()
+        old_terms = redis_client.smembers(_lot_terms_key(lot.id))
+        if old_terms:
+            pipe.zrem(TERMS_KEY, *old_terms)
+    pipe.delete(_lot_terms_key(lot.id))
+
+    terms = _terms(lot)
+    pipe.zadd(TERMS_KEY, {term: 0 for term in terms})
+    pipe.sadd(_lot_terms_key(lot.id), *terms)
+    if lot.latitude is not None and lot.longitude is not None:
+        pipe.geoadd(GEO_KEY, [lot.longitude, lot.latitude, lot.id])
+    else:
+        pipe.zrem(GEO_KEY, lot.id)
+
+    if own_pipe:
+        pipe.execute()
+
+
+def unindex_lot(lot_id):
+    """Removes a deleted lot from the search indexes."""
+    old_terms = redis_client.smembers(_lot_terms_key(lot_id))
+    pipe = redis_client.pipeline()
+    if old_terms:
+        pipe.zrem(TERMS_KEY, *old_terms)
+    pipe.delete(_lot_terms_key(lot_id))
+    pipe.zrem(GEO_KEY, lot_id)
+    pipe.execute()
+
+
+def rebuild_index():
+    """Re-indexes every lot. Returns the number of lots indexed."""
+    lots = ParkingLot.query.all()
+    pipe = redis_client.pipeline()
+    pipe.delete(GEO_KEY, TERMS_KEY)
+    for lot in lots:
+        index_lot(lot, pipe)
+    pipe.set(BUILT_KEY, 1)
+    pipe.execute()
+    return len(lots)
+
+
+def _ensure_index():
+    if not redis_client.exists(BUILT_KEY):
+        rebuild_index()
+
+
+# -----------------
+# Searching
+# -----------------
+def _prefix_matches(prefix):
+    """IDs of the lots whose pin code or an address/name word starts with `prefix`."""
+    ids = []
+    for kind in ('pin', 'addr'):
+        start = f"{kind}|{prefix}"
+        terms = redis_client.zrangebylex(TERMS_KEY, f"[{start}", f"[{start}\xff", start=0, num=CANDIDATES)
+        ids.extend(int(term.rsplit('|', 1)[1]) for term in terms)
+    return list(dict.fromkeys(ids))[:CANDIDATES]
+
+
+def _text_matches(words):
+    """IDs of the lots matching every word of a query (each as a prefix), fewest-match order first."""
+    matches = [_prefix_matches(word) for word in dict.fromkeys(words)]
+    common = set.intersection(*map(set, matches))
+    return [lot_id for lot_id in min(matches, key=len) if lot_id in common]
+
+
+def _haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def _candidates(latitude, longitude, radius_km, query):
+    """Returns {lot_id: distance_km or None} from the indexes."""
+    near = latitude is not None
+    # "MG Road" looks up "mg" and "road" and keeps the lots matching both.
+    words = re.findall(r'[a-z0-9]+', query.lower()) if query else []
+
+    if words:
+        ids = _text_matches(words)
+        if not near:
+            return {lot_id: None for lot_id in ids}
+        # Text matches are few, so their distances are computed directly.
+        distances = {}
+        for lot_id, position in zip(ids, redis_client.geopos(GEO_KEY, *ids) if ids else []):
+            if position is not None:
+                distance = _haversine_km(latitude, longitude, position[1], position[0])
+                if distance <= radius_km:
+                    distances[lot_id] = distance
+        return distances
+
+    nearest = redis_client.geosearch(
+        GEO_KEY, longitude=longitude, latitude=latitude,
+        radius=radius_km, unit='km', sort='ASC', count=CANDIDATES, withdist=True
+    )
+    return {int(lot_id): distance for lot_id, distance in nearest}
+
+
+def search_lots(latitude=None, longitude=None, radius_km=DEFAULT_RADIUS_KM, query=None,
+                min_free=1, sort='best', limit=DEFAULT_LIMIT):
+    """Finds lots near a point and/or matching a pin code/address prefix, ranked by `sort`.
+
+    'best' balances distance, price and free spots (lower score is better);
+    the other sorts use one criterion. Lots with fewer than `min_free` free
+    spots are left out.
+    """
+    _ensure_index()
+    distances = _candidates(latitude, longitude, radius_km, query)
+    lots = [lot for lot in get_lots_by_id(list(distances)) if lot['available_spots'] >= min_free]
+    for lot in lots:
+        distance = distances[lot['id']]
+        lot['distance_km'] = round(distance, 3) if distance is not None else None
+
+    max_price = max((lot['price'] for lot in lots), default=0) or 1
+
+    def free_ratio(lot):
+        return lot['available_spots'] / lot['number_of_spots'] if lot['number_of_spots'] else 0
+
+    def score(lot):
+        closeness = lot['distance_km'] / radius_km if lot['distance_km'] is not None else 0
+        return closeness + lot['price'] / max_price - free_ratio(lot)
+
+    keys = {
+        'best': score,
+        'distance': lambda lot: (lot['distance_km'] is None, lot['distance_km'] or 0),
+        'price': lambda lot: lot['price'],
+        'availability': lambda lot: -lot['available_spots']
+    }
+    lots.sort(key=keys[sort])
+    return lots[:limit]
@@ -0,0 +1,163 @@
+from extensions import mail, redis_client
+from flask import current_app
+from flask_mail import Message
+import datetime
+import random
+import smtplib
+import time
+import uuid
+
+# This file delivers bulk email (daily reminders, monthly reports).
+#
+# Recipients are split into batches that Celery sends in parallel. Each batch
+# goes out over ONE reused SMTP connection (`mail.connect()`) instead of a new
+# connection per message. A Redis counter caps the messages per second across
+# all workers, and messages that fail are retried by the batch task with an
+# exponential backoff (see tasks.py).
+#
+# A message is a plain dict, so it can travel through Celery:
+#   {'key': <user id>, 'recipients': [...], 'subject': ..., 'body' or 'html': ...}
+#
+# Every run (one reminder or report job) records its delivery counts in a Redis
+# hash, listed by /api/admin/mail-runs.
+
+BATCH_SIZE = 200
+RATE_LIMIT = 50             # Messages per second, across all workers. 0 disables the limit.
+MAX_RETRIES = 3
+RETRY_BACKOFF = 30          # Seconds before the first retry; doubled on each attempt.
+RUN_TTL = 7 * 24 * 3600     # Seconds a run's metrics are kept.
+RECENT_RUNS = 50
+
+
+def _run_key(run_id):
+    return f"mail:run:{run_id}"
+
+
+# -----------------
+# Delivery
+# -----------------
+def _build(message):
+    return Message(
+        subject=message['subject'],
+        recipients=message['recipients'],
+        body=message.get('body'),
+        html=message.get('html')
+    )
+
+
+def _wait_for_rate_limit():
+    """Blocks until this message fits in the current one-second window."""
+    limit = current_app.config.get('MAIL_RATE_LIMIT', RATE_LIMIT)
+    if not limit:
+        return
+    while True:
+        now = time.time()
+        key = f"mail:rate:{int(now)}"
+        pipe = redis_client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, 2)
+        count, _ = pipe.execute()
+        if count <= limit:
+            return
+        time.sleep(int(now) + 1 - now)
+
+
+def deliver(run_id, messages, checkpoint=None):
+    """Sends messages over one reused SMTP connection. Returns the ones that failed.
+
+    With a `checkpoint` (see reports.ReportCheckpoint), each message is claimed
+    just before it is sent and checked off right after, and messages it will not
+    claim (already sent, or being sent elsewhere) are skipped.
+    """
+    sent = 0
+    failed = []
+    handled = 0     # Messages sent, skipped or refused before the connection dropped.
+    try:
+        with mail.connect() as conn:
+            for message in messages:
+                _wait_for_rate_limit()
+                if checkpoint and not checkpoint.claim(message['key']):
+                    handled += 1
+                    continue
+                try:
+                    conn.send(_build(message))
+                except smtplib.SMTPException as e:
+                    if checkpoint:
+                        checkpoint.release(message['key'])
+                    if isinstance(e, smtplib.SMTPServerDisconnected):
+                        raise
+                    # Refused by the server (e.g. a bad recipient); the rest can still go.
+                    failed.append(message)
+                    handled += 1
+                    continue
+                except OSError:
+                    if checkpoint:
+                        checkpoint.release(message['key'])
+                    raise
+                if checkpoint:
+                    checkpoint.done(message['key'])
+                sent += 1
+                handled += 1
+    except (smtplib.SMTPException, OSError):
+        # Could not connect, or the connection dropped: everything not yet sent is retried.
+        failed.extend(messages[handled:])
+
+    pipe = redis_client.pipeline()
+    pipe.hincrby(_run_key(run_id), 'sent', sent)
+    pipe.hincrby(_run_key(run_id), 'failed_attempts', len(failed))
+    pipe.hset(_run_key(run_id), 'updated_at', datetime.datetime.utcnow().isoformat())
+    pipe.execute()
+    return failed
+
+
+def retry_delay(retries):
+    """Seconds to wait before retry number `retries` (0-based), with some jitter."""
+    return RETRY_BACKOFF * 2 ** retries + random.uniform(0, RETRY_BACKOFF / 2)
+
+
+# -----------------
+# Run Metrics
+# -----------------
+def start_run(kind, queued, batches):
+    """Registers a new delivery run and returns its id."""
+    run_id = uuid.uuid4().hex
+    pipe = redis_client.pipeline()
+    pipe.hset(_run_key(run_id), mapping={
+        'kind': kind,
+        'queued': queued,
+        'batches': batches,
+        'sent': 0,
+        'failed_attempts': 0,
+        'retried': 0,
+        'given_up': 0,
+        'started_at': datetime.datetime.utcnow().isoformat()
+    })
+    pipe.expire(_run_key(run_id), RUN_TTL)
+    pipe.lpush('mail:runs', run_id)
+    pipe.ltrim('mail:runs', 0, RECENT_RUNS - 1)
+    pipe.execute()
+    return run_id
+
+
+def record_retry(run_id, count):
+    redis_client.hincrby(_run_key(run_id), 'retried', count)
+
+
+def record_given_up(run_id, count):
+    redis_client.hincrby(_run_key(run_id), 'given_up', count)
+
+
+def run_metrics(run_id):
+    metrics = redis_client.hgetall(_run_key(run_id))
+    if not metrics:
+        return None
+    for field in ('queued', 'batches', 'sent', 'failed_attempts', 'retried', 'given_up'):
+        metrics[field] = int(metrics.get(field, 0))
+    metrics['run_id'] = run_id
+    return metrics
+
+
+def recent_runs():
+    """Metrics of the latest runs, newest first."""
+    runs = (run_metrics(run_id) for run_id in redis_client.lrange('mail:runs', 0, -1))
+    return [run for run in runs if run]
@@ -0,0 +1,159 @@
+from extensions import db
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+# This file applies versioned schema changes to an existing database in place.
+# `db.create_all()` only creates tables that are missing, so anything added to
+# a table that already exists (indexes, columns) must be listed here.
+#
+# Each migration is (version, description, function). Versions only ever grow,
+# and the highest applied version is stored in the `schema_version` table.
+#
+# Usage (from the backend folder):  python3 migrations.py
+
+
+# -----------------
+# Helpers
+# -----------------
+def _create_indexes(conn, model, *names):
+    """Creates the named indexes declared on a model, skipping any that already exist."""
+    # IF NOT EXISTS rather than checkfirst: SQLAlchemy cannot reflect expression
+    # indexes (e.g. on lower(username)) from SQLite, so checkfirst misses them.
+    indexes = {index.name: index for index in model.__table__.indexes}
+    for name in names:
+        conn.execute(CreateIndex(indexes[name], if_not_exists=True))
+
+
+def _add_column(conn, model, column_name):
+    """Adds a column declared on a model to its existing table, if it is missing."""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    if column_name in existing:
+        return
+
+    column = table.columns[column_name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}'
+    if column.server_default is not None:
+        default = column.server_default.arg
+        ddl += f" DEFAULT {getattr(default, 'text', default)}"
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    conn.execute(text(ddl))
+
+
+# -----------------
+# Migrations
+# -----------------
+def _hot_path_indexes(conn):
+    from models import ParkingRecord, ParkingSpot
+    # The active-session index as it was first defined: not unique yet, so this
+    # succeeds on a database with duplicate active sessions. Migration 5 makes
+    # it unique once they are cleaned up.
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_parking_record_active_user '
+        'ON parking_record (user_id) WHERE leaving_timestamp IS NULL'
+    ))
+    _create_indexes(
+        conn, ParkingRecord,
+        'ix_parking_record_user_parked',
+        'ix_parking_record_parked',
+        'ix_parking_record_spot'
+    )
+    _create_indexes(conn, ParkingSpot, 'ix_parking_spot_lot_status', 'ix_parking_spot_lot_number')
+
+
+def _lot_occupancy_counter(conn):
+    from models import ParkingLot
+    _add_column(conn, ParkingLot, 'occupied_spots')
+    conn.execute(text(
+        "UPDATE parking_lot SET occupied_spots = ("
+        "SELECT COUNT(*) FROM parking_spot "
+        "WHERE parking_spot.lot_id = parking_lot.id AND parking_spot.status = 'occupied')"
+    ))
+
+
+def _revenue_rollup_backfill(conn):
+    # The table itself is created by `db.create_all()`; this fills it from history.
+    from rollups import rebuild
+    rebuild(conn)
+
+
+def _closed_session_index(conn):
+    from models import ParkingRecord
+    _create_indexes(conn, ParkingRecord, 'ix_parking_record_left')
+
+
+def _unique_active_session(conn):
+    from models import ParkingRecord
+    duplicates = conn.execute(text(
+        "SELECT user_id FROM parking_record WHERE leaving_timestamp IS NULL "
+        "GROUP BY user_id HAVING COUNT(*) > 1"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"Users {duplicates} have more than one active reservation. "
+            "Release the extra sessions, then run the migrations again."
+        )
+    # Same name, now unique: replace the plain partial index.
+    conn.execute(text('DROP INDEX IF EXISTS ix_parking_record_active_user'))
+    _create_indexes(conn, ParkingRecord, 'ix_parking_record_active_user')
+
+
+def _lot_coordinates(conn):
+    from models import ParkingLot
+    _add_column(conn, ParkingLot, 'latitude')
+    _add_column(conn, ParkingLot, 'longitude')
+
+
+def _user_search(conn):
+    # The user_gram table is created by `db.create_all()`; this fills it.
+    from models import User
+    from user_search import backfill
+    _create_indexes(conn, User, 'ix_user_username_lower')
+    backfill(conn)
+
+
+MIGRATIONS = [
+    (1, 'Indexes for active sessions, spot allocation and history', _hot_path_indexes),
+    (2, 'Per-lot occupied spot counter', _lot_occupancy_counter),
+    (3, 'Backfill the per-lot daily revenue rollup', _revenue_rollup_backfill),
+    (4, 'Index closed sessions by leaving time', _closed_session_index),
+    (5, 'At most one active reservation per user', _unique_active_session),
+    (6, 'Parking lot coordinates for nearby search', _lot_coordinates),
+    (7, 'Username index and n-grams for admin user search', _user_search),
+]
+
+
+# -----------------
+# Runner
+# -----------------
+def current_version(conn):
+    """Returns the highest migration version applied to this database (0 if none)."""
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    version = conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    return version or 0
+
+
+def upgrade():
+    """Applies every pending migration, each in its own transaction. Needs an app context."""
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        with db.engine.begin() as conn:
+            if version <= current_version(conn):
+                continue
+            migrate(conn)
+            conn.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': version})
+        applied.append(version)
+        print(f"Applied migration {version}: {description}")
+    return applied
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if not upgrade():
+            print("Database schema is already up to date.")
@@ -1,4 +1,5 @@
 from extensions import db
+from sqlalchemy import func, text
 import datetime
 
 # User Model: Stores user data
@@ -8,6 +9,16 @@ class User(db.Model):
     password = db.Column(db.String(200), nullable=False) 
     role = db.Column(db.String(50), nullable=False, default='user') # Differentiates between 'user' and 'admin'
 
+    __table_args__ = (
+        # Admin user search: case-insensitive prefix matches and keyset paging.
+        db.Index('ix_user_username_lower', func.lower(username), 'id'),
+    )
+
+# UserGram Model: The 3-letter pieces of each username, for substring search (see user_search.py)
+class UserGram(db.Model):
+    gram = db.Column(db.String(3), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+
 # ParkingLot Model: Stores details about each parking lot
 class ParkingLot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,14 +26,30 @@ class ParkingLot(db.Model):
     price = db.Column(db.Float, nullable=False)
     address = db.Column(db.String(200), nullable=False)
     pin_code = db.Column(db.String(10), nullable=False)
+    latitude = db.Column(db.Float, nullable=True) # Optional; lots without coordinates are found by pin code/address only
+    longitude = db.Column(db.Float, nullable=True)
     number_of_spots = db.Column(db.Integer, nullable=False)
+    occupied_spots = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Spots occupied or held; kept in step by the allocator
+
+# LotTariff Model: A lot's optional rate schedule (time-of-day rates, grace, minimum, daily cap; see tariffs.py)
+class LotTariff(db.Model):
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    schedule = db.Column(db.Text, nullable=False) # JSON, as cleaned by tariffs.parse_schedule
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
 # ParkingSpot Model: Represents an individual spot in a lot
 class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
     spot_number = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='available') # e.g., 'available', 'occupied'
+    status = db.Column(db.String(20), nullable=False, default='available') # e.g., 'available', 'held', 'occupied', 'retired' (removed from the lot, kept for its history)
+
+    __table_args__ = (
+        # Booking looks for a free spot inside one lot.
+        db.Index('ix_parking_spot_lot_status', 'lot_id', 'status'),
+        # Lot detail pages list spots in spot_number order.
+        db.Index('ix_parking_spot_lot_number', 'lot_id', 'spot_number'),
+    )
 
 # ParkingRecord Model: Tracks each parking session
 class ParkingRecord(db.Model):
@@ -31,4 +58,55 @@ class ParkingRecord(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     parking_timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
     leaving_timestamp = db.Column(db.DateTime, nullable=True) # Nullable until the user leaves
-    parking_cost = db.Column(db.Float, nullable=True) # Nullable until cost is calculated
\ No newline at end of file
+    parking_cost = db.Column(db.Float, nullable=True) # Nullable until cost is calculated
+
+    __table_args__ = (
+        # Active-session lookup on every booking and release. Partial, so it only
+        # holds the (few) sessions that have not ended yet, and unique, so a user
+        # can never have two active sessions even if two bookings race.
+        db.Index(
+            'ix_parking_record_active_user', 'user_id',
+            unique=True,
+            sqlite_where=text('leaving_timestamp IS NULL'),
+            postgresql_where=text('leaving_timestamp IS NULL')
+        ),
+        # A user's history pages and the monthly report's date range filter.
+        db.Index('ix_parking_record_user_parked', 'user_id', 'parking_timestamp', 'id'),
+        # The admin history, ordered by (parking_timestamp, id) for keyset paging.
+        db.Index('ix_parking_record_parked', 'parking_timestamp', 'id'),
+        # Joins from spots to their records (revenue, lot filters).
+        db.Index('ix_parking_record_spot', 'spot_id'),
+        # Analytics read closed sessions in the order they ended.
+        db.Index('ix_parking_record_left', 'leaving_timestamp', 'id'),
+    )
+
+# SpotHold Model: A spot set aside for a user for a few minutes before they arrive
+class SpotHold(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True) # At most one hold per user
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# RevenueRollup Model: Revenue and usage of each lot per day, kept up to date on release
+class RevenueRollup(db.Model):
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True) # UTC day the sessions ended (cost was finalized)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    total_minutes = db.Column(db.Float, nullable=False, default=0)
+
+# LotOccupancyHour Model: How busy each lot was in each hour, built from closed sessions
+class LotOccupancyHour(db.Model):
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True) # UTC start of the hour
+    occupied_seconds = db.Column(db.Float, nullable=False, default=0) # Spot-seconds in use; / 3600 = average occupied spots
+    arrivals = db.Column(db.Integer, nullable=False, default=0)
+    departures = db.Column(db.Integer, nullable=False, default=0)
+
+# AnalyticsWatermark Model: How far an incremental job has read through ParkingRecord
+class AnalyticsWatermark(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    leaving_timestamp = db.Column(db.DateTime, nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
\ No newline at end of file
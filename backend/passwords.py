@@ -0,0 +1,109 @@
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import functools
+import os
+import threading
+
+# This file hashes and checks passwords off the request threads.
+#
+# Key derivation is deliberately slow (tens of milliseconds of CPU per call).
+# Run inline, a burst of logins ties up every web worker and bookings queue up
+# behind them. Instead the work goes to a small process pool, with a bounded
+# number of jobs waiting for it. When the pool is full, the request fails fast
+# with HashingBusy (the routes answer 503 + Retry-After) instead of waiting.
+#
+# HASH_METHOD is the werkzeug method new hashes use. A stored hash made with
+# other parameters is upgraded when its owner next logs in (`needs_rehash`).
+#
+# Everything can be overridden through app.config (PASSWORD_HASH_METHOD,
+# PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT).
+
+HASH_METHOD = 'scrypt:32768:8:1'
+WORKERS = os.cpu_count() or 2
+QUEUE_SIZE = 64             # Jobs allowed to wait for a worker before new ones are refused.
+TIMEOUT = 10                # Seconds a request waits for its job.
+RETRY_AFTER = 2             # Seconds clients are told to wait when the pool is full.
+
+
+class HashingBusy(Exception):
+    """The hashing pool is full (or broken); the request should be retried later."""
+
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _get_pool():
+    """Returns this process's pool, created on first use (and again after a fork)."""
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = _config('PASSWORD_HASH_WORKERS', WORKERS)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(workers + _config('PASSWORD_HASH_QUEUE', QUEUE_SIZE))
+        return _pool, _slots
+
+
+def _reset_pool(broken):
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _reset_pool(pool)
+        raise HashingBusy()
+    # The slot is freed when the job finishes, even if the request gave up on it.
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=_config('PASSWORD_HASH_TIMEOUT', TIMEOUT))
+    except FutureTimeout:
+        raise HashingBusy()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time.
+        _reset_pool(pool)
+        raise HashingBusy()
+
+
+# -----------------
+# Hashing
+# -----------------
+def hash_password(password):
+    """Returns a new hash of `password`. Raises HashingBusy when the pool is full."""
+    return _run(generate_password_hash, password, _config('PASSWORD_HASH_METHOD', HASH_METHOD))
+
+
+def verify_password(stored_hash, password):
+    """Checks `password` against a stored hash. Raises HashingBusy when the pool is full."""
+    return _run(check_password_hash, stored_hash, password)
+
+
+@functools.lru_cache(maxsize=None)
+def _method_prefix(method):
+    # werkzeug expands shorthand methods ('pbkdf2' -> 'pbkdf2:sha256:600000'),
+    # so take the prefix from a real hash rather than the configured string.
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(stored_hash):
+    """True when a stored hash was made with other parameters than HASH_METHOD."""
+    return stored_hash.split('$', 1)[0] != _method_prefix(_config('PASSWORD_HASH_METHOD', HASH_METHOD))
@@ -0,0 +1,175 @@
+from extensions import db
+from models import ParkingLot, ParkingRecord, ParkingSpot
+from sqlalchemy import delete, exists, func, insert, update
+import csv
+import io
+
+# This file creates, resizes and bulk-imports parking lots.
+#
+# Spots are written with one executemany INSERT per call instead of one ORM
+# object per spot, and a lot is always created together with its spots in a
+# single transaction, so a 5,000-spot garage holds the write lock only briefly.
+# None of these functions commit; the route commits once at the end.
+
+LOT_FIELDS = ('prime_location_name', 'price', 'address', 'pin_code', 'number_of_spots')
+MAX_SPOTS_PER_LOT = 100000
+
+
+# -----------------
+# Validation
+# -----------------
+def parse_lot(data, row=None):
+    """Validates one lot's fields and returns them cleaned. Raises ValueError."""
+    where = f" (row {row})" if row is not None else ""
+    missing = [field for field in LOT_FIELDS if data.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing field(s){where}: {', '.join(missing)}")
+
+    try:
+        price = float(data['price'])
+        number_of_spots = int(data['number_of_spots'])
+    except (TypeError, ValueError):
+        raise ValueError(f"'price' must be a number and 'number_of_spots' an integer{where}.")
+    if price < 0:
+        raise ValueError(f"'price' cannot be negative{where}.")
+    if not 0 <= number_of_spots <= MAX_SPOTS_PER_LOT:
+        raise ValueError(f"'number_of_spots' must be between 0 and {MAX_SPOTS_PER_LOT}{where}.")
+    latitude, longitude = parse_coordinates(data, where)
+
+    return {
+        'prime_location_name': str(data['prime_location_name']).strip(),
+        'price': price,
+        'address': str(data['address']).strip(),
+        'pin_code': str(data['pin_code']).strip(),
+        'latitude': latitude,
+        'longitude': longitude,
+        'number_of_spots': number_of_spots
+    }
+
+
+def parse_coordinates(data, where=""):
+    """Validates the optional `latitude`/`longitude` pair. Returns (None, None) if both are absent."""
+    latitude, longitude = data.get('latitude'), data.get('longitude')
+    if latitude in (None, '') and longitude in (None, ''):
+        return None, None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError(f"'latitude' and 'longitude' must both be numbers{where}.")
+    if not (-85.05 <= latitude <= 85.05 and -180 <= longitude <= 180):
+        raise ValueError(f"'latitude' must be between -85.05 and 85.05 and 'longitude' between -180 and 180{where}.")
+    return latitude, longitude
+
+
+def parse_import(request):
+    """Reads the lots of a bulk import request: a JSON body or a CSV file/body."""
+    if request.is_json:
+        payload = request.get_json()
+        rows = payload.get('lots') if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON list of lots or {\"lots\": [...]}.")
+    else:
+        upload = request.files.get('file')
+        text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True)
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    if not rows:
+        raise ValueError("No lots to import.")
+    return [parse_lot(row, row=index) for index, row in enumerate(rows, start=1)]
+
+
+# -----------------
+# Spots
+# -----------------
+def _insert_spots(lot_id, first_number, count):
+    if count > 0:
+        db.session.execute(
+            insert(ParkingSpot),
+            [{'lot_id': lot_id, 'spot_number': n} for n in range(first_number, first_number + count)]
+        )
+
+
+def create_lot(fields):
+    """Adds a lot and all of its spots to the current transaction. Returns the lot."""
+    lot = ParkingLot(**fields)
+    db.session.add(lot)
+    db.session.flush()  # Assigns lot.id without committing.
+    _insert_spots(lot.id, 1, lot.number_of_spots)
+    return lot
+
+
+def import_lots(lots):
+    """Adds many lots and their spots to the current transaction. Returns the new lot IDs."""
+    lot_ids = db.session.scalars(
+        insert(ParkingLot).returning(ParkingLot.id, sort_by_parameter_order=True),
+        lots
+    ).all()
+
+    spot_rows = [
+        {'lot_id': lot_id, 'spot_number': n}
+        for lot_id, fields in zip(lot_ids, lots)
+        for n in range(1, fields['number_of_spots'] + 1)
+    ]
+    if spot_rows:
+        db.session.execute(insert(ParkingSpot), spot_rows)
+    return lot_ids
+
+
+def resize_lot(lot, number_of_spots):
+    """Grows or shrinks a lot in place. Raises ValueError if it cannot shrink that far.
+
+    Growing brings back retired spots first (lowest numbers first), then adds new
+    spots after the highest spot number. Shrinking retires only free spots,
+    highest numbers first; occupied spots are never touched. A retired spot with
+    parking history is kept, marked 'retired', so its sessions stay in every
+    history; one without history is deleted.
+    """
+    if not 0 <= number_of_spots <= MAX_SPOTS_PER_LOT:
+        raise ValueError(f"'number_of_spots' must be between 0 and {MAX_SPOTS_PER_LOT}.")
+
+    change = number_of_spots - lot.number_of_spots
+    if change > 0:
+        revive = [
+            spot_id for (spot_id,) in db.session.query(ParkingSpot.id)
+                                                .filter_by(lot_id=lot.id, status='retired')
+                                                .order_by(ParkingSpot.spot_number)
+                                                .limit(change)
+        ]
+        if revive:
+            db.session.execute(
+                update(ParkingSpot)
+                .where(ParkingSpot.id.in_(revive))
+                .values(status='available')
+                .execution_options(synchronize_session=False)
+            )
+        highest = db.session.query(func.max(ParkingSpot.spot_number)).filter_by(lot_id=lot.id).scalar() or 0
+        _insert_spots(lot.id, highest + 1, change - len(revive))
+
+    elif change < 0:
+        retire = [
+            spot_id for (spot_id,) in db.session.query(ParkingSpot.id)
+                                                .filter_by(lot_id=lot.id, status='available')
+                                                .order_by(ParkingSpot.spot_number.desc())
+                                                .limit(-change)
+        ]
+        if len(retire) < -change:
+            raise ValueError(f"Cannot remove {-change} spots: only {len(retire)} are free.")
+
+        # Re-check the status in each statement, in case a booking just took one.
+        # Spots that sessions refer to are kept (retired), the rest are deleted.
+        has_history = exists().where(ParkingRecord.spot_id == ParkingSpot.id)
+        deleted = db.session.execute(
+            delete(ParkingSpot)
+            .where(ParkingSpot.id.in_(retire), ParkingSpot.status == 'available', ~has_history)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        retired = db.session.execute(
+            update(ParkingSpot)
+            .where(ParkingSpot.id.in_(retire), ParkingSpot.status == 'available')
+            .values(status='retired')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted + retired != len(retire):
+            raise ValueError("Some spots were booked while resizing. Please try again.")
+
+    lot.number_of_spots = number_of_spots
@@ -0,0 +1,175 @@
+from extensions import db
+from models import ParkingRecord, ParkingSpot, ParkingLot, User
+from sqlalchemy import and_, func, or_
+import base64
+import datetime
+
+# This file holds the shared read queries for parking history.
+# Every history view (admin, user, CSV export) goes through
+# here so the records, spots, lots and users are loaded in ONE joined SELECT
+# instead of one lookup per record.
+
+
+# -----------------
+# History Query
+# -----------------
+def history_query(user_id=None):
+    """Returns a joined query over ParkingRecord -> ParkingSpot -> ParkingLot -> User.
+
+    Each result is a lightweight row tuple (not an ORM object), so nothing is
+    added to the session identity map while iterating large histories.
+    """
+    query = db.session.query(
+        ParkingRecord.id.label('reservation_id'),
+        ParkingRecord.user_id,
+        User.username,
+        ParkingSpot.lot_id,
+        ParkingLot.prime_location_name.label('lot_name'),
+        ParkingSpot.spot_number,
+        ParkingRecord.parking_timestamp,
+        ParkingRecord.leaving_timestamp,
+        ParkingRecord.parking_cost
+    ).join(ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id)\
+     .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)\
+     .join(User, ParkingRecord.user_id == User.id)
+
+    if user_id is not None:
+        query = query.filter(ParkingRecord.user_id == user_id)
+
+    return query
+
+
+def duration_hours(start_column, end_column):
+    """A SQL expression for the hours between two timestamp columns, on SQLite or PostgreSQL."""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(end_column) - func.julianday(start_column)) * 24
+    return func.extract('epoch', end_column - start_column) / 3600
+
+
+def dialect_insert():
+    """The `insert` of the active database dialect, which supports ON CONFLICT (upserts)."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+# -----------------
+# Filtering & Keyset Pagination
+# -----------------
+# History pages are ordered newest first by (parking_timestamp, id). The cursor
+# handed back to the client encodes the last row of a page, and the next page
+# starts strictly after it, so even deep pages never use an OFFSET scan.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(parking_timestamp, record_id):
+    """Packs the (parking_timestamp, id) of a row into an opaque URL-safe token."""
+    raw = f"{parking_timestamp.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token):
+    """Unpacks a cursor token. Raises ValueError if the token is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        timestamp, record_id = raw.split('|')
+        return datetime.datetime.fromisoformat(timestamp), int(record_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+def _parse_datetime(value, name):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date. Use ISO format, e.g. 2025-07-01 or 2025-07-01T09:30:00.")
+
+
+def filter_history(query, args, allow_user_filter=False):
+    """Applies the lot, user, date range and active/closed filters from the query string."""
+    lot_id = args.get('lot_id', type=int)
+    if lot_id is not None:
+        query = query.filter(ParkingSpot.lot_id == lot_id)
+
+    # Only admins may look at another user's history.
+    if allow_user_filter:
+        user_id = args.get('user_id', type=int)
+        if user_id is not None:
+            query = query.filter(ParkingRecord.user_id == user_id)
+
+    if args.get('from'):
+        query = query.filter(ParkingRecord.parking_timestamp >= _parse_datetime(args['from'], 'from'))
+    if args.get('to'):
+        query = query.filter(ParkingRecord.parking_timestamp < _parse_datetime(args['to'], 'to'))
+
+    status = args.get('status')
+    if status == 'active':
+        query = query.filter(ParkingRecord.leaving_timestamp.is_(None))
+    elif status == 'closed':
+        query = query.filter(ParkingRecord.leaving_timestamp.isnot(None))
+    elif status:
+        raise ValueError("Invalid 'status'. Use 'active' or 'closed'.")
+
+    return query
+
+
+def paginate_history(query, limit=DEFAULT_PAGE_SIZE, after=None):
+    """Returns (rows, next_cursor) for one page of a history query, newest first."""
+    if after:
+        cursor_timestamp, cursor_id = decode_cursor(after)
+        query = query.filter(or_(
+            ParkingRecord.parking_timestamp < cursor_timestamp,
+            and_(ParkingRecord.parking_timestamp == cursor_timestamp, ParkingRecord.id < cursor_id)
+        ))
+
+    # Fetch one extra row to find out whether another page exists.
+    rows = query.order_by(ParkingRecord.parking_timestamp.desc(), ParkingRecord.id.desc())\
+                .limit(limit + 1)\
+                .all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.parking_timestamp, last.reservation_id)
+    return rows, next_cursor
+
+
+def history_page(args, user_id=None, include_username=False):
+    """Builds one serialized history page from the request's query string.
+
+    Raises ValueError with a client-facing message when a parameter is invalid.
+    """
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1:
+        raise ValueError("'limit' must be a positive integer.")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    query = filter_history(history_query(user_id=user_id), args, allow_user_filter=user_id is None)
+    rows, next_cursor = paginate_history(query, limit=limit, after=args.get('after'))
+
+    return {
+        'items': [serialize_history_row(row, include_username=include_username) for row in rows],
+        'next_cursor': next_cursor
+    }
+
+
+# -----------------
+# Serialization
+# -----------------
+def serialize_history_row(row, include_username=False):
+    """Converts one history row into the JSON shape used by the API."""
+    record_data = {
+        'reservation_id': row.reservation_id,
+        'lot_name': row.lot_name,
+        'spot_number': row.spot_number,
+        'parking_time': row.parking_timestamp.isoformat() if row.parking_timestamp else None,
+        'leaving_time': row.leaving_timestamp.isoformat() if row.leaving_timestamp else None,
+        'cost': row.parking_cost
+    }
+    if include_username:
+        record_data['username'] = row.username
+    return record_data
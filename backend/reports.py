@@ -0,0 +1,140 @@
+from extensions import db, redis_client
+from models import ParkingRecord, ParkingSpot, ParkingLot, User
+from queries import duration_hours
+from sqlalchemy import func
+from flask import current_app
+from functools import lru_cache
+
+# This file builds the monthly activity reports.
+#
+# All users' figures come from ONE grouped query (per user and lot), so the cost
+# no longer grows with users x records round trips. The reports are then split
+# into batches that Celery renders and sends in parallel (see tasks.py and
+# mailer.py).
+#
+# Each run is identified by its reporting period (e.g. "2025-07"). Just before
+# a user's email is sent it takes a short lease in Redis, and once the server has
+# accepted it the user is checked off in a set of sent reports. A crashed or
+# repeated run for the same period skips everyone checked off; a report that was
+# in flight when a worker died is sent again once its lease runs out.
+
+CHECKPOINT_TTL = 40 * 24 * 3600   # Keep the checkpoint until the period is long over.
+SEND_LEASE = 300                  # Seconds a report being sent stays claimed.
+
+
+def _sent_key(period):
+    return f"reports:{period}:sent"
+
+
+def _lease_key(period, user_id):
+    return f"reports:{period}:sending:{user_id}"
+
+
+# -----------------
+# Aggregation
+# -----------------
+def monthly_reports(start, end):
+    """Returns one report dict per user with completed parkings in [start, end)."""
+    hours = duration_hours(ParkingRecord.parking_timestamp, ParkingRecord.leaving_timestamp)
+    rows = db.session.query(
+        ParkingRecord.user_id,
+        User.username,
+        ParkingLot.id,
+        ParkingLot.prime_location_name,
+        func.count(ParkingRecord.id),
+        func.coalesce(func.sum(ParkingRecord.parking_cost), 0),
+        func.coalesce(func.sum(hours), 0)
+    ).join(ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id)\
+     .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)\
+     .join(User, ParkingRecord.user_id == User.id)\
+     .filter(
+        User.role == 'user',
+        ParkingRecord.leaving_timestamp.isnot(None),
+        ParkingRecord.parking_timestamp >= start,
+        ParkingRecord.parking_timestamp < end
+     )\
+     .group_by(ParkingRecord.user_id, User.username, ParkingLot.id, ParkingLot.prime_location_name)\
+     .order_by(ParkingRecord.user_id, ParkingLot.prime_location_name)\
+     .all()
+
+    # Fold the per-(user, lot) rows into one report per user.
+    reports = {}
+    for user_id, username, lot_id, lot_name, parkings, spent, lot_hours in rows:
+        report = reports.setdefault(user_id, {
+            'user_id': user_id,
+            'username': username,
+            'total_spent': 0,
+            'total_parkings': 0,
+            'total_hours': 0,
+            'lots': []
+        })
+        report['total_spent'] += spent
+        report['total_parkings'] += parkings
+        report['total_hours'] += lot_hours
+        report['lots'].append({
+            'lot_id': lot_id,
+            'lot_name': lot_name,
+            'parkings': parkings,
+            'hours': round(lot_hours, 2),
+            'cost': round(spent, 2)
+        })
+    return list(reports.values())
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# -----------------
+# Rendering
+# -----------------
+@lru_cache(maxsize=1)
+def _report_template():
+    # Compiled once per worker process instead of on every email.
+    return current_app.jinja_env.get_template('report.html')
+
+
+def render_report(report, reporting_period):
+    return _report_template().render(reporting_period=reporting_period, **report)
+
+
+# -----------------
+# Checkpoints
+# -----------------
+class ReportCheckpoint:
+    """Checks users off, one message at a time, as `mailer.deliver` sends their reports."""
+
+    def __init__(self, period):
+        self.period = period
+
+    def claim(self, user_id):
+        """Leases a user's report for sending. False if it was sent or is being sent."""
+        lease = _lease_key(self.period, user_id)
+        # One transaction: once the lease is ours, a report sent by another
+        # worker is already in the set (it is added before the lease is dropped).
+        pipe = redis_client.pipeline()
+        pipe.set(lease, 1, nx=True, ex=SEND_LEASE)
+        pipe.sismember(_sent_key(self.period), user_id)
+        leased, sent = pipe.execute()
+        if leased and sent:
+            redis_client.delete(lease)
+        return bool(leased) and not sent
+
+    def done(self, user_id):
+        """Records that a user's report was accepted by the mail server."""
+        pipe = redis_client.pipeline()
+        pipe.sadd(_sent_key(self.period), user_id)
+        pipe.expire(_sent_key(self.period), CHECKPOINT_TTL)
+        pipe.delete(_lease_key(self.period, user_id))
+        pipe.execute()
+
+    def release(self, user_id):
+        """Drops the lease when sending failed, so a retry can send the report."""
+        redis_client.delete(_lease_key(self.period, user_id))
+
+
+def pending_reports(period, reports):
+    """Drops the reports already sent in an earlier (crashed or repeated) run."""
+    sent = redis_client.smembers(_sent_key(period))
+    return [report for report in reports if str(report['user_id']) not in sent]
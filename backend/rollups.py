@@ -0,0 +1,149 @@
+from extensions import db
+from models import ParkingRecord, ParkingSpot, ParkingLot, RevenueRollup
+from queries import dialect_insert, duration_hours
+from sqlalchemy import Date, cast, delete, func, insert, select
+import datetime
+
+# This file maintains the per-lot, per-day revenue rollup behind /api/admin/revenue.
+#
+# `release_spot` adds each finished session to its (lot_id, day) row in the same
+# transaction that finalizes the cost, so revenue queries read a table whose size
+# is lots x days instead of summing the whole ParkingRecord history.
+#
+# It does so only after its conditional UPDATE has closed the session, so a
+# retried or concurrent release never counts the same session twice.
+#
+# Rebuild from scratch (from the backend folder):  python3 rollups.py
+
+BUCKETS = ('day', 'week', 'month')
+
+
+# -----------------
+# Incremental Update
+# -----------------
+def record_session(lot_id, left_at, cost, minutes):
+    """Adds one finished session to its lot's rollup row. Call inside the release transaction."""
+    statement = dialect_insert()(RevenueRollup).values(
+        lot_id=lot_id,
+        day=left_at.date(),
+        revenue=cost,
+        sessions=1,
+        total_minutes=minutes
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[RevenueRollup.lot_id, RevenueRollup.day],
+        set_={
+            'revenue': RevenueRollup.revenue + statement.excluded.revenue,
+            'sessions': RevenueRollup.sessions + 1,
+            'total_minutes': RevenueRollup.total_minutes + statement.excluded.total_minutes
+        }
+    ))
+
+
+# -----------------
+# Backfill / Rebuild
+# -----------------
+def _day(column):
+    if db.engine.dialect.name == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def rebuild(conn):
+    """Recomputes the whole rollup table from ParkingRecord. Returns the number of rows."""
+    day = _day(ParkingRecord.leaving_timestamp).label('day')
+    minutes = duration_hours(ParkingRecord.parking_timestamp, ParkingRecord.leaving_timestamp) * 60
+    rows = conn.execute(
+        select(
+            ParkingSpot.lot_id,
+            day,
+            func.coalesce(func.sum(ParkingRecord.parking_cost), 0),
+            func.count(ParkingRecord.id),
+            func.coalesce(func.sum(minutes), 0)
+        ).join(ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id)
+         .where(ParkingRecord.parking_cost.isnot(None), ParkingRecord.leaving_timestamp.isnot(None))
+         .group_by(ParkingSpot.lot_id, day)
+    ).all()
+
+    conn.execute(delete(RevenueRollup))
+    if rows:
+        conn.execute(insert(RevenueRollup), [
+            {
+                'lot_id': lot_id,
+                # SQLite returns the day as an ISO string.
+                'day': datetime.date.fromisoformat(day) if isinstance(day, str) else day,
+                'revenue': revenue,
+                'sessions': sessions,
+                'total_minutes': total_minutes
+            }
+            for lot_id, day, revenue, sessions, total_minutes in rows
+        ])
+    return len(rows)
+
+
+# -----------------
+# Queries
+# -----------------
+def _bucket(bucket):
+    """A SQL expression mapping a rollup day to the first day of its bucket."""
+    if bucket == 'day':
+        return RevenueRollup.day
+    if db.engine.dialect.name == 'sqlite':
+        if bucket == 'week':
+            # The Monday on or before the day.
+            return func.date(RevenueRollup.day, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-01', RevenueRollup.day)
+    return cast(func.date_trunc(bucket, RevenueRollup.day), Date)
+
+
+def revenue(start=None, end=None, bucket=None):
+    """Returns revenue per lot over [start, end), optionally split into day/week/month buckets.
+
+    Reads only the rollup table, so the cost is proportional to lots x buckets.
+    """
+    columns = [
+        ParkingLot.id,
+        ParkingLot.prime_location_name,
+        func.sum(RevenueRollup.revenue),
+        func.sum(RevenueRollup.sessions),
+        func.sum(RevenueRollup.total_minutes)
+    ]
+    group_by = [ParkingLot.id, ParkingLot.prime_location_name]
+    if bucket:
+        period = _bucket(bucket).label('period')
+        columns.insert(0, period)
+        group_by.insert(0, period)
+
+    query = db.session.query(*columns).join(ParkingLot, RevenueRollup.lot_id == ParkingLot.id)
+    if start:
+        query = query.filter(RevenueRollup.day >= start)
+    if end:
+        query = query.filter(RevenueRollup.day < end)
+    query = query.group_by(*group_by).order_by(*group_by)
+
+    output = []
+    for row in query:
+        if bucket:
+            period, row = row[0], row[1:]
+        lot_id, lot_name, total_revenue, sessions, minutes = row
+        item = {
+            'lot_id': lot_id,
+            'lot_name': lot_name,
+            'total_revenue': round(total_revenue, 2) if total_revenue else 0,
+            'sessions': sessions,
+            'total_minutes': round(minutes or 0, 1)
+        }
+        if bucket:
+            item['period'] = period if isinstance(period, str) else period.isoformat()
+        output.append(item)
+    return output
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            print(f"Rebuilt revenue rollup: {rebuild(conn)} (lot, day) rows.")
@@ -1,9 +1,18 @@
 from flask import request, jsonify, Blueprint
-from models import User, ParkingRecord, ParkingSpot, ParkingLot
-from extensions import db
-from flask_jwt_extended import jwt_required
+from models import User, ParkingLot
+from extensions import db, celery, read_only, stick_to_primary
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from decorators import admin_required
-from sqlalchemy import func
+from queries import history_page
+from cache import cache_stats
+from user_cache import set_user_role
+from exporter import register_export
+from rollups import BUCKETS, revenue
+from analytics import occupancy_curve, usage_summary
+from mailer import recent_runs
+from tariffs import parse_schedule, reprice
+from user_search import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, invalidate_search, search_users
+import datetime
 
 # This Blueprint handles all routes that are exclusive to the admin role.
 admin_bp = Blueprint('admin_bp', __name__)
@@ -11,73 +20,171 @@ admin_bp = Blueprint('admin_bp', __name__)
 @admin_bp.route('/users', methods=['GET'])
 @jwt_required()
 @admin_required()
+@read_only
 def get_all_users():
-    """Returns a list of all registered users in the system."""
-    # Check for a search query parameter in the URL.
-    search_username = request.args.get('username')
-    
-    query = User.query
-    
-    if search_username:
-        # If a search query exists, filter the users by username (case-insensitive).
-        query = query.filter(User.username.ilike(f'%{search_username}%'))
-        
-    users = query.all()
-    output = []
-    for user in users:
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'role': user.role
-        
-        }
-        output.append(user_data)
+    """Returns one page of registered users, optionally searched by `username`.
+
+    Usernames starting with the search term come first, then those containing
+    it. Supports `limit`/`after` cursor paging.
+    """
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({"message": "'limit' must be a positive integer."}), 400
+
+    try:
+        page = search_users(request.args.get('username'), request.args.get('after'), min(limit, MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     
-    return jsonify({'users': output})
+    return jsonify(page)
+
+@admin_bp.route('/users/<int:user_id>/role', methods=['PUT'])
+@jwt_required()
+@admin_required()
+def update_user_role(user_id):
+    """Changes a user's role. Tokens carrying the old role are revoked."""
+    role = (request.get_json() or {}).get('role')
+    if role not in ('user', 'admin'):
+        return jsonify({"message": "Role must be 'user' or 'admin'."}), 400
+
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    set_user_role(user, role)
+    invalidate_search()
+    stick_to_primary(get_jwt_identity())
+    return jsonify({"message": f"User '{user.username}' is now an {role}."})
 
 @admin_bp.route('/reservations', methods=['GET'])
 @jwt_required()
 @admin_required()
+@read_only
 def get_all_reservations():
-    """Returns a complete history of all parking records from all users."""
-    reservations = ParkingRecord.query.order_by(ParkingRecord.parking_timestamp.desc()).all()
-    output = []
-    for record in reservations:
-        user = User.query.get(record.user_id)
-        spot = ParkingSpot.query.get(record.spot_id)
-        lot = ParkingLot.query.get(spot.lot_id)
-        record_data = {
-            'reservation_id': record.id,
-            'username': user.username,
-            'lot_name': lot.prime_location_name,
-            'spot_number': spot.spot_number,
-            'parking_time': record.parking_timestamp.isoformat() if record.parking_timestamp else None,
-            'leaving_time': record.leaving_timestamp.isoformat() if record.leaving_timestamp else None,
-            'cost': record.parking_cost
-        }
-        output.append(record_data)
+    """Returns one page of the parking history of all users, newest first.
+
+    Supports `limit`/`after` cursor paging and `lot_id`, `user_id`, `from`, `to`
+    and `status` (active/closed) filters.
+    """
+    try:
+        page = history_page(request.args, include_username=True)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     
-    return jsonify({'reservations': output})
+    return jsonify({'reservations': page['items'], 'next_cursor': page['next_cursor']})
+
+@admin_bp.route('/export-csv', methods=['POST'])
+@jwt_required()
+@admin_required()
+def export_all_csv():
+    """Triggers a background export of every user's parking history.
+
+    Progress and the finished file are served by /api/user/exports/<task_id>.
+    """
+    task = celery.send_task('tasks.export_all_history_task')
+    register_export(task.id, get_jwt_identity())
+    return jsonify({"message": "Full history export has started.", "task_id": task.id}), 202
 
 @admin_bp.route('/revenue', methods=['GET'])
 @jwt_required()
 @admin_required()
+@read_only
 def get_revenue_summary():
-    """Calculates and returns the total revenue generated by each parking lot."""
-    # This is an aggregate query that joins multiple tables and sums the costs.
-    revenue_data = db.session.query(
-        ParkingLot.prime_location_name,
-        func.sum(ParkingRecord.parking_cost).label('total_revenue')
-    ).join(ParkingSpot, ParkingLot.id == ParkingSpot.lot_id)\
-     .join(ParkingRecord, ParkingSpot.id == ParkingRecord.spot_id)\
-     .filter(ParkingRecord.parking_cost.isnot(None))\
-     .group_by(ParkingLot.prime_location_name)\
-     .all()
-     
-    output = []
-    for lot_name, total_revenue in revenue_data:
-        output.append({
-            'lot_name': lot_name,
-            'total_revenue': round(total_revenue, 2) if total_revenue else 0
-        })
-    return jsonify({'revenue_summary': output})
\ No newline at end of file
+    """Returns the revenue generated by each parking lot, read from the daily rollup.
+
+    Optional `from`/`to` (ISO dates, `to` exclusive) limit the range, and
+    `bucket` (day/week/month) splits each lot's revenue into periods.
+    """
+    try:
+        start = datetime.date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"message": "Invalid date. Use ISO format, e.g. 2025-07-01."}), 400
+
+    bucket = request.args.get('bucket')
+    if bucket and bucket not in BUCKETS:
+        return jsonify({"message": f"Invalid 'bucket'. Use one of: {', '.join(BUCKETS)}."}), 400
+
+    output = revenue(start=start, end=end, bucket=bucket)
+    if bucket:
+        return jsonify({'revenue_series': output})
+    return jsonify({'revenue_summary': output})
+
+def _analytics_range(default_days):
+    """Reads the `from`/`to` query parameters, defaulting to the last `default_days` days."""
+    end = datetime.datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.datetime.utcnow()
+    start = datetime.datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - datetime.timedelta(days=default_days)
+    if start >= end:
+        raise ValueError("'from' must be before 'to'.")
+    return start, end
+
+@admin_bp.route('/lots/<int:lot_id>/reprice', methods=['POST'])
+@jwt_required()
+@admin_required()
+@read_only
+def reprice_lot_sessions(lot_id):
+    """Reprices a lot's closed sessions and compares the result with what was charged.
+
+    The optional JSON body may give a `schedule` to price them under instead of
+    the lot's tariff (a what-if), and `from`/`to` (ISO dates or times, `to`
+    exclusive) to limit the sessions by when they ended. Nothing is changed.
+    """
+    lot = db.session.get(ParkingLot, lot_id)
+    if not lot:
+        return jsonify({"message": "Parking lot not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        start = datetime.datetime.fromisoformat(data['from']) if data.get('from') else None
+        end = datetime.datetime.fromisoformat(data['to']) if data.get('to') else None
+        schedule = parse_schedule(data['schedule']) if data.get('schedule') is not None else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": str(e)}), 400
+
+    return jsonify(reprice(lot, schedule=schedule, start=start, end=end))
+
+@admin_bp.route('/analytics/lots/<int:lot_id>/occupancy', methods=['GET'])
+@jwt_required()
+@admin_required()
+@read_only
+def get_lot_occupancy(lot_id):
+    """Returns the hour-by-hour occupancy curve of a lot (default: the last 7 days)."""
+    lot = db.session.get(ParkingLot, lot_id)
+    if not lot:
+        return jsonify({"message": "Parking lot not found"}), 404
+    try:
+        start, end = _analytics_range(default_days=7)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    return jsonify({'lot_id': lot.id, 'occupancy': occupancy_curve(lot, start, end)})
+
+@admin_bp.route('/analytics/lots/<int:lot_id>/usage', methods=['GET'])
+@jwt_required()
+@admin_required()
+@read_only
+def get_lot_usage(lot_id):
+    """Returns peak hours, average dwell time and turnover of a lot (default: the last 30 days)."""
+    lot = db.session.get(ParkingLot, lot_id)
+    if not lot:
+        return jsonify({"message": "Parking lot not found"}), 404
+    try:
+        start, end = _analytics_range(default_days=30)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    return jsonify(usage_summary(lot, start, end))
+
+@admin_bp.route('/cache-stats', methods=['GET'])
+@jwt_required()
+@admin_required()
+def get_cache_stats():
+    """Returns the lot cache hit/miss counters of the process serving this request."""
+    return jsonify({'cache_stats': cache_stats()})
+
+@admin_bp.route('/mail-runs', methods=['GET'])
+@jwt_required()
+@admin_required()
+def get_mail_runs():
+    """Returns the delivery counts of the latest reminder and report email runs."""
+    return jsonify({'mail_runs': recent_runs()})
\ No newline at end of file
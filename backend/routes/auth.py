@@ -1,27 +1,47 @@
 from flask import request, jsonify, Blueprint
 from models import User
 from extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
+from user_cache import get_user, revoke_token
+from user_search import index_user, invalidate_search
+from passwords import RETRY_AFTER, HashingBusy, hash_password, needs_rehash, verify_password
+import login_throttle
 
 # This Blueprint handles all authentication-related routes.
 auth_bp = Blueprint('auth_bp', __name__)
 
+def _busy():
+    # The password hashing pool is full; ask the client to come back shortly.
+    return jsonify({"message": "The server is busy, please try again shortly."}), 503, {'Retry-After': str(RETRY_AFTER)}
+
+def _throttled(wait):
+    return jsonify({"message": "Too many attempts, please try again later."}), 429, {'Retry-After': str(wait)}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Registers a new user."""
     data = request.get_json()
 
+    wait = login_throttle.check_ip(request.remote_addr)
+    if wait:
+        return _throttled(wait)
+
     # Prevent duplicate usernames.
     if User.query.filter_by(username=data['username']).first():
         return jsonify({"message": "Username already exists"}), 409
 
     # Hash the password for security before storing it.
-    hashed_password = generate_password_hash(data['password'])
+    try:
+        hashed_password = hash_password(data['password'])
+    except HashingBusy:
+        return _busy()
     new_user = User(username=data['username'], password=hashed_password, role='user')
     
     db.session.add(new_user)
+    db.session.flush()
+    index_user(new_user)
     db.session.commit()
+    invalidate_search()
 
     return jsonify({"message": "User registered successfully"}), 201
 
@@ -32,24 +52,50 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
+    # Refuse before hashing anything if this client or account is being hammered.
+    wait = login_throttle.check_ip(request.remote_addr) or login_throttle.check_user(username or '')
+    if wait:
+        return _throttled(wait)
+
     user = User.query.filter_by(username=username).first()
 
     # Verify the user exists and the password is correct.
-    if not user or not check_password_hash(user.password, password):
+    try:
+        valid = user is not None and verify_password(user.password, password)
+    except HashingBusy:
+        return _busy()
+    if not valid:
+        login_throttle.record_failure(username or '')
         return jsonify({"message": "Invalid credentials"}), 401
+    login_throttle.record_success(username)
+
+    # Upgrade a hash made with older cost parameters while the password is at hand.
+    if needs_rehash(user.password):
+        try:
+            user.password = hash_password(password)
+            db.session.commit()
+        except HashingBusy:
+            pass  # Not urgent; it is upgraded on a later login.
 
     # Create and return an access token for the authenticated user.
-    access_token = create_access_token(identity=str(user.id))
+    # The role is added as a claim so admin checks need no database lookup.
+    access_token = create_access_token(identity=str(user.id), additional_claims={'role': user.role})
     return jsonify(access_token=access_token)
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def profile():
     """Returns the profile information (role) for the currently logged-in user."""
-    user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
+    user = get_user(get_jwt_identity())
     
     if user:
-        return jsonify(username=user.username, role=user.role)
+        return jsonify(username=user['username'], role=user['role'])
     
-    return jsonify({"message": "User not found"}), 404
\ No newline at end of file
+    return jsonify({"message": "User not found"}), 404
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """Revokes the access token used for this request."""
+    revoke_token(get_jwt()['jti'])
+    return jsonify({"message": "Logged out successfully"})
\ No newline at end of file
@@ -1,8 +1,16 @@
 from flask import request, jsonify, Blueprint
-from models import ParkingLot, ParkingSpot
-from extensions import db, redis_client
+from models import ParkingLot, ParkingSpot, RevenueRollup, LotOccupancyHour, LotTariff
+from extensions import db
 from flask_jwt_extended import jwt_required
 from decorators import admin_required
+from allocator import UNAVAILABLE, forget_lot, reconcile_lot
+from provisioning import parse_lot, parse_coordinates, parse_import, create_lot, import_lots, resize_lot
+from cache import invalidate_lot, invalidate_lot_list
+from events import lot_changed
+from lot_search import index_lot, unindex_lot
+from tariffs import parse_schedule
+import json
+import spot_map
 
 # This Blueprint handles all CRUD operations for ParkingLots.
 lot_bp = Blueprint('lot_bp', __name__)
@@ -14,28 +22,21 @@ lot_bp = Blueprint('lot_bp', __name__)
 def handle_lots():
     # POST: Creates a new parking lot and its associated spots.
     if request.method == 'POST':
-        data = request.get_json()
-
-        new_lot = ParkingLot(
-            prime_location_name=data['prime_location_name'],
-            price=data['price'],
-            address=data['address'],
-            pin_code=data['pin_code'],
-            number_of_spots=data['number_of_spots']
-        )
-        db.session.add(new_lot)
-        db.session.commit() 
-
-        # Automatically generate the number of spots specified by the admin.
-        for i in range(1, new_lot.number_of_spots + 1):
-            new_spot = ParkingSpot(lot_id=new_lot.id, spot_number=i)
-            db.session.add(new_spot)
+        try:
+            fields = parse_lot(request.get_json() or {})
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
 
+        # The lot and all of its spots are written in one transaction,
+        # with the spots inserted in bulk.
+        new_lot = create_lot(fields)
         db.session.commit()
         
         # --- Cache Invalidation ---
-        # Deletes the cached list of lots because the data is now outdated.
-        redis_client.delete("all_lots")
+        # A lot was added, so the cached list of lot IDs is now outdated.
+        invalidate_lot_list()
+        index_lot(new_lot)
+        lot_changed(new_lot.id, 'created')
 
         return jsonify({"message": f"Parking lot '{new_lot.prime_location_name}' created successfully"}), 201
 
@@ -50,24 +51,81 @@ def handle_lots():
                 'price': lot.price,
                 'address': lot.address,
                 'pin_code': lot.pin_code,
-                'number_of_spots': lot.number_of_spots
+                'latitude': lot.latitude,
+                'longitude': lot.longitude,
+                'number_of_spots': lot.number_of_spots,
+                'occupied_spots': lot.occupied_spots,
+                'available_spots': lot.number_of_spots - lot.occupied_spots
             }
             output.append(lot_data)
 
         return jsonify({'lots': output})
 
+# This route provisions many lots at once from a JSON list or a CSV file.
+@lot_bp.route('/lots/import', methods=['POST'])
+@jwt_required()
+@admin_required()
+def import_lots_route():
+    try:
+        lots = parse_import(request)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # All lots and spots are created in a single transaction: all or nothing.
+    lot_ids = import_lots(lots)
+    db.session.commit()
+
+    # --- Cache Invalidation ---
+    invalidate_lot_list()
+    for lot in ParkingLot.query.filter(ParkingLot.id.in_(lot_ids)):
+        index_lot(lot)
+    for lot_id in lot_ids:
+        lot_changed(lot_id, 'created')
+
+    return jsonify({
+        "message": f"{len(lot_ids)} parking lots imported successfully",
+        "lot_ids": lot_ids,
+        "spots_created": sum(lot['number_of_spots'] for lot in lots)
+    }), 201
+
 # This route handles requests for a single, specific lot by its ID.
 @lot_bp.route('/lots/<int:lot_id>', methods=['GET', 'PUT', 'DELETE'])
 @jwt_required()
 @admin_required()
 def handle_specific_lot(lot_id):
-    lot = ParkingLot.query.get(lot_id)
+    lot = db.session.get(ParkingLot, lot_id)
     if not lot:
         return jsonify({"message": "Parking lot not found"}), 404
 
     # GET: Returns detailed information for one lot, including the status of all its spots.
+    # `format=compact` returns the statuses as a paged 2-bit map instead (see spot_map.py).
     if request.method == 'GET':
-        spots = ParkingSpot.query.filter_by(lot_id=lot_id).all()
+        if request.args.get('format') == 'compact':
+            try:
+                first = int(request.args.get('from', 1))
+                limit = int(request.args.get('limit', spot_map.PAGE_SIZE))
+            except ValueError:
+                return jsonify({"message": "'from' and 'limit' must be whole numbers."}), 400
+            if first < 1 or not 1 <= limit <= spot_map.MAX_PAGE_SIZE:
+                return jsonify({"message": f"'from' must be at least 1 and 'limit' between 1 and {spot_map.MAX_PAGE_SIZE}."}), 400
+
+            return jsonify({
+                'id': lot.id,
+                'prime_location_name': lot.prime_location_name,
+                'price': lot.price,
+                'address': lot.address,
+                'pin_code': lot.pin_code,
+                'number_of_spots': lot.number_of_spots,
+                'occupied_spots': lot.occupied_spots,
+                'spot_map': {
+                    'bits_per_spot': 2,
+                    'legend': spot_map.LEGEND,
+                    **spot_map.read_page(lot.id, first, limit)
+                }
+            })
+
+        # Retired spots are only kept for their history (see provisioning.resize_lot).
+        spots = ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'retired').all()
         spots_output = []
         for spot in spots:
             spots_output.append({
@@ -94,26 +152,95 @@ def handle_specific_lot(lot_id):
         lot.price = data.get('price', lot.price)
         lot.address = data.get('address', lot.address)
         lot.pin_code = data.get('pin_code', lot.pin_code)
+        if 'latitude' in data or 'longitude' in data:
+            try:
+                lot.latitude, lot.longitude = parse_coordinates(data)
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({"message": str(e)}), 400
+
+        # Resizing adds spots in bulk, or retires free spots only.
+        resized = 'number_of_spots' in data and data['number_of_spots'] != lot.number_of_spots
+        if resized:
+            try:
+                resize_lot(lot, int(data['number_of_spots']))
+            except (TypeError, ValueError) as e:
+                db.session.rollback()
+                return jsonify({"message": str(e)}), 400
         db.session.commit()
+
+        # The free-spot pool and the spot map must match the new set of spots.
+        if resized:
+            reconcile_lot(lot_id)
         
         # --- Cache Invalidation ---
-        redis_client.delete("all_lots")
+        # Only this lot's cached details are outdated.
+        invalidate_lot(lot_id)
+        index_lot(lot)
+        lot_changed(lot_id, 'updated')
         
         return jsonify({"message": "Parking lot updated successfully"})
 
     # DELETE: Deletes a specific lot and all its spots.
     elif request.method == 'DELETE':
-        # Rule: Cannot delete a lot if any of its spots are currently occupied.
-        occupied_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='occupied').first()
+        # Rule: Cannot delete a lot if any of its spots are currently occupied or held.
+        occupied_spot = ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status.in_(UNAVAILABLE)).first()
         if occupied_spot:
-            return jsonify({"message": "Cannot delete lot. At least one spot is currently occupied."}), 400
+            return jsonify({"message": "Cannot delete lot. At least one spot is currently occupied or held."}), 400
 
-        # Delete all associated spots first, then the lot itself.
+        # Delete all associated spots and analytics first, then the lot itself.
         ParkingSpot.query.filter_by(lot_id=lot_id).delete()
+        RevenueRollup.query.filter_by(lot_id=lot_id).delete()
+        LotOccupancyHour.query.filter_by(lot_id=lot_id).delete()
+        LotTariff.query.filter_by(lot_id=lot_id).delete()
         db.session.delete(lot)
         db.session.commit()
+        forget_lot(lot_id)
+        spot_map.forget(lot_id)
+        unindex_lot(lot_id)
         
         # --- Cache Invalidation ---
-        redis_client.delete("all_lots")
+        invalidate_lot(lot_id)
+        invalidate_lot_list()
+        lot_changed(lot_id, 'deleted')
         
-        return jsonify({"message": f"Parking lot '{lot.prime_location_name}' and its spots have been deleted."})
\ No newline at end of file
+        return jsonify({"message": f"Parking lot '{lot.prime_location_name}' and its spots have been deleted."})
+
+# This route manages a lot's tariff: time-of-day rates, grace period, minimum charge and daily cap.
+# Without one, the lot charges its flat hourly price (see tariffs.py).
+@lot_bp.route('/lots/<int:lot_id>/tariff', methods=['GET', 'PUT', 'DELETE'])
+@jwt_required()
+@admin_required()
+def handle_lot_tariff(lot_id):
+    lot = db.session.get(ParkingLot, lot_id)
+    if not lot:
+        return jsonify({"message": "Parking lot not found"}), 404
+    tariff = db.session.get(LotTariff, lot_id)
+
+    # GET: Returns the lot's schedule (null if it charges the flat price).
+    if request.method == 'GET':
+        return jsonify({
+            'lot_id': lot.id,
+            'price': lot.price,
+            'schedule': json.loads(tariff.schedule) if tariff else None
+        })
+
+    # PUT: Sets or replaces the lot's schedule. It applies to sessions released from now on.
+    elif request.method == 'PUT':
+        try:
+            schedule = parse_schedule(request.get_json())
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        if tariff:
+            tariff.schedule = json.dumps(schedule)
+        else:
+            db.session.add(LotTariff(lot_id=lot.id, schedule=json.dumps(schedule)))
+        db.session.commit()
+        return jsonify({"message": "Tariff updated successfully", 'schedule': schedule})
+
+    # DELETE: Goes back to the flat hourly price.
+    elif request.method == 'DELETE':
+        if tariff:
+            db.session.delete(tariff)
+            db.session.commit()
+        return jsonify({"message": "Tariff removed; the lot charges its flat hourly price."})
\ No newline at end of file
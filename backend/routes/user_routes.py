@@ -1,9 +1,21 @@
-from flask import request, jsonify, Blueprint
-from models import ParkingLot, ParkingSpot, ParkingRecord, User
-from extensions import db, redis_client, celery
+from flask import request, jsonify, Blueprint, send_file
+from models import ParkingLot, ParkingSpot, ParkingRecord, SpotHold, User
+from extensions import db, celery, replica_reads, stick_to_primary
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import json
+from queries import history_page
+from allocator import claim_spot, vacate_spot, return_spot, lot_availability
+from cache import get_lots, invalidate_availability
+from exporter import register_export, export_owner, export_path
+from idempotency import idempotent
+from holds import parse_minutes, place_hold, schedule_expiry, convert_hold, cancel_hold, forget_hold, expire_holds, finish_expiry
+from rollups import record_session
+from tariffs import tariff_for
+from events import spot_changed
+from lot_search import SORTS, MAX_LIMIT, MAX_RADIUS_KM, DEFAULT_LIMIT, DEFAULT_RADIUS_KM, search_lots
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 import datetime
+import os
 
 # This Blueprint handles all routes for a regular, logged-in user.
 user_bp = Blueprint('user_bp', __name__)
@@ -12,38 +24,59 @@ user_bp = Blueprint('user_bp', __name__)
 @jwt_required()
 def get_available_lots():
     """Returns a list of all available parking lots, using a cache for performance."""
-    cache_key = "all_lots"
-    # First, attempt to retrieve the list of lots from the Redis cache.
-    cached_lots = redis_client.get(cache_key)
-
-    if cached_lots:
-        # If found in cache, return the cached data immediately.
-        return jsonify({'lots': json.loads(cached_lots)})
-
-    # If not in cache, query the main database.
-    lots = ParkingLot.query.all()
-    output = []
-    for lot in lots:
-        lot_data = {
-            'id': lot.id,
-            'prime_location_name': lot.prime_location_name,
-            'price': lot.price,
-            'address': lot.address,
-            'pin_code': lot.pin_code,
-            'number_of_spots': lot.number_of_spots
-        }
-        output.append(lot_data)
-
-    # Store the fresh data in the cache for 1 hour (3600 seconds).
-    redis_client.setex(cache_key, 3600, json.dumps(output))
-
-    return jsonify({'lots': output})
+    # Lot details come from the in-process/Redis cache, and the live
+    # availability counters are cached separately (see cache.py).
+    return jsonify({'lots': get_lots()})
+
+
+@user_bp.route('/lots/search', methods=['GET'])
+@jwt_required()
+def search_available_lots():
+    """Returns the best lots near `lat`/`lng` and/or matching a pin code or address prefix `q`.
+
+    Optional: `radius_km` (default 5), `min_free` (default 1), `limit` (default 10)
+    and `sort` (best/distance/price/availability).
+    """
+    args = request.args
+    try:
+        latitude = float(args['lat']) if args.get('lat') else None
+        longitude = float(args['lng']) if args.get('lng') else None
+        radius_km = float(args.get('radius_km', DEFAULT_RADIUS_KM))
+        min_free = int(args.get('min_free', 1))
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"message": "'lat', 'lng', 'radius_km', 'min_free' and 'limit' must be numbers."}), 400
+
+    query = (args.get('q') or '').strip()
+    sort = args.get('sort', 'best')
+    if (latitude is None) != (longitude is None):
+        return jsonify({"message": "Give both 'lat' and 'lng', or neither."}), 400
+    if latitude is None and not query:
+        return jsonify({"message": "Give 'lat' and 'lng', or a pin code/address prefix 'q'."}), 400
+    if not 0 < radius_km <= MAX_RADIUS_KM or not 1 <= limit <= MAX_LIMIT or min_free < 0:
+        return jsonify({"message": f"'radius_km' must be in (0, {MAX_RADIUS_KM}], 'limit' in [1, {MAX_LIMIT}] and 'min_free' at least 0."}), 400
+    if sort not in SORTS:
+        return jsonify({"message": f"Invalid 'sort'. Use one of: {', '.join(SORTS)}."}), 400
+
+    lots = search_lots(latitude, longitude, radius_km, query, min_free, sort, limit)
+    return jsonify({'lots': lots})
+
+
+@user_bp.route('/lots/availability', methods=['GET'])
+@jwt_required()
+def get_lot_availability():
+    """Returns only the live occupied/available counters of every lot."""
+    return jsonify({'availability': lot_availability()})
 
 
 @user_bp.route('/reservations', methods=['GET', 'POST'])
 @jwt_required()
+@idempotent
 def handle_reservations():
-    """Handles creating a new reservation and fetching the user's history."""
+    """Handles creating a new reservation and fetching the user's history.
+
+    Bookings may carry an `Idempotency-Key` header, so a client can safely retry them.
+    """
     user_id = get_jwt_identity()
 
     # POST: Creates a new parking reservation for the user.
@@ -52,25 +85,54 @@ def handle_reservations():
         lot_id = data.get('lot_id')
 
         # Rule: A user cannot have more than one active reservation at a time.
+        # This check is the fast path; the unique index on active sessions
+        # catches bookings that race past it.
         active_reservation = ParkingRecord.query.filter_by(user_id=user_id, leaving_timestamp=None).first()
         if active_reservation:
             return jsonify({"message": "You already have an active parking reservation."}), 409
 
-        # Find the first available spot in the selected lot.
-        available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='available').first()
+        # A user holding a spot parks on it: the hold becomes the session.
+        available_spot = None
+        hold_id = None
+        hold = SpotHold.query.filter_by(user_id=user_id).first()
+        if hold:
+            if lot_id is not None and str(lot_id) != str(hold.lot_id):
+                return jsonify({"message": "You are holding a spot in another parking lot. Cancel the hold first."}), 409
+            hold_id = hold.id
+            available_spot = convert_hold(hold_id, user_id)
+            if not available_spot:
+                # The hold ran out; its spot is freed by the expiry sweep.
+                db.session.rollback()
+                hold_id = None
+
         if not available_spot:
-            return jsonify({"message": "No available spots in this parking lot."}), 404
+            # Atomically take a free spot from the lot's pool and mark it occupied.
+            available_spot = claim_spot(lot_id)
+            if not available_spot:
+                return jsonify({"message": "No available spots in this parking lot."}), 404
 
-        # Update the spot's status and create the reservation record.
-        available_spot.status = 'occupied'
-        new_reservation = ParkingRecord(user_id=user_id, spot_id=available_spot.id)
-        db.session.add(new_reservation)
-        db.session.commit()
+            # Create the reservation record in the same transaction as the claim.
+            new_reservation = ParkingRecord(user_id=user_id, spot_id=available_spot.id)
+            db.session.add(new_reservation)
+        try:
+            db.session.commit()
+        except Exception as e:
+            # The claim was rolled back too, so the spot is still free (or still held).
+            db.session.rollback()
+            if not hold_id:
+                return_spot(available_spot.lot_id, available_spot.id)
+            if isinstance(e, IntegrityError):
+                # A concurrent booking by the same user committed first.
+                return jsonify({"message": "You already have an active parking reservation."}), 409
+            raise
+        stick_to_primary(user_id)
+        if hold_id:
+            forget_hold(hold_id)
 
         # --- Cache Invalidation ---
-        # A spot has been taken, so the lot details are now outdated.
-        # We must delete the cache to force the next request to get fresh data.
-        redis_client.delete("all_lots")
+        # A spot has been taken, so only this lot's availability is outdated.
+        invalidate_availability(available_spot.lot_id)
+        spot_changed(available_spot.lot_id, available_spot.spot_number, 'occupied')
 
         return jsonify({
             "message": "Spot booked successfully!",
@@ -78,23 +140,15 @@ def handle_reservations():
             "spot_number": available_spot.spot_number
         }), 201
 
-    # GET: Returns the current user's entire parking history.
+    # GET: Returns one page of the current user's parking history, newest first.
     elif request.method == 'GET':
-        reservations = ParkingRecord.query.filter_by(user_id=user_id).order_by(ParkingRecord.parking_timestamp.desc()).all()
-        output = []
-        for record in reservations:
-            spot = ParkingSpot.query.get(record.spot_id)
-            lot = ParkingLot.query.get(spot.lot_id)
-            record_data = {
-                'reservation_id': record.id,
-                'lot_name': lot.prime_location_name,
-                'spot_number': spot.spot_number,
-                'parking_time': record.parking_timestamp.isoformat() if record.parking_timestamp else None,
-                'leaving_time': record.leaving_timestamp.isoformat() if record.leaving_timestamp else None,
-                'cost': record.parking_cost
-            }
-            output.append(record_data)
-        return jsonify({'history': output})
+        try:
+            # History is read from the replica, unless this user just booked or released.
+            with replica_reads(user_id):
+                page = history_page(request.args, user_id=user_id)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        return jsonify({'history': page['items'], 'next_cursor': page['next_cursor']})
 
 
 @user_bp.route('/reservations/active', methods=['PUT'])
@@ -109,31 +163,122 @@ def release_spot():
         return jsonify({"message": "No active reservation found."}), 404
 
     # Record the leaving time.
-    active_reservation.leaving_timestamp = datetime.datetime.utcnow()
+    leaving_timestamp = datetime.datetime.utcnow()
     
-    spot = ParkingSpot.query.get(active_reservation.spot_id)
-    lot = ParkingLot.query.get(spot.lot_id)
+    spot = db.session.get(ParkingSpot, active_reservation.spot_id)
+    lot = db.session.get(ParkingLot, spot.lot_id)
 
     # --- Cost Calculation Logic ---
-    duration = active_reservation.leaving_timestamp - active_reservation.parking_timestamp
+    duration = leaving_timestamp - active_reservation.parking_timestamp
     hours = duration.total_seconds() / 3600
-    cost = hours * lot.price
-    active_reservation.parking_cost = round(cost, 2)
+    parking_cost = tariff_for(lot).price(active_reservation.parking_timestamp, leaving_timestamp)
+
+    # Close the session only if it is still open, so a retried or concurrent
+    # release cannot free the spot or count the session a second time.
+    released = db.session.execute(
+        update(ParkingRecord)
+        .where(ParkingRecord.id == active_reservation.id, ParkingRecord.leaving_timestamp.is_(None))
+        .values(leaving_timestamp=leaving_timestamp, parking_cost=parking_cost)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if released != 1:
+        db.session.rollback()
+        return jsonify({"message": "This reservation has already been released."}), 409
+
+    # Add the finished session to the lot's daily revenue rollup (same transaction).
+    record_session(lot.id, leaving_timestamp, parking_cost, duration.total_seconds() / 60)
 
     # Update the spot's status back to 'available'.
-    spot.status = 'available'
+    vacate_spot(spot)
     db.session.commit()
+    return_spot(spot.lot_id, spot.id)
+    stick_to_primary(user_id)
 
     # --- Cache Invalidation ---
-    # A spot has been freed, so the lot details are now outdated.
-    redis_client.delete("all_lots")
+    # A spot has been freed, so only this lot's availability is outdated.
+    invalidate_availability(spot.lot_id)
+    spot_changed(spot.lot_id, spot.spot_number, 'available')
 
     return jsonify({
         "message": "Spot released successfully.",
         "parking_duration_hours": round(hours, 2),
-        "total_cost": active_reservation.parking_cost
+        "total_cost": parking_cost
     })
 
+@user_bp.route('/holds', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_hold():
+    """Holds a spot in a lot for a few minutes (`minutes`, default 15), ready to be booked on arrival."""
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    try:
+        minutes = parse_minutes(data.get('minutes'))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if ParkingRecord.query.filter_by(user_id=user_id, leaving_timestamp=None).first():
+        return jsonify({"message": "You already have an active parking reservation."}), 409
+
+    # An old hold that ran out but was not swept yet is cleared first.
+    now = datetime.datetime.utcnow()
+    existing = SpotHold.query.filter_by(user_id=user_id).first()
+    if existing and existing.expires_at > now:
+        return jsonify({"message": "You are already holding a spot."}), 409
+    stale_ids = [existing.id] if existing else []
+    freed = expire_holds(stale_ids, now)
+
+    placed = place_hold(user_id, data.get('lot_id'), minutes, now)
+    if not placed:
+        db.session.rollback()
+        return jsonify({"message": "No available spots in this parking lot."}), 404
+    hold, spot = placed
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return_spot(spot.lot_id, spot.id)
+        if isinstance(e, IntegrityError):
+            # A concurrent hold by the same user committed first.
+            return jsonify({"message": "You are already holding a spot."}), 409
+        raise
+    finish_expiry(stale_ids, freed)
+    schedule_expiry(hold)
+    stick_to_primary(user_id)
+    invalidate_availability(spot.lot_id)
+    spot_changed(spot.lot_id, spot.spot_number, 'held')
+
+    return jsonify({
+        "message": f"Spot held for {minutes} minutes.",
+        "lot_id": spot.lot_id,
+        "spot_number": spot.spot_number,
+        "expires_at": hold.expires_at.isoformat()
+    }), 201
+
+@user_bp.route('/holds/active', methods=['GET', 'DELETE'])
+@jwt_required()
+def handle_active_hold():
+    """Shows or cancels the user's current hold."""
+    user_id = get_jwt_identity()
+    hold = SpotHold.query.filter_by(user_id=user_id).first()
+    if not hold or hold.expires_at <= datetime.datetime.utcnow():
+        return jsonify({"message": "No active hold found."}), 404
+
+    if request.method == 'GET':
+        spot = db.session.get(ParkingSpot, hold.spot_id)
+        return jsonify({
+            "lot_id": hold.lot_id,
+            "spot_number": spot.spot_number,
+            "expires_at": hold.expires_at.isoformat()
+        })
+
+    hold_id = hold.id
+    freed = cancel_hold(hold_id)
+    db.session.commit()
+    finish_expiry([hold_id], [freed] if freed else [])
+    stick_to_primary(user_id)
+    return jsonify({"message": "Hold cancelled."})
+
 @user_bp.route('/export-csv', methods=['POST'])
 @jwt_required()
 def export_csv():
@@ -141,4 +286,40 @@ def export_csv():
     user_id = get_jwt_identity()
     # Send the task to the Celery worker to run in the background.
     task = celery.send_task('tasks.export_history_task', args=[user_id])
-    return jsonify({"message": "CSV export has started. The file will be available shortly."}), 202
\ No newline at end of file
+    register_export(task.id, user_id)
+    return jsonify({
+        "message": "CSV export has started. The file will be available shortly.",
+        "task_id": task.id
+    }), 202
+
+@user_bp.route('/exports/<task_id>', methods=['GET'])
+@jwt_required()
+def export_status(task_id):
+    """Reports the state of an export job started by the current user (or admin)."""
+    if export_owner(task_id) != get_jwt_identity():
+        return jsonify({"message": "Export not found."}), 404
+
+    result = celery.AsyncResult(task_id)
+    status = {'task_id': task_id, 'state': result.state}
+    if result.successful():
+        status['rows'] = result.result['rows']
+        status['download_url'] = f"/api/user/exports/{task_id}/download"
+    elif result.failed():
+        status['error'] = str(result.result)
+    return jsonify(status)
+
+@user_bp.route('/exports/<task_id>/download', methods=['GET'])
+@jwt_required()
+def download_export(task_id):
+    """Serves a finished export. Supports HTTP Range requests for resumable downloads."""
+    path = export_path(task_id)
+    if export_owner(task_id) != get_jwt_identity() or not os.path.exists(path):
+        return jsonify({"message": "Export not found."}), 404
+
+    return send_file(
+        path,
+        mimetype='application/gzip',
+        as_attachment=True,
+        download_name=f'parking_history_{task_id}.csv.gz',
+        conditional=True
+    )
\ No newline at end of file
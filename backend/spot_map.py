@@ -0,0 +1,135 @@
+from extensions import db, redis_client
+from models import ParkingSpot
+import base64
+import struct
+
+# This file keeps a compact map of every spot's status per lot, for the
+# `format=compact` lot detail view.
+#
+# Each lot has a Redis bitfield with 2 bits per spot, in spot_number order
+# (spot 1 first). The map is updated with the same call that announces a spot
+# change (events.spot_changed), so serving a lot view reads no spot rows.
+# It is rebuilt from ParkingSpot when missing, and by the periodic pool
+# reconciliation, which also repairs any drift.
+#
+# Spot numbers can have gaps (resizing retires free spots), so code 0 means
+# "no such spot". Four spots share a byte, the first in the highest bits.
+
+CODES = {'available': 1, 'occupied': 2, 'held': 3}
+LEGEND = {0: 'none', 1: 'available', 2: 'occupied', 3: 'held'}
+
+PAGE_SIZE = 4096        # Spots per compact page by default.
+MAX_PAGE_SIZE = 65536
+_WORD = 16              # Spots per u32 read/write.
+
+
+def _map_key(lot_id):
+    return f"lot:{lot_id}:spot_map"
+
+
+# -----------------
+# Updates
+# -----------------
+# KEYS: map. ARGV: offset, code. A missing map (never built, evicted, or lost
+# with a Redis restart) is left missing: writing one spot would create a map in
+# which every other spot reads as 'none'. The next read rebuilds it instead.
+_SET_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('BITFIELD', KEYS[1], 'SET', 'u2', ARGV[1], ARGV[2])
+return 1
+"""
+_set_if_exists = redis_client.register_script(_SET_IF_EXISTS)
+
+
+def set_status(lot_id, spot_number, status):
+    """Records one spot's new status, if the lot has a map. Call after the change is committed."""
+    return _set_if_exists(keys=[_map_key(lot_id)], args=[f'#{spot_number - 1}', CODES[status]]) == 1
+
+
+def rebuild(lot_id, spots=None):
+    """Rewrites a lot's map from (spot_number, status) pairs, read from ParkingSpot if not given."""
+    if spots is None:
+        spots = db.session.query(ParkingSpot.spot_number, ParkingSpot.status).filter_by(lot_id=lot_id).all()
+
+    # Retired spots at the end are left out, so the map ends at the last real spot.
+    highest = max((number for number, status in spots if status in CODES), default=0)
+    words = [0] * -(-highest // _WORD)
+    for number, status in spots:
+        if number > highest:
+            continue
+        index = number - 1
+        shift = 2 * (_WORD - 1 - index % _WORD)
+        words[index // _WORD] |= CODES.get(status, 0) << shift
+
+    # Replace the map in one MULTI/EXEC so readers never see it half written.
+    pipe = redis_client.pipeline()
+    pipe.delete(_map_key(lot_id))
+    if words:
+        args = []
+        for i, word in enumerate(words):
+            args += ['SET', 'u32', f'#{i}', word]
+        pipe.execute_command('BITFIELD', _map_key(lot_id), *args)
+    pipe.execute()
+
+
+def forget(lot_id):
+    """Drops a lot's map, e.g. after it was resized or deleted. It is rebuilt on the next read."""
+    redis_client.delete(_map_key(lot_id))
+
+
+# -----------------
+# Reads
+# -----------------
+def read_page(lot_id, first, count):
+    """Returns one page of a lot's map, starting at spot number `first` (rounded down to 1 + a multiple of 4).
+
+    The result has `first_spot_number`, `spot_count`, base64 `data` and
+    `next_from` (None on the last page).
+    """
+    key = _map_key(lot_id)
+    size = redis_client.strlen(key)
+    if not size:
+        rebuild(lot_id)
+        size = redis_client.strlen(key)
+    total = _spot_total(key, size) if size else 0
+
+    start = (first - 1) // 4 * 4
+    end = min(start + -(-count // 4) * 4, total)   # Whole bytes, so the next page lines up.
+    if start >= end:
+        return {'first_spot_number': start + 1, 'spot_count': 0, 'data': '', 'next_from': None}
+
+    # Read whole 32-bit words, then cut out the requested bytes.
+    first_word, last_word = start // _WORD, -(-end // _WORD)
+    args = []
+    for i in range(first_word, last_word):
+        args += ['GET', 'u32', f'#{i}']
+    words = redis_client.execute_command('BITFIELD', key, *args)
+    raw = struct.pack(f'>{len(words)}I', *words)
+    offset = (start - first_word * _WORD) // 4
+    data = raw[offset:offset + -(-(end - start) // 4)]
+
+    return {
+        'first_spot_number': start + 1,
+        'spot_count': end - start,
+        'data': base64.b64encode(data).decode('ascii'),
+        'next_from': end + 1 if end < total else None
+    }
+
+
+def _spot_total(key, size):
+    """Highest spot number in a map of `size` bytes; later codes in its last word are padding."""
+    last_word = (size - 1) // 4
+    (word,) = redis_client.execute_command('BITFIELD', key, 'GET', 'u32', f'#{last_word}')
+    return last_word * _WORD + _used_spots(struct.pack('>I', word))
+
+
+def _used_spots(data):
+    """Number of spots in `data` up to and including the last one that is not 'none'."""
+    trimmed = data.rstrip(b'\0')
+    if not trimmed:
+        return 0
+    last = trimmed[-1]
+    used_in_last = next(i for i in (4, 3, 2, 1) if last >> 2 * (4 - i) & 3)
+    return (len(trimmed) - 1) * 4 + used_in_last
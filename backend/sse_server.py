@@ -0,0 +1,205 @@
+from app import create_app
+from extensions import redis_client
+from events import CHANNEL, LOG_KEY, parse_message
+from user_cache import is_token_revoked
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import json
+import jwt
+import os
+import redis
+import redis.asyncio as aioredis
+
+# This file serves live availability updates as Server-Sent Events:
+#
+#   GET /api/user/lots/events?token=<access token>[&lot_id=<id>]
+#
+# It runs as its own small asyncio server next to the Flask app, because a
+# WSGI worker would be tied up by every open stream. Here an idle subscriber
+# is just a coroutine and a queue, so one process can hold thousands of them.
+# The process keeps ONE Redis pub/sub subscription and fans each event out to
+# all of its subscribers.
+#
+# EventSource cannot send headers, so the access token comes in the query
+# string. A client that reconnects with `Last-Event-ID` first gets the events
+# it missed from the replay log (see events.py). If they are no longer there,
+# it gets a `reset` event and should re-fetch the lots.
+#
+# Run it (from the backend folder):  python3 sse_server.py
+# Listens on SSE_HOST:SSE_PORT (default 127.0.0.1:5001). For many subscribers,
+# raise the open-file limit first (e.g. `ulimit -n 65536`).
+
+PATH = '/api/user/lots/events'
+HEARTBEAT = 15          # Seconds between keep-alive comments on an idle stream.
+QUEUE_SIZE = 1000       # Events buffered per subscriber before it is dropped as too slow.
+RETRY_MS = 3000         # How long browsers wait before reconnecting.
+
+app = create_app()
+redis_kwargs = redis_client.connection_pool.connection_kwargs
+async_redis = aioredis.Redis(
+    host=redis_kwargs.get('host', 'localhost'),
+    port=redis_kwargs.get('port', 6379),
+    db=redis_kwargs.get('db', 0),
+    decode_responses=True
+)
+
+
+# -----------------
+# Fan-Out
+# -----------------
+class Subscriber:
+    def __init__(self, lot_id):
+        self.lot_id = lot_id
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.lagging = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up; it will reconnect and catch up from the log.
+            self.lagging = True
+
+
+subscribers = set()
+
+
+async def relay_events():
+    """Forwards every published event to the subscribers of this process."""
+    while True:
+        try:
+            async with async_redis.pubsub() as pubsub:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    event = parse_message(message['data'])
+                    for subscriber in list(subscribers):
+                        subscriber.offer(event)
+        except redis.RedisError as e:
+            print(f"Lost the Redis subscription ({e}), retrying...")
+            await asyncio.sleep(1)
+
+
+# -----------------
+# HTTP
+# -----------------
+def _head(status, extra=()):
+    lines = [f'HTTP/1.1 {status}', 'Access-Control-Allow-Origin: *', *extra]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+def _format(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'.encode()
+
+
+def _wanted(subscriber, event, data):
+    return subscriber.lot_id is None or json.loads(data)['lot_id'] == subscriber.lot_id
+
+
+def _authenticate(token):
+    """Returns the token's claims, or None if it is invalid, expired or revoked."""
+    try:
+        claims = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return None
+    if claims.get('type') != 'access' or is_token_revoked(None, claims):
+        return None
+    return claims
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    method, target, _ = request_line.split(' ', 2)
+    return method, urlsplit(target), headers
+
+
+async def _replay(writer, subscriber, last_event_id):
+    """Sends the events after `last_event_id` from the log. Returns the last ID sent."""
+    oldest = await async_redis.zrange(LOG_KEY, 0, 0, withscores=True)
+    if oldest and int(oldest[0][1]) > last_event_id + 1:
+        # Some of the missed events were already trimmed from the log.
+        writer.write(b'event: reset\ndata: {}\n\n')
+    sent = last_event_id
+    for message in await async_redis.zrangebyscore(LOG_KEY, f'({last_event_id}', '+inf'):
+        event_id, event, data = parse_message(message)
+        if _wanted(subscriber, event, data):
+            writer.write(_format(event_id, event, data))
+        sent = event_id
+    await writer.drain()
+    return sent
+
+
+async def handle_client(reader, writer):
+    subscriber = None
+    try:
+        method, url, headers = await asyncio.wait_for(_read_request(reader), timeout=10)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if method == 'OPTIONS':
+            writer.write(_head('204 No Content', ['Access-Control-Allow-Headers: Authorization, Last-Event-ID']))
+            return
+        if method != 'GET' or url.path != PATH:
+            writer.write(_head('404 Not Found', ['Content-Length: 0']))
+            return
+
+        token = params.get('token') or headers.get('authorization', '').removeprefix('Bearer ')
+        if not token or not await asyncio.to_thread(_authenticate, token):
+            writer.write(_head('401 Unauthorized', ['Content-Length: 0']))
+            return
+        try:
+            lot_id = int(params['lot_id']) if params.get('lot_id') else None
+            last_event_id = headers.get('last-event-id') or params.get('last_event_id')
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            writer.write(_head('400 Bad Request', ['Content-Length: 0']))
+            return
+
+        writer.write(_head('200 OK', [
+            'Content-Type: text/event-stream',
+            'Cache-Control: no-cache',
+            'X-Accel-Buffering: no'
+        ]))
+        writer.write(f'retry: {RETRY_MS}\n\n'.encode())
+
+        # Subscribe before replaying, so nothing published in between is lost.
+        subscriber = Subscriber(lot_id)
+        subscribers.add(subscriber)
+        sent = await _replay(writer, subscriber, last_event_id) if last_event_id is not None else 0
+
+        while not subscriber.lagging:
+            try:
+                event_id, event, data = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT)
+            except asyncio.TimeoutError:
+                writer.write(b': ping\n\n')
+            else:
+                if event_id <= sent or not _wanted(subscriber, event, data):
+                    continue
+                writer.write(_format(event_id, event, data))
+                sent = event_id
+            await writer.drain()
+    except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        subscribers.discard(subscriber)
+        writer.close()
+
+
+async def main():
+    host = os.environ.get('SSE_HOST', '127.0.0.1')
+    port = int(os.environ.get('SSE_PORT', 5001))
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"Serving availability events on http://{host}:{port}{PATH}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), relay_events())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
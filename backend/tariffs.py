@@ -0,0 +1,278 @@
+from extensions import db
+from models import LotTariff, ParkingRecord, ParkingSpot
+from sqlalchemy import select
+import bisect
+import datetime
+import functools
+import json
+
+try:
+    import numpy as np
+except ImportError:  # price_many prices one session at a time instead.
+    np = None
+
+# This file prices parking sessions.
+#
+# A lot without a tariff charges its flat hourly `price`, per second used. A
+# tariff (LotTariff.schedule) adds, as JSON:
+#
+#   {
+#     "rates": [{"from": "07:00", "to": "10:00", "price": 60, "days": [0, 1, 2, 3, 4]}, ...],
+#     "grace_minutes": 10,     # Sessions this short are free.
+#     "minimum_charge": 20,    # Any charged session costs at least this.
+#     "daily_cap": 300         # Most charged per calendar day.
+#   }
+#
+# Rates are hourly prices for a time of day (0 = Monday, all days if `days` is
+# left out); a rate whose `to` is before its `from` runs past midnight. Later
+# rates override earlier ones, and the lot's `price` fills every other hour.
+# All times are UTC, like the rest of the stored timestamps.
+#
+# A schedule is compiled once into a week of segments (start second, price per
+# second) with the running cost at each segment start. The cost of any interval
+# is then C(end) - C(start), where C is one binary search and a multiply, so a
+# session is priced in O(days + log segments) however long it is. The same
+# tables drive `price_many`, which prices whole NumPy arrays of sessions at
+# once for batch repricing (when NumPy is installed).
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+MINUTES_PER_DAY = 24 * 60
+REPRICE_BATCH = 50000       # Sessions read per round trip when repricing.
+
+# Time is counted in seconds from a Monday, so that weeks start at 0.
+_ORIGIN = datetime.datetime(1970, 1, 5)
+
+
+# -----------------
+# Schedules
+# -----------------
+def _minute_of_day(value):
+    hours, minutes = (int(part) for part in str(value).split(':'))
+    minute = hours * 60 + minutes
+    if not (0 <= minutes < 60 and 0 <= minute <= MINUTES_PER_DAY):
+        raise ValueError(value)
+    return minute
+
+
+def _amount(data, name, default):
+    value = data.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a number.")
+    if value < 0:
+        raise ValueError(f"'{name}' cannot be negative.")
+    return value
+
+
+def parse_schedule(data):
+    """Validates a tariff schedule and returns it cleaned. Raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("The tariff must be a JSON object.")
+    rates = data.get('rates') or []
+    if not isinstance(rates, list):
+        raise ValueError("'rates' must be a list.")
+
+    parsed = []
+    for number, rate in enumerate(rates, start=1):
+        try:
+            start, end = _minute_of_day(rate['from']), _minute_of_day(rate['to'])
+            price = float(rate['price'])
+            days = sorted({int(day) for day in rate.get('days', range(7))})
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(
+                f"Rate {number} needs 'from' and 'to' times (HH:MM), a 'price' "
+                "and optionally 'days' (0 = Monday ... 6 = Sunday)."
+            )
+        if price < 0 or start == end or not all(0 <= day <= 6 for day in days):
+            raise ValueError(f"Rate {number} must have a price of at least 0, different 'from' and 'to' times and days from 0 to 6.")
+        parsed.append({
+            'from': f"{start // 60:02d}:{start % 60:02d}",
+            'to': f"{end // 60:02d}:{end % 60:02d}",
+            'price': price,
+            'days': days
+        })
+
+    daily_cap = _amount(data, 'daily_cap', None)
+    if daily_cap == 0:
+        raise ValueError("'daily_cap' must be more than 0.")
+    return {
+        'rates': parsed,
+        'grace_minutes': _amount(data, 'grace_minutes', 0),
+        'minimum_charge': _amount(data, 'minimum_charge', 0),
+        'daily_cap': daily_cap
+    }
+
+
+# -----------------
+# Compiled Tariffs
+# -----------------
+class Tariff:
+    """A lot's hourly price and schedule, compiled into weekly lookup tables."""
+
+    def __init__(self, price, schedule=None):
+        schedule = schedule or {}
+        self.grace = schedule.get('grace_minutes', 0) * 60
+        self.minimum = schedule.get('minimum_charge', 0)
+        self.cap = schedule.get('daily_cap')
+
+        # The hourly price of every minute of the week...
+        by_minute = [price] * (7 * MINUTES_PER_DAY)
+        for rate in schedule.get('rates', []):
+            start = _minute_of_day(rate['from'])
+            length = (_minute_of_day(rate['to']) - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+            for day in rate['days']:
+                first = day * MINUTES_PER_DAY + start
+                for minute in range(first, first + length):
+                    by_minute[minute % len(by_minute)] = rate['price']
+
+        # ...merged into segments of one price, with the running cost at each start.
+        self.starts, self.rates, self.cumulative = [], [], []
+        for minute, hourly in enumerate(by_minute):
+            if minute and hourly == by_minute[minute - 1]:
+                continue
+            second = minute * 60
+            cost = self.cumulative[-1] + (second - self.starts[-1]) * self.rates[-1] if self.starts else 0.0
+            self.starts.append(second)
+            self.rates.append(hourly / 3600)
+            self.cumulative.append(cost)
+        self.week_cost = self.cumulative[-1] + (WEEK - self.starts[-1]) * self.rates[-1]
+
+        # Capped cost of each full weekday, repeated twice so runs of days can wrap
+        # around the week: the cost of n days from weekday w is found in O(1).
+        if self.cap is not None:
+            capped = [min(self.cap, self._cost_to((day + 1) * DAY) - self._cost_to(day * DAY)) for day in range(7)]
+            self.capped_week = sum(capped)
+            self.capped_prefix = [0.0]
+            for cost in capped + capped:
+                self.capped_prefix.append(self.capped_prefix[-1] + cost)
+
+        if np is not None:
+            self._starts = np.array(self.starts, dtype=np.float64)
+            self._rates = np.array(self.rates)
+            self._cumulative = np.array(self.cumulative)
+            self._capped_prefix = np.array(self.capped_prefix) if self.cap is not None else None
+
+    def _cost_to(self, second):
+        """Cost from the origin to `second`."""
+        weeks, position = divmod(second, WEEK)
+        i = bisect.bisect_right(self.starts, position) - 1
+        return weeks * self.week_cost + self.cumulative[i] + (position - self.starts[i]) * self.rates[i]
+
+    def _cost_to_many(self, seconds):
+        weeks, position = np.divmod(seconds, WEEK)
+        i = np.searchsorted(self._starts, position, side='right') - 1
+        return weeks * self.week_cost + self._cumulative[i] + (position - self._starts[i]) * self._rates[i]
+
+    def _full_days(self, first_day, count):
+        weekday = first_day % 7
+        whole_weeks, rest = divmod(count, 7)
+        return whole_weeks * self.capped_week + self.capped_prefix[weekday + rest] - self.capped_prefix[weekday]
+
+    def price(self, parked, left):
+        """The cost of one session, given its start and end datetimes (naive UTC)."""
+        return self._price_seconds((parked - _ORIGIN).total_seconds(), (left - _ORIGIN).total_seconds())
+
+    def _price_seconds(self, start, end):
+        if end - start <= self.grace:
+            return 0.0
+
+        if self.cap is None:
+            cost = self._cost_to(end) - self._cost_to(start)
+        else:
+            # Cap each calendar day: the first and last (partial) days, and the full days between.
+            first_day, last_day = int(start // DAY), int(end // DAY)
+            if first_day == last_day:
+                cost = min(self.cap, self._cost_to(end) - self._cost_to(start))
+            else:
+                cost = min(self.cap, self._cost_to((first_day + 1) * DAY) - self._cost_to(start))
+                cost += min(self.cap, self._cost_to(end) - self._cost_to(last_day * DAY))
+                cost += self._full_days(first_day + 1, last_day - first_day - 1)
+        return round(max(cost, self.minimum), 2)
+
+    def price_many(self, parked, left):
+        """The costs of many sessions at once, from arrays of start and end seconds (see `to_seconds`)."""
+        if np is None:
+            return [self._price_seconds(start, end) for start, end in zip(parked, left)]
+        start = np.asarray(parked, dtype=np.float64)
+        end = np.asarray(left, dtype=np.float64)
+
+        if self.cap is None:
+            cost = self._cost_to_many(end) - self._cost_to_many(start)
+        else:
+            first_day, last_day = np.floor_divide(start, DAY), np.floor_divide(end, DAY)
+            same_day = first_day == last_day
+            cost = np.minimum(self.cap, self._cost_to_many(np.where(same_day, end, (first_day + 1) * DAY)) - self._cost_to_many(start))
+            cost += np.where(same_day, 0.0, np.minimum(self.cap, self._cost_to_many(end) - self._cost_to_many(last_day * DAY)))
+            count = np.maximum(last_day - first_day - 1, 0).astype(np.int64)
+            weekday = ((first_day + 1) % 7).astype(np.int64)
+            whole_weeks, rest = np.divmod(count, 7)
+            cost += whole_weeks * self.capped_week + self._capped_prefix[weekday + rest] - self._capped_prefix[weekday]
+
+        cost = np.where(end - start <= self.grace, 0.0, np.maximum(cost, self.minimum))
+        return np.round(cost, 2)
+
+
+def to_seconds(timestamps):
+    """Converts a sequence of naive UTC datetimes to the seconds `price_many` expects."""
+    if np is None:
+        return [(timestamp - _ORIGIN).total_seconds() for timestamp in timestamps]
+    return (np.array(timestamps, dtype='datetime64[us]') - np.datetime64(_ORIGIN)) / np.timedelta64(1, 's')
+
+
+@functools.lru_cache(maxsize=1024)
+def _compiled(price, schedule_json):
+    return Tariff(price, json.loads(schedule_json) if schedule_json else None)
+
+
+def tariff_for(lot):
+    """Returns a lot's compiled tariff. Compiled tariffs are kept per (price, schedule)."""
+    row = db.session.get(LotTariff, lot.id)
+    return _compiled(lot.price, row.schedule if row else None)
+
+
+# -----------------
+# Batch Repricing
+# -----------------
+def reprice(lot, schedule=None, start=None, end=None):
+    """Reprices a lot's closed sessions, optionally only those that ended in [start, end).
+
+    Uses the lot's own tariff, or `schedule` to see what it would have charged
+    (a what-if). Nothing is saved; returns totals against the recorded costs.
+    """
+    tariff = Tariff(lot.price, schedule) if schedule is not None else tariff_for(lot)
+    query = select(ParkingRecord.parking_timestamp, ParkingRecord.leaving_timestamp, ParkingRecord.parking_cost)\
+        .join(ParkingSpot, ParkingSpot.id == ParkingRecord.spot_id)\
+        .where(ParkingSpot.lot_id == lot.id, ParkingRecord.leaving_timestamp.isnot(None))
+    if start:
+        query = query.where(ParkingRecord.leaving_timestamp >= start)
+    if end:
+        query = query.where(ParkingRecord.leaving_timestamp < end)
+
+    sessions = changed = 0
+    recorded = repriced = 0.0
+    result = db.session.execute(query.execution_options(yield_per=REPRICE_BATCH))
+    for rows in result.partitions():
+        parked, left, costs = zip(*rows)
+        new_costs = tariff.price_many(to_seconds(parked), to_seconds(left))
+        old_costs = [cost or 0.0 for cost in costs]
+        sessions += len(rows)
+        recorded += sum(old_costs)
+        if np is not None:
+            repriced += float(new_costs.sum())
+            changed += int(np.count_nonzero(np.abs(new_costs - np.array(old_costs)) >= 0.005))
+        else:
+            repriced += sum(new_costs)
+            changed += sum(1 for old, new in zip(old_costs, new_costs) if abs(new - old) >= 0.005)
+
+    return {
+        'lot_id': lot.id,
+        'sessions': sessions,
+        'recorded_revenue': round(recorded, 2),
+        'repriced_revenue': round(repriced, 2),
+        'difference': round(repriced - recorded, 2),
+        'changed_sessions': changed
+    }
@@ -1,11 +1,16 @@
-import csv
 import os
 import datetime
 from dateutil.relativedelta import relativedelta
-from flask import render_template
-from extensions import celery, mail
-from models import ParkingRecord, ParkingSpot, ParkingLot, User
-from flask_mail import Message
+from celery import group
+from extensions import db, celery, replica_reads
+from models import User
+from reports import monthly_reports, batches, render_report, pending_reports, ReportCheckpoint
+from mailer import BATCH_SIZE, MAX_RETRIES, deliver, retry_delay, start_run, record_retry, record_given_up
+from exporter import write_history, remove_expired_exports
+from allocator import reconcile_all
+from holds import sweep_expired_holds, requeue_holds
+from lot_search import rebuild_index
+from analytics import update_occupancy
 from app import create_app
 
 # This file defines all the background tasks that are run by the Celery worker.
@@ -16,70 +21,103 @@ app = create_app()
 # -----------------
 # User-Triggered Task
 # -----------------
-@celery.task
-def export_history_task(user_id):
-    """Generates a CSV file of a user's parking history."""
+@celery.task(bind=True)
+def export_history_task(self, user_id):
+    """Streams a user's parking history to a gzip CSV file named after this task."""
     # Tasks run in the background, so they need their own app context
-    # to access the database.
-    with app.app_context():
-        user = User.query.get(user_id)
+    # to access the database. The export only reads, so it runs on the replica.
+    with app.app_context(), replica_reads(user_id):
+        user = db.session.get(User, user_id)
         if not user:
-            return f"User with ID {user_id} not found."
-
-        # Ensure the 'exports' directory exists.
-        export_dir = 'exports'
-        os.makedirs(export_dir, exist_ok=True)
-        filename = os.path.join(export_dir, f'history_{user.username}.csv')
-        
-        # Fetch all parking records for the user.
-        records = ParkingRecord.query.filter_by(user_id=user_id).order_by(ParkingRecord.parking_timestamp.desc()).all()
-
-        # Write the data to a CSV file.
-        with open(filename, 'w', newline='') as csvfile:
-            fieldnames = ['Reservation ID', 'Lot Name', 'Spot Number', 'Parking Time', 'Leaving Time', 'Cost (INR)']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for record in records:
-                spot = ParkingSpot.query.get(record.spot_id)
-                lot = ParkingLot.query.get(spot.lot_id)
-                writer.writerow({
-                    'Reservation ID': record.id,
-                    'Lot Name': lot.prime_location_name,
-                    'Spot Number': spot.spot_number,
-                    'Parking Time': record.parking_timestamp.isoformat() if record.parking_timestamp else '',
-                    'Leaving Time': record.leaving_timestamp.isoformat() if record.leaving_timestamp else '',
-                    'Cost (INR)': record.parking_cost if record.parking_cost is not None else ''
-                })
-        
-        print(f"Successfully generated CSV for {user.username}.")
-        return f"CSV generated for {user.username}."
+            raise ValueError(f"User with ID {user_id} not found.")
+
+        path, rows = write_history(self.request.id, user_id=user.id)
+        print(f"Successfully generated CSV for {user.username} ({rows} rows).")
+        return {'filename': os.path.basename(path), 'rows': rows}
+
+@celery.task(bind=True)
+def export_all_history_task(self):
+    """Streams the parking history of ALL users to a gzip CSV file (admin export)."""
+    with app.app_context(), replica_reads():
+        path, rows = write_history(self.request.id)
+        print(f"Successfully generated the full history CSV ({rows} rows).")
+        return {'filename': os.path.basename(path), 'rows': rows}
 
 # -----------------
 # Scheduled Tasks
 # -----------------
 @celery.task
 def daily_reminder_task():
-    """Sends a simple promotional reminder email to all users."""
-    with app.app_context():
+    """Sends a simple promotional reminder email to all users, in parallel batches."""
+    with app.app_context(), replica_reads():
         print("\n--- Running Daily Reminder Task ---")
-        users = User.query.filter_by(role='user').all()
-        for user in users:
-            msg = Message(
-                subject="Parking App Daily Reminder",
-                recipients=[f"{user.username}@example.com"], # Using a placeholder email for the demo
-                body=f"Hi {user.username}, don't forget to book a parking spot today!"
-            )
-            mail.send(msg)
-            print(f"Sending daily reminder email to: {user.username}")
-        
-        print("--- Daily Reminder Task Complete ---\n")
-        return f"Sent email reminders to {len(users)} users."
+        users = User.query.with_entities(User.id, User.username).filter_by(role='user').order_by(User.id).all()
+        messages = [
+            {
+                'key': user_id,
+                'recipients': [f"{username}@example.com"], # Using a placeholder email for the demo
+                'subject': "Parking App Daily Reminder",
+                'body': f"Hi {username}, don't forget to book a parking spot today!"
+            }
+            for user_id, username in users
+        ]
+        if not messages:
+            return "No users to remind."
+
+        chunks = list(batches(messages, BATCH_SIZE))
+        run_id = start_run('daily_reminder', len(messages), len(chunks))
+        group(send_mail_batch_task.s(run_id, chunk) for chunk in chunks).apply_async()
+
+        print(f"--- Daily Reminder Task Dispatched ({len(messages)} emails, run {run_id}) ---\n")
+        return f"Email reminders queued for {len(messages)} users."
+
+@celery.task(bind=True, max_retries=MAX_RETRIES)
+def send_mail_batch_task(self, run_id, messages):
+    """Sends one batch of emails over a single SMTP connection, retrying failures with backoff."""
+    with app.app_context():
+        failed = deliver(run_id, messages)
+        if failed and self.request.retries < self.max_retries:
+            record_retry(run_id, len(failed))
+            raise self.retry(args=[run_id, failed], countdown=retry_delay(self.request.retries))
+        if failed:
+            record_given_up(run_id, len(failed))
+        return f"Sent {len(messages) - len(failed)} of {len(messages)} emails."
 
 @celery.task
-def monthly_report_task():
-    """Generates and emails a monthly activity report to each user."""
+def cleanup_exports_task():
+    """Deletes CSV exports that are past their download window."""
+    removed = remove_expired_exports()
+    return f"Removed {removed} expired exports."
+
+@celery.task
+def reconcile_spot_pools_task():
+    """Rebuilds every lot's free-spot pool and occupied counter from the ParkingSpot table."""
     with app.app_context():
+        free_spots = reconcile_all()
+        # Also re-arm the expiry timer of every hold and refresh the search
+        # index, in case Redis lost them.
+        holds = requeue_holds()
+        rebuild_index()
+        return f"Rebuilt free-spot pools for {len(free_spots)} lots and re-armed {holds} holds."
+
+@celery.task
+def expire_holds_task():
+    """Frees the spots of holds that ran out, in batches taken from the expiry timer."""
+    with app.app_context():
+        freed = sweep_expired_holds()
+        return f"Expired {freed} holds."
+
+@celery.task
+def update_occupancy_task():
+    """Adds newly closed parking sessions to the hourly occupancy analytics."""
+    with app.app_context():
+        processed = update_occupancy()
+        return f"Added {processed} sessions to occupancy analytics."
+
+@celery.task
+def monthly_report_task():
+    """Computes every user's monthly report in one query and fans the emails out in batches."""
+    with app.app_context(), replica_reads():
         print("\n--- Running Monthly Report Task ---")
         today = datetime.date.today()
 
@@ -88,57 +126,54 @@ def monthly_report_task():
         # In a real application, this would be changed to look at the previous month.
         first_day_of_month = today.replace(day=1)
         first_day_next_month = (today.replace(day=1) + relativedelta(months=1))
-        
-        users = User.query.filter_by(role='user').all()
-        reports_sent = 0
-
-        for user in users:
-            # Query for all completed parking sessions within the date range.
-            records = ParkingRecord.query.filter(
-                ParkingRecord.user_id == user.id,
-                ParkingRecord.leaving_timestamp != None,
-                ParkingRecord.parking_timestamp >= first_day_of_month,
-                ParkingRecord.parking_timestamp < first_day_next_month
-            ).all()
-
-            if not records:
-                print(f"No completed parkings this month for {user.username}. Skipping report.")
-                continue
-
-            total_spent = sum(r.parking_cost or 0 for r in records)
-            
-            # Prepare data for the email template.
-            report_data = []
-            for r in records:
-                spot = ParkingSpot.query.get(r.spot_id)
-                lot = ParkingLot.query.get(spot.lot_id)
-                duration = r.leaving_timestamp - r.parking_timestamp
-                report_data.append({
-                    "lot_name": lot.prime_location_name,
-                    "parking_time": r.parking_timestamp.strftime('%d-%b-%Y'),
-                    "duration_hours": round(duration.total_seconds() / 3600, 2),
-                    "cost": r.parking_cost
-                })
-            
-            # Render the HTML for the email using a Jinja2 template.
-            html_body = render_template(
-                'report.html',
-                username=user.username,
-                reporting_period=today.strftime('%B %Y'),
-                total_spent=total_spent,
-                total_parkings=len(records),
-                records=report_data
-            )
-            
-            # Create and send the email.
-            msg = Message(
-                subject=f"Your Parking Report for {today.strftime('%B %Y')}",
-                recipients=[f"{user.username}@example.com"],
-                html=html_body
+        period = first_day_of_month.strftime('%Y-%m')
+        reporting_period = today.strftime('%B %Y')
+
+        # Users without completed parkings this month simply have no report.
+        # Users already sent a report for this period (in a crashed or earlier
+        # run) are skipped.
+        reports = pending_reports(period, monthly_reports(first_day_of_month, first_day_next_month))
+        if not reports:
+            print("--- Monthly Report Task Complete (nothing to send) ---\n")
+            return "No monthly reports to send."
+
+        # Render and send the emails in parallel batches.
+        chunks = list(batches(reports, BATCH_SIZE))
+        run_id = start_run('monthly_report', len(reports), len(chunks))
+        group(
+            send_report_batch_task.s(run_id, period, reporting_period, batch)
+            for batch in chunks
+        ).apply_async()
+
+        print(f"--- Monthly Report Task Dispatched ({len(reports)} reports, run {run_id}) ---\n")
+        return f"Monthly reports queued for {len(reports)} users."
+
+@celery.task(bind=True, max_retries=MAX_RETRIES)
+def send_report_batch_task(self, run_id, period, reporting_period, reports):
+    """Renders and emails one batch of monthly reports, skipping any already sent."""
+    with app.app_context():
+        messages = [
+            {
+                'key': report['user_id'],
+                'recipients': [f"{report['username']}@example.com"],
+                'subject': f"Your Parking Report for {reporting_period}",
+                'html': render_report(report, reporting_period)
+            }
+            for report in reports
+        ]
+        # Each user is claimed just before their email goes out and checked off
+        # once it is sent, so a re-run resumes where a crashed batch stopped.
+        failed_ids = {message['key'] for message in deliver(run_id, messages, ReportCheckpoint(period))}
+        failed = [report for report in reports if report['user_id'] in failed_ids]
+
+        if failed and self.request.retries < self.max_retries:
+            record_retry(run_id, len(failed))
+            raise self.retry(
+                args=[run_id, period, reporting_period, failed],
+                countdown=retry_delay(self.request.retries)
             )
-            mail.send(msg)
-            reports_sent += 1
-            print(f"Sent monthly report to {user.username}")
+        if failed:
+            # Out of retries: these were never checked off, so the next run sends them.
+            record_given_up(run_id, len(failed))
 
-        print(f"--- Monthly Report Task Complete ({reports_sent} reports sent) ---\n")
-        return f"Monthly reports sent to {reports_sent} users."
\ No newline at end of file
+        return f"Monthly reports sent to {len(reports) - len(failed)} users."
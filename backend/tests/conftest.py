@@ -0,0 +1,123 @@
+from flask_jwt_extended import create_access_token
+from werkzeug.security import generate_password_hash
+import os
+import socket
+import sys
+import pytest
+
+# Shared fixtures. Each test gets a fresh app on its own temporary SQLite file
+# and an empty in-memory Redis (fakeredis, with lupa for the Lua scripts).
+#
+# Usage (from the backend folder):  python3 -m pytest tests
+# Needs: pip install pytest fakeredis lupa aiosmtpd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app_config():
+    """Extra app settings; override in a test module to change them."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    from extensions import db, redis_client
+    from app import create_app
+
+    redis_client.connection_pool = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True).connection_pool
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}", **app_config})
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Creates a user and returns (user_id, Authorization headers)."""
+    from extensions import db
+    from models import User
+
+    def make(username, role='user'):
+        with app.app_context():
+            user = User(username=username, password=generate_password_hash('test-password', method='pbkdf2:sha256:1000'), role=role)
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id), additional_claims={'role': role})
+            return user.id, {'Authorization': f'Bearer {token}'}
+    return make
+
+
+@pytest.fixture
+def make_lot(app):
+    """Creates a lot with `spots` spots (free pool included) and returns its id."""
+    from extensions import db
+    from provisioning import create_lot
+
+    def make(spots, name='Test Lot', price=60.0, address='Test Road'):
+        with app.app_context():
+            lot = create_lot({
+                'prime_location_name': name,
+                'price': price,
+                'address': address,
+                'pin_code': '560001',
+                'number_of_spots': spots
+            })
+            db.session.commit()
+            return lot.id
+    return make
+
+
+@pytest.fixture
+def smtp_sink():
+    """A local SMTP server (aiosmtpd) that keeps every message it accepts.
+
+    Yields an object with `port`, `received` (one (recipients, subject) pair per
+    message), `connections` (sessions greeted) and `refuse`, a set of
+    recipients it answers with a 550.
+    """
+    pytest.importorskip('aiosmtpd')
+    from aiosmtpd.controller import Controller
+    from email import message_from_bytes
+
+    class Sink:
+        def __init__(self):
+            self.received = []
+            self.connections = 0
+            self.refuse = set()
+
+        async def handle_EHLO(self, server, session, envelope, hostname, responses):
+            self.connections += 1
+            session.host_name = hostname
+            return responses
+
+        async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+            if address in self.refuse:
+                return '550 Mailbox unavailable'
+            envelope.rcpt_tos.append(address)
+            return '250 OK'
+
+        async def handle_DATA(self, server, session, envelope):
+            subject = message_from_bytes(envelope.content)['Subject']
+            self.received.append((tuple(envelope.rcpt_tos), subject))
+            return '250 Message accepted for delivery'
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    sink = Sink()
+    sink.port = port
+    controller = Controller(sink, hostname='127.0.0.1', port=port)
+    controller.start()
+    yield sink
+    controller.stop()
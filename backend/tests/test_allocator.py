@@ -0,0 +1,57 @@
+from collections import Counter
+from extensions import db, redis_client
+from models import ParkingLot, ParkingRecord, ParkingSpot
+from allocator import _pool_key, reconcile_lot
+import threading
+import pytest
+
+# Many users book the same lot at the same moment. However the requests
+# interleave, exactly as many bookings as there are free spots succeed, and no
+# spot is ever given to two of them.
+
+BOOKERS = 24
+SPOTS = 8
+
+
+def _book_at_once(app, lot_id, users):
+    barrier = threading.Barrier(len(users))
+    statuses = []
+
+    def book(headers):
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=headers).status_code)
+
+    threads = [threading.Thread(target=book, args=(headers,)) for headers in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Counter(statuses)
+
+
+@pytest.mark.parametrize('pool', ['warm', 'lost', 'stale'])
+def test_parallel_claims_never_double_book(app, make_user, make_lot, pool):
+    users = [make_user(f'booker{i}')[1] for i in range(BOOKERS)]
+    lot_id = make_lot(SPOTS)
+    # Fill the pool, then (for the other cases) break it before the rush.
+    with app.app_context():
+        reconcile_lot(lot_id)
+        if pool == 'lost':
+            redis_client.delete(_pool_key(lot_id))
+        elif pool == 'stale':
+            # A spot taken behind the pool's back: its ID is still in the set.
+            db.session.query(ParkingSpot).filter_by(lot_id=lot_id, spot_number=1).update({'status': 'occupied'})
+            db.session.query(ParkingLot).filter_by(id=lot_id).update({'occupied_spots': 1})
+            db.session.commit()
+    free = SPOTS - 1 if pool == 'stale' else SPOTS
+
+    statuses = _book_at_once(app, lot_id, users)
+
+    assert statuses == {201: free, 404: BOOKERS - free}
+    with app.app_context():
+        booked = [spot_id for (spot_id,) in db.session.query(ParkingRecord.spot_id).filter_by(leaving_timestamp=None)]
+        assert len(booked) == len(set(booked)) == free
+        assert ParkingSpot.query.filter_by(lot_id=lot_id, status='available').count() == 0
+        assert db.session.get(ParkingLot, lot_id).occupied_spots == SPOTS
+    assert redis_client.scard(_pool_key(lot_id)) == 0
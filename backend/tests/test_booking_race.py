@@ -0,0 +1,50 @@
+from collections import Counter
+from extensions import db
+from models import ParkingLot, ParkingRecord
+import threading
+import uuid
+import pytest
+
+# One user fires about 100 identical bookings at the same moment (as
+# benchmarks/booking_race.py does): exactly one reservation may be created,
+# whether the requests share an Idempotency-Key (a client retrying) or carry
+# none, so only the unique index on active sessions stops them.
+
+REQUESTS = 100
+
+
+def _fire(app, headers, lot_id):
+    barrier = threading.Barrier(REQUESTS)
+    results = []
+
+    def book():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=headers)
+        results.append((response.status_code, response.headers.get('Idempotent-Replayed') == 'true'))
+
+    threads = [threading.Thread(target=book) for _ in range(REQUESTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Counter(results)
+
+
+@pytest.mark.parametrize('idempotency_key', [True, False], ids=['same_key', 'no_key'])
+def test_parallel_bookings_create_one_reservation(app, make_user, make_lot, idempotency_key):
+    _, headers = make_user('racer')
+    if idempotency_key:
+        headers = {**headers, 'Idempotency-Key': uuid.uuid4().hex}
+    lot_id = make_lot(REQUESTS)
+
+    results = _fire(app, headers, lot_id)
+
+    created = sum(count for (status, replayed), count in results.items() if status == 201 and not replayed)
+    assert created == 1, results
+    assert sum(results.values()) == REQUESTS
+    assert all(status in (201, 409) for status, _ in results), results
+    with app.app_context():
+        active = ParkingRecord.query.filter_by(leaving_timestamp=None).all()
+        assert len(active) == 1
+        assert db.session.get(ParkingLot, lot_id).occupied_spots == 1
@@ -0,0 +1,60 @@
+from extensions import redis_client
+from exporter import _owner_key
+import exporter
+import gzip
+import os
+import time
+import pytest
+
+
+@pytest.fixture
+def export(app, make_user, make_lot, client, tmp_path, monkeypatch):
+    """A finished export of the owner's history; returns (task_id, owner headers)."""
+    monkeypatch.setattr(exporter, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    owner_id, owner = make_user('owner')
+    lot_id = make_lot(2)
+    client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=owner)
+    with app.app_context():
+        exporter.write_history('task-1', user_id=owner_id)
+        exporter.register_export('task-1', owner_id)
+    return 'task-1', owner
+
+
+def test_owner_downloads_the_export(client, export):
+    task_id, owner = export
+    response = client.get(f'/api/user/exports/{task_id}/download', headers=owner)
+    assert response.status_code == 200
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert lines[0].startswith('Reservation ID,Lot Name')
+    assert len(lines) == 2
+
+    partial = client.get(f'/api/user/exports/{task_id}/download', headers={**owner, 'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.data == response.data[:10]
+
+
+def test_other_users_cannot_see_an_export(client, make_user, export):
+    task_id, _ = export
+    _, stranger = make_user('stranger')
+    assert client.get(f'/api/user/exports/{task_id}', headers=stranger).status_code == 404
+    assert client.get(f'/api/user/exports/{task_id}/download', headers=stranger).status_code == 404
+
+
+def test_export_expires(app, client, export):
+    task_id, owner = export
+    path = exporter.export_path(task_id)
+    assert exporter.remove_expired_exports() == 0  # Still fresh.
+
+    old = time.time() - exporter.EXPORT_TTL - 1
+    os.utime(path, (old, old))
+    assert exporter.remove_expired_exports() == 1
+    assert not os.path.exists(path)
+    assert client.get(f'/api/user/exports/{task_id}/download', headers=owner).status_code == 404
+
+
+def test_ownership_runs_out_with_the_file(client, export):
+    task_id, owner = export
+    assert 0 < redis_client.ttl(_owner_key(task_id)) <= exporter.EXPORT_TTL
+
+    redis_client.delete(_owner_key(task_id))  # As when the TTL passes.
+    assert client.get(f'/api/user/exports/{task_id}/download', headers=owner).status_code == 404
@@ -0,0 +1,135 @@
+from contextlib import contextmanager
+from sqlalchemy import event, insert
+from extensions import db
+from models import ParkingRecord, ParkingSpot
+import datetime
+import exporter
+import pytest
+
+# The history views load records, spots, lots and users in one joined SELECT
+# (see queries.py), so the number of statements must not grow with the number
+# of records shown.
+
+
+@contextmanager
+def count_statements(app):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+@pytest.fixture
+def add_sessions(app, make_lot):
+    """Adds `count` closed sessions for a user, spread over several lots."""
+    lot_ids = [make_lot(4, name=f'Lot {i}') for i in range(3)]
+
+    def add(user_id, count):
+        with app.app_context():
+            spot_ids = db.session.query(ParkingSpot.id).filter(ParkingSpot.lot_id.in_(lot_ids)).order_by(ParkingSpot.id).all()
+            start = datetime.datetime(2025, 7, 1, 8)
+            db.session.execute(insert(ParkingRecord), [
+                {
+                    'user_id': user_id,
+                    'spot_id': spot_ids[i % len(spot_ids)][0],
+                    'parking_timestamp': start + datetime.timedelta(hours=3 * i),
+                    'leaving_timestamp': start + datetime.timedelta(hours=3 * i + 1),
+                    'parking_cost': 60.0
+                }
+                for i in range(count)
+            ])
+            db.session.commit()
+    return add
+
+
+def _statements_for(app, request):
+    with count_statements(app) as statements:
+        request()
+    return len(statements)
+
+
+@pytest.mark.parametrize('url, key, role', [
+    ('/api/user/reservations', 'history', 'user'),
+    ('/api/admin/reservations', 'reservations', 'admin'),
+])
+def test_history_pages_run_a_constant_number_of_statements(app, client, make_user, add_sessions, url, key, role):
+    driver_id, headers = make_user('driver')
+    if role == 'admin':
+        _, headers = make_user('admin', role='admin')
+
+    def page(expected):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()[key]) == expected
+
+    add_sessions(driver_id, 1)
+    page(1)  # Warm-up: token checks, caches.
+    one = _statements_for(app, lambda: page(1))
+    add_sessions(driver_id, 39)
+    forty = _statements_for(app, lambda: page(40))
+    assert one == forty
+
+
+def test_csv_export_runs_a_constant_number_of_statements(app, make_user, add_sessions, tmp_path, monkeypatch):
+    monkeypatch.setattr(exporter, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    few_id, _ = make_user('few')
+    many_id, _ = make_user('many')
+    add_sessions(few_id, 1)
+    add_sessions(many_id, 40)
+    exported = {}
+
+    def export(task_id, user_id):
+        with app.app_context():
+            exported[task_id] = exporter.write_history(task_id, user_id=user_id)[1]
+
+    one = _statements_for(app, lambda: export('few', few_id))
+    forty = _statements_for(app, lambda: export('many', many_id))
+    assert exported == {'few': 1, 'many': 40}
+    assert one == forty
+
+
+# -----------------
+# Paging
+# -----------------
+def test_history_cursor_walks_every_record_once(app, client, make_user, add_sessions):
+    driver_id, headers = make_user('driver')
+    add_sessions(driver_id, 7)
+    # Records sharing a start time are split across pages by id.
+    with app.app_context():
+        spot_id = db.session.query(ParkingSpot.id).first()[0]
+        same_time = datetime.datetime(2025, 7, 1, 9)
+        db.session.execute(insert(ParkingRecord), [
+            {'user_id': driver_id, 'spot_id': spot_id, 'parking_timestamp': same_time, 'leaving_timestamp': same_time}
+            for _ in range(4)
+        ])
+        db.session.commit()
+
+    seen, after = [], None
+    while True:
+        response = client.get('/api/user/reservations', headers=headers, query_string={'limit': 3, **({'after': after} if after else {})})
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['history']) <= 3
+        seen += [(row['parking_time'], row['reservation_id']) for row in page['history']]
+        after = page['next_cursor']
+        if not after:
+            break
+
+    assert len(seen) == len(set(seen)) == 11
+    assert seen == sorted(seen, reverse=True)
+
+
+@pytest.mark.parametrize('params', [{'limit': 0}, {'limit': -5}, {'after': 'not-a-cursor'}, {'status': 'parked'}])
+def test_history_rejects_bad_paging_parameters(client, make_user, params):
+    _, headers = make_user('driver')
+    response = client.get('/api/user/reservations', headers=headers, query_string=params)
+    assert response.status_code == 400
+    assert response.get_json()['message']
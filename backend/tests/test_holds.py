@@ -0,0 +1,85 @@
+from extensions import db, redis_client
+from models import ParkingLot, ParkingRecord, ParkingSpot, SpotHold
+from allocator import _pool_key, reconcile_lot
+from holds import EXPIRY_KEY, sweep_expired_holds
+from collections import Counter
+import datetime
+import threading
+
+
+def _lot_state(app, lot_id):
+    with app.app_context():
+        statuses = Counter(status for (status,) in db.session.query(ParkingSpot.status).filter_by(lot_id=lot_id))
+        return dict(statuses), db.session.get(ParkingLot, lot_id).occupied_spots
+
+
+def test_booking_converts_the_hold_on_the_same_spot(app, client, make_user, make_lot):
+    _, user = make_user('driver')
+    lot_id = make_lot(3)
+    held = client.post('/api/user/holds', json={'lot_id': lot_id, 'minutes': 5}, headers=user)
+    assert held.status_code == 201
+
+    booked = client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user)
+    assert booked.status_code == 201
+    assert booked.get_json()['spot_number'] == held.get_json()['spot_number']
+    assert _lot_state(app, lot_id) == ({'occupied': 1, 'available': 2}, 1)
+    with app.app_context():
+        assert SpotHold.query.count() == 0
+    assert redis_client.zcard(EXPIRY_KEY) == 0
+
+
+def test_sweep_frees_expired_holds(app, client, make_user, make_lot):
+    _, user = make_user('driver')
+    lot_id = make_lot(3)
+    assert client.post('/api/user/holds', json={'lot_id': lot_id, 'minutes': 5}, headers=user).status_code == 201
+    assert _lot_state(app, lot_id) == ({'held': 1, 'available': 2}, 1)
+
+    with app.app_context():
+        assert sweep_expired_holds() == 0  # Not due yet.
+        assert sweep_expired_holds(datetime.datetime.utcnow() + datetime.timedelta(minutes=6)) == 1
+        assert SpotHold.query.count() == 0
+    assert _lot_state(app, lot_id) == ({'available': 3}, 0)
+    assert redis_client.scard(_pool_key(lot_id)) == 3
+    assert client.get('/api/user/holds/active', headers=user).status_code == 404
+
+
+def test_converted_hold_is_not_freed_by_a_late_sweep(app, client, make_user, make_lot):
+    _, user = make_user('driver')
+    lot_id = make_lot(2)
+    client.post('/api/user/holds', json={'lot_id': lot_id, 'minutes': 1}, headers=user)
+    client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user)
+
+    with app.app_context():
+        assert sweep_expired_holds(datetime.datetime.utcnow() + datetime.timedelta(hours=1)) == 0
+    assert _lot_state(app, lot_id) == ({'occupied': 1, 'available': 1}, 1)
+
+
+def test_holds_and_bookings_racing_never_share_a_spot(app, make_user, make_lot):
+    spots, racers = 5, 12
+    users = [make_user(f'racer{i}')[1] for i in range(racers)]
+    lot_id = make_lot(spots)
+    with app.app_context():
+        reconcile_lot(lot_id)
+    barrier = threading.Barrier(racers)
+    statuses = []
+
+    def race(i, headers):
+        client = app.test_client()
+        barrier.wait()
+        url = '/api/user/holds' if i % 2 else '/api/user/reservations'
+        statuses.append(client.post(url, json={'lot_id': lot_id}, headers=headers).status_code)
+
+    threads = [threading.Thread(target=race, args=(i, headers)) for i, headers in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Counter(statuses) == {201: spots, 404: racers - spots}
+    with app.app_context():
+        taken = [spot_id for (spot_id,) in db.session.query(ParkingRecord.spot_id)]
+        taken += [spot_id for (spot_id,) in db.session.query(SpotHold.spot_id)]
+        assert len(taken) == len(set(taken)) == spots
+    statuses_by_kind, occupied = _lot_state(app, lot_id)
+    assert 'available' not in statuses_by_kind
+    assert occupied == spots
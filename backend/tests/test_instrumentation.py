@@ -0,0 +1,24 @@
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from extensions import db
+import instrumentation
+import pytest
+
+
+def _select_count():
+    counts = instrumentation.sql_duration._values.get(('SELECT',))
+    return sum(counts[:-1]) if counts else 0
+
+
+def test_failed_statements_leave_nothing_on_the_connection(app):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for _ in range(5):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM no_such_table'))
+            before = _select_count()
+            assert conn.execute(text('SELECT 1')).scalar() == 1
+
+            assert not conn.info.get('_instrument_started')
+            assert _select_count() == before + 1
+
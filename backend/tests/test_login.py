@@ -0,0 +1,83 @@
+import passwords
+import pytest
+
+
+@pytest.fixture
+def app_config():
+    return {'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:2000', 'PASSWORD_HASH_WORKERS': 1, 'PASSWORD_HASH_QUEUE': 1}
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    # Each test gets a pool sized by its own app config.
+    passwords._pool = None
+    yield
+    if passwords._pool is not None:
+        passwords._pool.shutdown(cancel_futures=True)
+        passwords._pool = None
+
+
+def _login(client, username, password, ip='10.0.0.1'):
+    return client.post('/auth/login', json={'username': username, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_failed_logins_lock_the_account(client, make_user):
+    make_user('driver')
+    for _ in range(5):
+        assert _login(client, 'driver', 'wrong').status_code == 401
+
+    # Locked, even with the right password, and even from another address.
+    locked = _login(client, 'Driver', 'test-password', ip='10.0.0.2')
+    assert locked.status_code == 429
+    assert 0 < int(locked.headers['Retry-After']) <= 15 * 60
+
+
+def test_successful_login_clears_the_failures(client, make_user):
+    make_user('driver')
+    for _ in range(4):
+        _login(client, 'driver', 'wrong')
+    assert _login(client, 'driver', 'test-password').status_code == 200
+    for _ in range(4):
+        assert _login(client, 'driver', 'wrong').status_code == 401
+
+
+def test_one_address_is_limited_across_usernames(client):
+    for i in range(30):
+        assert _login(client, f'guess{i}', 'wrong').status_code == 401
+    throttled = _login(client, 'guess30', 'wrong')
+    assert throttled.status_code == 429
+    assert 0 < int(throttled.headers['Retry-After']) <= 60
+    assert _login(client, 'guess30', 'wrong', ip='10.0.0.2').status_code == 401
+
+
+def test_login_upgrades_an_old_hash(app, client, make_user):
+    from extensions import db
+    from models import User
+    user_id, _ = make_user('driver')  # Stored as pbkdf2:sha256:1000.
+
+    assert _login(client, 'driver', 'test-password').status_code == 200
+    with app.app_context():
+        stored = db.session.get(User, user_id).password
+        assert stored.startswith('pbkdf2:sha256:2000$')
+        assert not passwords.needs_rehash(stored)
+        assert passwords.verify_password(stored, 'test-password')
+        assert not passwords.verify_password(stored, 'wrong')
+    assert _login(client, 'driver', 'test-password').status_code == 200
+
+
+def test_full_pool_answers_busy(app, client, make_user):
+    make_user('driver')
+    with app.app_context():
+        _, slots = passwords._get_pool()
+    # Take every slot (one worker plus one queued job).
+    while slots.acquire(blocking=False):
+        pass
+    try:
+        busy = _login(client, 'driver', 'test-password')
+        assert busy.status_code == 503
+        assert busy.headers['Retry-After'] == str(passwords.RETRY_AFTER)
+    finally:
+        slots.release()
+        slots.release()
+    assert _login(client, 'driver', 'test-password').status_code == 200
@@ -0,0 +1,28 @@
+import pytest
+
+LOTS = ['MG Road Plaza', 'Church Street Mall', 'Brigade Road Tower', 'MG Square']
+
+
+@pytest.fixture
+def search(client, make_user, make_lot):
+    _, headers = make_user('driver')
+    for name in LOTS:
+        make_lot(4, name=name, address='12 Main Street')
+
+    def run(q):
+        response = client.get('/api/user/lots/search', headers=headers, query_string={'q': q})
+        assert response.status_code == 200
+        return sorted(lot['prime_location_name'] for lot in response.get_json()['lots'])
+    return run
+
+
+def test_single_word_prefix(search):
+    assert search('mg') == ['MG Road Plaza', 'MG Square']
+    assert search('chur') == ['Church Street Mall']
+
+
+def test_every_word_of_a_query_must_match(search):
+    assert search('MG Road') == ['MG Road Plaza']
+    assert search('road  mg') == ['MG Road Plaza']
+    assert search('brig ro') == ['Brigade Road Tower']
+    assert search('MG Church') == []
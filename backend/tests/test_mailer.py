@@ -0,0 +1,75 @@
+from mailer import deliver, run_metrics, start_run
+import socket
+import pytest
+
+# Delivery against a real SMTP conversation (an aiosmtpd sink, see conftest.py):
+# every recipient gets exactly one message, also when some are refused or the
+# server is down and the failed ones are retried.
+
+
+@pytest.fixture
+def app_config(smtp_sink):
+    return {'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': smtp_sink.port, 'MAIL_RATE_LIMIT': 0}
+
+
+def _messages(count):
+    return [
+        {'key': i, 'recipients': [f'user{i}@example.com'], 'subject': 'Parking App Daily Reminder', 'body': f'Hi user{i}'}
+        for i in range(count)
+    ]
+
+
+def _recipients(smtp_sink):
+    return sorted(recipient for recipients, _ in smtp_sink.received for recipient in recipients)
+
+
+def _expected(count):
+    return sorted(f'user{i}@example.com' for i in range(count))
+
+
+def test_batch_is_sent_once_over_one_connection(app, smtp_sink):
+    messages = _messages(25)
+    with app.app_context():
+        run_id = start_run('daily_reminder', len(messages), 1)
+        assert deliver(run_id, messages) == []
+        metrics = run_metrics(run_id)
+
+    assert _recipients(smtp_sink) == _expected(25)
+    assert smtp_sink.connections == 1
+    assert (metrics['sent'], metrics['failed_attempts']) == (25, 0)
+
+
+def test_refused_recipients_are_retried_once(app, smtp_sink):
+    messages = _messages(10)
+    smtp_sink.refuse = {'user3@example.com', 'user7@example.com'}
+    with app.app_context():
+        run_id = start_run('daily_reminder', len(messages), 1)
+        failed = deliver(run_id, messages)
+        assert [message['key'] for message in failed] == [3, 7]
+
+        # The retry (as send_mail_batch_task would do) only carries the failures.
+        smtp_sink.refuse = set()
+        assert deliver(run_id, failed) == []
+        metrics = run_metrics(run_id)
+
+    assert _recipients(smtp_sink) == _expected(10)
+    assert (metrics['sent'], metrics['failed_attempts']) == (10, 2)
+
+
+def test_everything_is_retried_when_the_server_is_down(app, smtp_sink):
+    messages = _messages(5)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        closed_port = probe.getsockname()[1]
+
+    with app.app_context():
+        run_id = start_run('daily_reminder', len(messages), 1)
+        app.extensions['mail'].port = closed_port
+        failed = deliver(run_id, messages)
+        assert failed == messages
+        assert smtp_sink.received == []
+
+        app.extensions['mail'].port = smtp_sink.port
+        assert deliver(run_id, failed) == []
+
+    assert _recipients(smtp_sink) == _expected(5)
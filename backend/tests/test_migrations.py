@@ -0,0 +1,32 @@
+from sqlalchemy import insert, text
+from extensions import db
+from models import ParkingRecord, ParkingSpot
+from migrations import upgrade
+import pytest
+
+
+def _applied():
+    return db.session.execute(text('SELECT version FROM schema_version ORDER BY version')).scalars().all()
+
+
+def test_duplicate_active_sessions_stop_at_the_unique_index_migration(app, make_user, make_lot):
+    user_id, _ = make_user('twice')
+    lot_id = make_lot(2)
+    with app.app_context():
+        # A database from before the unique index, with the race it allowed.
+        db.session.execute(text('DROP INDEX ix_parking_record_active_user'))
+        spot_ids = db.session.scalars(db.select(ParkingSpot.id).filter_by(lot_id=lot_id)).all()
+        db.session.execute(insert(ParkingRecord), [{'user_id': user_id, 'spot_id': spot_id} for spot_id in spot_ids])
+        db.session.commit()
+
+        with pytest.raises(RuntimeError, match=rf'Users \[{user_id}\] have more than one active reservation'):
+            upgrade()
+        assert _applied() == [1, 2, 3, 4]
+
+        # Once the extra session is released, the remaining migrations apply.
+        db.session.execute(text('UPDATE parking_record SET leaving_timestamp = CURRENT_TIMESTAMP WHERE spot_id = :spot_id'), {'spot_id': spot_ids[1]})
+        db.session.commit()
+        upgrade()
+        assert _applied()[-1] >= 5
+        index_sql = db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'ix_parking_record_active_user'")).scalar()
+        assert index_sql.startswith('CREATE UNIQUE INDEX')
@@ -0,0 +1,41 @@
+from extensions import db
+from models import ParkingRecord, ParkingSpot
+
+
+def _statuses(app, lot_id):
+    with app.app_context():
+        return {number: status for number, status in db.session.query(ParkingSpot.spot_number, ParkingSpot.status).filter_by(lot_id=lot_id)}
+
+
+def test_shrinking_keeps_spots_with_history(app, client, make_user, make_lot):
+    _, admin = make_user('admin', role='admin')
+    _, user = make_user('driver')
+    lot_id = make_lot(2)
+    assert client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user).status_code == 201
+    assert client.put('/api/user/reservations/active', headers=user).status_code == 200
+    with app.app_context():
+        parked_on = db.session.get(ParkingSpot, ParkingRecord.query.one().spot_id).spot_number
+
+    assert client.put(f'/api/lots/{lot_id}', json={'number_of_spots': 0}, headers=admin).status_code == 200
+
+    # The spot with a session is retired, the unused one is gone.
+    statuses = _statuses(app, lot_id)
+    assert statuses == {parked_on: 'retired'}
+    assert len(client.get('/api/user/reservations', headers=user).get_json()['history']) == 1
+    assert len(client.get('/api/admin/reservations', headers=admin).get_json()['reservations']) == 1
+    assert client.get(f'/api/lots/{lot_id}', headers=admin).get_json()['spots'] == []
+    assert client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user).status_code == 404
+
+
+def test_growing_brings_retired_spots_back_first(app, client, make_user, make_lot):
+    _, admin = make_user('admin', role='admin')
+    _, user = make_user('driver')
+    lot_id = make_lot(1)
+    client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user)
+    client.put('/api/user/reservations/active', headers=user)
+    client.put(f'/api/lots/{lot_id}', json={'number_of_spots': 0}, headers=admin)
+
+    assert client.put(f'/api/lots/{lot_id}', json={'number_of_spots': 3}, headers=admin).status_code == 200
+
+    assert _statuses(app, lot_id) == {1: 'available', 2: 'available', 3: 'available'}
+    assert client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user).status_code == 201
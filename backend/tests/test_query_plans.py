@@ -0,0 +1,59 @@
+from sqlalchemy import text
+from extensions import db
+from models import ParkingRecord, ParkingSpot
+from queries import history_query
+import pytest
+
+# The hot queries must be served by the indexes declared in models.py (and
+# added to existing databases by migrations.py), not by full table scans.
+
+
+def query_plan(query):
+    """SQLite's EXPLAIN QUERY PLAN for an ORM query, as one string."""
+    compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+    return '\n'.join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize('build, index', [
+    # Active session, checked on every booking and release.
+    (lambda: ParkingRecord.query.filter_by(user_id=1, leaving_timestamp=None), 'ix_parking_record_active_user'),
+    # A user's history, newest first.
+    (lambda: history_query(user_id=1).order_by(ParkingRecord.parking_timestamp.desc(), ParkingRecord.id.desc()).limit(51),
+     'ix_parking_record_user_parked'),
+    # The admin history, newest first.
+    (lambda: history_query().order_by(ParkingRecord.parking_timestamp.desc(), ParkingRecord.id.desc()).limit(51),
+     'ix_parking_record_parked'),
+    # Every spot of one lot, when reconcile_lot rebuilds its pool and spot map.
+    (lambda: db.session.query(ParkingSpot.id, ParkingSpot.spot_number, ParkingSpot.status).filter_by(lot_id=1),
+     'ix_parking_spot_lot_number'),
+])
+def test_hot_queries_use_their_index(app, build, index):
+    with app.app_context():
+        plan = query_plan(build())
+    assert index in plan, plan
+
+
+INDEXES = {
+    'ix_parking_record_active_user',
+    'ix_parking_record_user_parked',
+    'ix_parking_record_parked',
+    'ix_parking_record_spot',
+    'ix_parking_record_left',
+    'ix_parking_spot_lot_status',
+    'ix_parking_spot_lot_number',
+    'ix_user_username_lower',
+}
+
+
+def test_migrations_add_the_indexes_to_an_old_database(app):
+    from migrations import upgrade
+    with app.app_context():
+        # A database created before the indexes existed.
+        for name in INDEXES:
+            db.session.execute(text(f'DROP INDEX {name}'))
+        db.session.commit()
+
+        upgrade()
+        names = set(db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    assert INDEXES <= names
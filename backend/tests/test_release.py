@@ -0,0 +1,46 @@
+from extensions import db, redis_client
+from models import ParkingLot, ParkingRecord, ParkingSpot, RevenueRollup
+from allocator import _pool_key
+import threading
+
+RELEASES = 20
+
+
+def _release_at_once(app, headers, requests):
+    barrier = threading.Barrier(requests)
+    statuses = []
+
+    def release():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(client.put('/api/user/reservations/active', headers=headers).status_code)
+
+    threads = [threading.Thread(target=release) for _ in range(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def test_concurrent_releases_close_the_session_once(app, client, make_user, make_lot):
+    _, headers = make_user('driver')
+    lot_id = make_lot(3)
+    assert client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=headers).status_code == 201
+
+    statuses = _release_at_once(app, headers, RELEASES)
+
+    assert statuses.count(200) == 1
+    assert set(statuses) <= {200, 404, 409}
+    with app.app_context():
+        assert db.session.get(ParkingLot, lot_id).occupied_spots == 0
+        assert ParkingRecord.query.filter_by(leaving_timestamp=None).count() == 0
+        assert ParkingSpot.query.filter_by(lot_id=lot_id, status='available').count() == 3
+        # The session is counted once in the revenue rollup, not once per request.
+        assert sum(row.sessions for row in RevenueRollup.query.filter_by(lot_id=lot_id)) == 1
+    assert redis_client.scard(_pool_key(lot_id)) == 3
+
+
+def test_release_without_a_session_is_not_found(client, make_user):
+    _, headers = make_user('walker')
+    assert client.put('/api/user/reservations/active', headers=headers).status_code == 404
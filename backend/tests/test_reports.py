@@ -0,0 +1,63 @@
+from extensions import redis_client
+from mailer import deliver, start_run
+from reports import SEND_LEASE, ReportCheckpoint, _lease_key, pending_reports
+import mailer
+import pytest
+
+PERIOD = '2025-07'
+
+
+@pytest.fixture
+def app_config(smtp_sink):
+    return {'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': smtp_sink.port, 'MAIL_RATE_LIMIT': 0}
+
+
+def _messages(count):
+    return [
+        {'key': i, 'recipients': [f'user{i}@example.com'], 'subject': f'Report {i}', 'body': 'Your report'}
+        for i in range(count)
+    ]
+
+
+def _recipients(smtp_sink):
+    return [recipients[0] for recipients, _ in smtp_sink.received]
+
+
+def test_crashed_batch_resumes_without_resending(app, smtp_sink, monkeypatch):
+    messages = _messages(6)
+    checkpoint = ReportCheckpoint(PERIOD)
+    build = mailer._build
+
+    def crash_on_third(message):
+        if message['key'] == 2:
+            raise RuntimeError('worker died')
+        return build(message)
+
+    with app.app_context():
+        run_id = start_run('monthly_report', len(messages), 1)
+        monkeypatch.setattr(mailer, '_build', crash_on_third)
+        with pytest.raises(RuntimeError):
+            deliver(run_id, messages, checkpoint)
+        monkeypatch.undo()
+        assert _recipients(smtp_sink) == ['user0@example.com', 'user1@example.com']
+
+        # Re-run at once: the report in flight keeps its lease, the rest go out.
+        assert 0 < redis_client.ttl(_lease_key(PERIOD, 2)) <= SEND_LEASE
+        assert deliver(run_id, messages, checkpoint) == []
+        assert sorted(_recipients(smtp_sink)) == [f'user{i}@example.com' for i in (0, 1, 3, 4, 5)]
+
+        # Once the lease has run out, the next run sends the last one.
+        redis_client.delete(_lease_key(PERIOD, 2))
+        assert deliver(run_id, messages, checkpoint) == []
+
+    assert sorted(_recipients(smtp_sink)) == [f'user{i}@example.com' for i in range(6)]
+    assert pending_reports(PERIOD, [{'user_id': i} for i in range(7)]) == [{'user_id': 6}]
+
+
+def test_repeated_run_sends_nothing_twice(app, smtp_sink):
+    messages = _messages(4)
+    with app.app_context():
+        run_id = start_run('monthly_report', len(messages), 2)
+        assert deliver(run_id, messages, ReportCheckpoint(PERIOD)) == []
+        assert deliver(run_id, messages, ReportCheckpoint(PERIOD)) == []
+    assert sorted(_recipients(smtp_sink)) == [f'user{i}@example.com' for i in range(4)]
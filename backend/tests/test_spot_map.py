@@ -0,0 +1,54 @@
+from extensions import redis_client
+from spot_map import _map_key
+import base64
+
+
+def _compact(client, headers, lot_id, **params):
+    response = client.get(f'/api/lots/{lot_id}', headers=headers, query_string={'format': 'compact', **params})
+    assert response.status_code == 200
+    return response.get_json()['spot_map']
+
+
+def test_spot_count_stops_at_the_last_spot(client, make_user, make_lot):
+    _, admin = make_user('admin', role='admin')
+    lot_id = make_lot(5)
+
+    page = _compact(client, admin, lot_id)
+    assert page['spot_count'] == 5
+    assert page['next_from'] is None
+    # Five available spots (code 1), then padding.
+    assert base64.b64decode(page['data']) == bytes([0b01010101, 0b01000000])
+
+
+def test_pages_split_on_whole_bytes(client, make_user, make_lot):
+    _, admin = make_user('admin', role='admin')
+    lot_id = make_lot(5)
+
+    first = _compact(client, admin, lot_id, limit=4)
+    assert (first['first_spot_number'], first['spot_count'], first['next_from']) == (1, 4, 5)
+    last = _compact(client, admin, lot_id, **{'from': first['next_from'], 'limit': 4})
+    assert (last['first_spot_number'], last['spot_count'], last['next_from']) == (5, 1, None)
+
+
+def test_spot_count_follows_a_shrunk_lot(client, make_user, make_lot):
+    _, admin = make_user('admin', role='admin')
+    lot_id = make_lot(20)
+    assert client.put(f'/api/lots/{lot_id}', json={'number_of_spots': 3}, headers=admin).status_code == 200
+
+    assert _compact(client, admin, lot_id)['spot_count'] == 3
+
+
+def test_lost_map_is_rebuilt_not_patched(client, make_user, make_lot):
+    _, admin = make_user('admin', role='admin')
+    _, user = make_user('driver')
+    lot_id = make_lot(8)
+    assert client.post('/api/user/reservations', json={'lot_id': lot_id}, headers=user).status_code == 201
+    _compact(client, admin, lot_id)  # Builds the map.
+
+    # Redis lost the map, then a spot changed before anyone read it.
+    redis_client.delete(_map_key(lot_id))
+    assert client.put('/api/user/reservations/active', headers=user).status_code == 200
+
+    page = _compact(client, admin, lot_id)
+    assert page['spot_count'] == 8
+    assert base64.b64decode(page['data']) == bytes([0b01010101, 0b01010101])
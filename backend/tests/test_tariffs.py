@@ -0,0 +1,65 @@
+from tariffs import Tariff, parse_schedule, to_seconds
+import datetime
+import random
+import tariffs
+import pytest
+
+SCHEDULES = {
+    'flat': None,
+    'peak': {'rates': [{'from': '07:00', 'to': '10:00', 'price': 90, 'days': [0, 1, 2, 3, 4]}]},
+    'overnight': {'rates': [{'from': '22:00', 'to': '06:00', 'price': 15}], 'grace_minutes': 10},
+    'capped': {
+        'rates': [{'from': '09:30', 'to': '18:15', 'price': 120, 'days': [5, 6]}],
+        'grace_minutes': 5,
+        'minimum_charge': 20,
+        'daily_cap': 300
+    },
+}
+
+
+def _sessions(count, seed=7):
+    """Random sessions from a few seconds up to three weeks long."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 6, 1)
+    sessions = []
+    for _ in range(count):
+        parked = start + datetime.timedelta(seconds=rng.randrange(60 * 24 * 3600))
+        length = rng.choice([rng.randrange(600), rng.randrange(12 * 3600), rng.randrange(21 * 24 * 3600)])
+        sessions.append((parked, parked + datetime.timedelta(seconds=length)))
+    return sessions
+
+
+@pytest.mark.parametrize('name', SCHEDULES)
+def test_numpy_prices_match_one_at_a_time(name):
+    pytest.importorskip('numpy')
+    schedule = SCHEDULES[name] and parse_schedule(SCHEDULES[name])
+    tariff = Tariff(60.0, schedule)
+    sessions = _sessions(2000)
+    parked, left = zip(*sessions)
+
+    batch = tariff.price_many(to_seconds(parked), to_seconds(left))
+    single = [tariff.price(start, end) for start, end in sessions]
+    assert batch.tolist() == pytest.approx(single, abs=0.011)
+
+
+def test_pure_python_fallback_matches(monkeypatch):
+    sessions = _sessions(200)
+    parked, left = zip(*sessions)
+    monkeypatch.setattr(tariffs, 'np', None)
+    tariff = Tariff(60.0, parse_schedule(SCHEDULES['capped']))
+
+    assert tariff.price_many(to_seconds(parked), to_seconds(left)) == [tariff.price(start, end) for start, end in sessions]
+
+
+def test_prices_follow_the_schedule():
+    monday = datetime.datetime(2025, 7, 7)
+    assert Tariff(60.0).price(monday, monday + datetime.timedelta(minutes=90)) == 90.0
+
+    peak = Tariff(60.0, parse_schedule(SCHEDULES['peak']))
+    # 06:00-08:00 on a Monday: one hour at 60, one at the 90 peak rate.
+    assert peak.price(monday.replace(hour=6), monday.replace(hour=8)) == 150.0
+
+    capped = Tariff(60.0, parse_schedule(SCHEDULES['capped']))
+    assert capped.price(monday, monday + datetime.timedelta(minutes=4)) == 0.0     # Grace period.
+    assert capped.price(monday, monday + datetime.timedelta(minutes=10)) == 20.0   # Minimum charge.
+    assert capped.price(monday, monday + datetime.timedelta(days=3)) == 900.0      # Three capped days.
@@ -0,0 +1,35 @@
+from extensions import db, redis_client
+from models import User
+from user_cache import _users, _version_key
+
+
+def _profile(client, headers):
+    response = client.get('/auth/profile', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['role']
+
+
+def test_a_change_made_elsewhere_reaches_this_process(app, client, make_user):
+    _users.clear()
+    user_id, headers = make_user('driver')
+    assert _profile(client, headers) == 'user'  # Now cached here.
+
+    # Another process changes the user and bumps their version; this process's
+    # cache never hears of it directly.
+    with app.app_context():
+        db.session.get(User, user_id).role = 'admin'
+        db.session.commit()
+    redis_client.incr(_version_key(user_id))
+
+    assert _profile(client, headers) == 'admin'
+
+
+def test_cached_record_is_reused_while_current(app, client, make_user):
+    _users.clear()
+    user_id, headers = make_user('driver')
+    assert _profile(client, headers) == 'user'
+
+    with app.app_context():
+        db.session.get(User, user_id).role = 'admin'
+        db.session.commit()
+    assert _profile(client, headers) == 'user'  # No version bump: still cached.
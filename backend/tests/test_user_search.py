@@ -0,0 +1,58 @@
+from extensions import db
+from user_search import backfill
+import pytest
+
+NAMES = ['Alice', 'alicia', 'malice', 'palace', 'bob', 'Calico']
+
+
+@pytest.fixture
+def search(app, client, make_user):
+    _, admin = make_user('root', role='admin')
+    for name in NAMES:
+        make_user(name)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            backfill(conn)
+
+    def run(**params):
+        response = client.get('/api/admin/users', headers=admin, query_string=params)
+        assert response.status_code == 200
+        return response.get_json()
+    return run
+
+
+def _names(page):
+    return [(user['username'], user['match']) for user in page['users']]
+
+
+def test_prefix_matches_come_before_substring_matches(search):
+    assert _names(search(username='ALI')) == [
+        ('Alice', 'prefix'), ('alicia', 'prefix'), ('Calico', 'substring'), ('malice', 'substring')
+    ]
+
+
+def test_short_terms_match_prefixes_only(search):
+    assert _names(search(username='al')) == [('Alice', 'prefix'), ('alicia', 'prefix')]
+
+
+def test_cursor_walks_both_tiers_without_gaps_or_repeats(search):
+    seen, after = [], None
+    while True:
+        page = search(username='ali', limit=1, **({'after': after} if after else {}))
+        seen += _names(page)
+        after = page['next_cursor']
+        if not after:
+            break
+    assert [name for name, _ in seen] == ['Alice', 'alicia', 'Calico', 'malice']
+
+
+def test_bad_cursor_is_rejected(client, make_user):
+    _, admin = make_user('root', role='admin')
+    response = client.get('/api/admin/users', headers=admin, query_string={'username': 'a', 'after': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+def test_new_users_show_up_despite_the_result_cache(search, client):
+    assert len(search(username='ali')['users']) == 4
+    assert client.post('/auth/register', json={'username': 'alina', 'password': 'alina-password'}).status_code == 201
+    assert ('alina', 'prefix') in _names(search(username='ali'))
@@ -0,0 +1,108 @@
+from extensions import db, redis_client
+from models import User
+from cache import TTLCache
+import time
+
+# This file keeps authorization cheap without making it unsafe.
+#
+# Access tokens carry the user's role as a claim, so `admin_required` needs no
+# database lookup. Because a claim cannot be changed once issued, every token
+# is also checked against a revocation list in Redis:
+#   * `revoked:jti:<jti>`   - one token, e.g. after logout.
+#   * `revoked:user:<id>`   - every token of a user issued before a timestamp,
+#                             e.g. after their role changed.
+# User records themselves are kept in a small per-process TTL cache. Each
+# entry remembers the user's version number (`user:version:<id>`) it was loaded
+# at; `invalidate_user` bumps that number in Redis, and the revocation check,
+# which reads it in the same MGET it already makes, drops a local entry whose
+# version is behind. A change made by one web process is therefore seen by
+# the others on their next request for that user, not after USER_CACHE_TTL.
+
+USER_CACHE_TTL = 60         # Seconds a user record stays in the in-process cache.
+REVOCATION_TTL = 24 * 3600  # Must outlive the longest-lived access token.
+
+_users = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+
+
+def _jti_key(jti):
+    return f"revoked:jti:{jti}"
+
+
+def _user_key(user_id):
+    return f"revoked:user:{user_id}"
+
+
+def _version_key(user_id):
+    return f"user:version:{user_id}"
+
+
+# -----------------
+# User Records
+# -----------------
+def get_user(user_id):
+    """Returns {'id', 'username', 'role'} for a user, or None. Cached per process."""
+    user_id = int(user_id)
+    cached = _users.get(user_id)
+    if cached is not None:
+        return cached[1]
+
+    # Read the version before the row, so a change committed in between leaves
+    # the entry behind the new version rather than looking current.
+    version = redis_client.get(_version_key(user_id))
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    record = {'id': user.id, 'username': user.username, 'role': user.role}
+    _users.set(user_id, (version, record))
+    return record
+
+
+def invalidate_user(user_id):
+    """Drops a user's cached record here, and (through the version number) in every other process."""
+    _users.delete(int(user_id))
+    pipe = redis_client.pipeline()
+    pipe.incr(_version_key(user_id))
+    pipe.expire(_version_key(user_id), REVOCATION_TTL)
+    pipe.execute()
+
+
+def _drop_if_stale(user_id, version):
+    cached = _users.get(user_id)
+    if cached is not None and cached[0] != version:
+        _users.delete(user_id)
+
+
+def set_user_role(user, role):
+    """Changes a user's role and revokes every token that still carries the old one."""
+    user.role = role
+    db.session.commit()
+    invalidate_user(user.id)
+    revoke_user_tokens(user.id)
+
+
+# -----------------
+# Revocation List
+# -----------------
+def revoke_token(jti):
+    """Revokes a single access token by its `jti` claim."""
+    redis_client.setex(_jti_key(jti), REVOCATION_TTL, 1)
+
+
+def revoke_user_tokens(user_id):
+    """Revokes every token of a user issued up to now."""
+    redis_client.setex(_user_key(user_id), REVOCATION_TTL, int(time.time()))
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """Flask-JWT-Extended blocklist callback: one Redis round trip per request."""
+    revoked_jti, revoked_before, version = redis_client.mget(
+        _jti_key(jwt_payload['jti']),
+        _user_key(jwt_payload['sub']),
+        _version_key(jwt_payload['sub'])
+    )
+    _drop_if_stale(int(jwt_payload['sub']), version)
+    if revoked_jti:
+        return True
+    # `iat` has one-second resolution, so a token issued in the same second
+    # as the revocation is treated as revoked too.
+    return revoked_before is not None and jwt_payload['iat'] <= int(revoked_before)
@@ -0,0 +1,156 @@
+from extensions import db, redis_client
+from models import User, UserGram
+from sqlalchemy import delete, func, insert, select
+import base64
+import hashlib
+import json
+
+# This file answers the admin user search (/api/admin/users?username=...).
+#
+# Results are ranked in two tiers, each in (lowercased username, id) order:
+#   0. usernames that START with the term (the exact match comes first), read
+#      from the expression index on lower(username) as a key range;
+#   1. usernames that only CONTAIN the term, found through the UserGram table.
+#      Every username is indexed by its 3-letter pieces ("alice" -> "  a",
+#      " al", "ali", "lic", "ice", "ce "), so only users having every piece of
+#      the term are checked, instead of a '%term%' scan over all users.
+# Substring matches need at least 3 letters; shorter terms match prefixes only.
+#
+# Pages are fetched with a (tier, username, id) cursor, so deep pages cost the
+# same as the first. Recent result pages are kept in Redis for a few seconds,
+# which absorbs the repeated queries of a search-as-you-type box.
+
+GRAM = 3
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+RESULT_TTL = 30             # Seconds a result page is cached.
+BACKFILL_BATCH = 5000
+
+GENERATION_KEY = 'users:search:generation'
+
+
+def _grams(text, pad=True):
+    text = text.lower()
+    if pad:
+        text = ' ' * (GRAM - 1) + text + ' '
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+# -----------------
+# Indexing
+# -----------------
+def _gram_rows(users):
+    return [{'gram': gram, 'user_id': user_id} for user_id, username in users for gram in _grams(username)]
+
+
+def index_user(user):
+    """Adds a new user's username pieces to the current transaction. The caller commits."""
+    db.session.execute(insert(UserGram), _gram_rows([(user.id, user.username)]))
+
+
+def backfill(conn):
+    """Re-indexes every existing user (used by the migrations). Returns the number of users."""
+    conn.execute(delete(UserGram))
+    count, last_id = 0, 0
+    while True:
+        users = conn.execute(
+            select(User.id, User.username).where(User.id > last_id).order_by(User.id).limit(BACKFILL_BATCH)
+        ).all()
+        if not users:
+            return count
+        conn.execute(insert(UserGram), _gram_rows(users))
+        count += len(users)
+        last_id = users[-1].id
+
+
+def invalidate_search():
+    """Call after users are added or changed, so cached result pages are dropped."""
+    redis_client.incr(GENERATION_KEY)
+
+
+# -----------------
+# Cursors
+# -----------------
+def _encode_cursor(tier, name, user_id):
+    return base64.urlsafe_b64encode(json.dumps([tier, name, user_id]).encode()).decode()
+
+
+def _decode_cursor(token):
+    try:
+        tier, name, user_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return int(tier), str(name), int(user_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+# -----------------
+# Searching
+# -----------------
+def _page(query, lower, after, limit):
+    if after:
+        name, user_id = after
+        query = query.filter((lower > name) | ((lower == name) & (User.id > user_id)))
+    return query.order_by(lower, User.id).limit(limit).all()
+
+
+def _search(term, cursor, limit):
+    lower = func.lower(User.username)
+    columns = (User.id, User.username, User.role, lower.label('name'))
+    tier, after = 0, None
+    if cursor:
+        tier, name, user_id = _decode_cursor(cursor)
+        after = (name, user_id)
+
+    rows = []
+    if tier == 0:
+        query = db.session.query(*columns)
+        if term:
+            # A key range on the lower(username) index; every name starting with the term.
+            # (On PostgreSQL the range can only use the index under the C collation,
+            # otherwise it is still correct but filtered after the index scan.)
+            query = query.filter(lower >= term, lower < term + '\uffff')
+        rows += [(0, row) for row in _page(query, lower, after, limit + 1)]
+        after = None
+
+    substring = len(term) >= GRAM
+    if substring and len(rows) <= limit:
+        pieces = _grams(term, pad=False)
+        having_all = select(UserGram.user_id)\
+            .where(UserGram.gram.in_(pieces))\
+            .group_by(UserGram.user_id)\
+            .having(func.count() == len(pieces))\
+            .subquery()
+        query = db.session.query(*columns)\
+            .join(having_all, having_all.c.user_id == User.id)\
+            .filter(lower.contains(term, autoescape=True), ~lower.startswith(term, autoescape=True))
+        rows += [(1, row) for row in _page(query, lower, after, limit + 1 - len(rows))]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_tier, last = rows[-1]
+        next_cursor = _encode_cursor(last_tier, last.name, last.id)
+
+    return {
+        'users': [
+            {'id': row.id, 'username': row.username, 'role': row.role, 'match': 'prefix' if tier == 0 else 'substring'}
+            for tier, row in rows
+        ],
+        'next_cursor': next_cursor
+    }
+
+
+def search_users(term='', cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of users matching `term`, best matches first. Raises ValueError for a bad cursor."""
+    term = (term or '').strip().lower()
+    generation = redis_client.get(GENERATION_KEY) or 0
+    digest = hashlib.sha1(f"{term}|{cursor or ''}|{limit}".encode()).hexdigest()
+    key = f"users:search:v{generation}:{digest}"
+
+    cached = redis_client.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    page = _search(term, cursor, limit)
+    redis_client.setex(key, RESULT_TTL, json.dumps(page))
+    return page